@@ -1,8 +1,9 @@
 # coding: UTF-8
 import torch
 import torch.nn as nn
-import numpy as np
+from utils import load_embedding, OOVEmbedding
 import torch.nn.functional as F
+from typing import Tuple
 
 class Config(object):
 
@@ -18,9 +19,9 @@ class Config(object):
             dataset + '/data/class.txt', encoding='utf-8').readlines()]              # 类别名单
         self.vocab_path = dataset + '/data/vocab.pkl'                                # 词表
         self.save_path = dataset + '/saved_dict/' + self.model_name + '.ckpt'        # 模型训练结果
+        self.state_path = dataset + '/saved_dict/' + self.model_name + '.state.ckpt'  # 完整训练状态, 用于 --resume
         self.log_path = dataset + '/log/' + self.model_name
-        self.embedding_pretrained = torch.tensor(
-            np.load(dataset + '/data/' + embedding)["embeddings"].astype('float32'))\
+        self.embedding_pretrained = load_embedding(dataset + '/data/' + embedding)\
             if embedding != 'random' else None                                       # 预训练词向量
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')   # 设备
 
@@ -32,6 +33,34 @@ class Config(object):
         self.batch_size = 128                                           # mini-batch大小
         self.pad_size = 14                                              # 每句话处理成的长度(短填长切)
         self.learning_rate = 1e-3                                       # 学习率
+        self.num_workers = 4                                            # 预处理进程数
+        self.vocab_capacity = 0                                         # 建词表时近似计数保留的词数上限, 用于原始词表大于内存的语料, 0则精确计数
+        self.oov_mode = 'unk'                                           # 词表外的词: unk 映射为<UNK>; hash 哈希到 oov_buckets 个桶; subword 拆成字符 n-gram 哈希到桶后取平均
+        self.oov_buckets = 10000                                        # hash/subword 模式的桶数, 嵌入表只增加这么多行
+        self.max_ngrams = 8                                             # subword 模式每个词最多的 n-gram 数, 编码后的数据集是 unk/hash 模式的这么多倍
+        self.ngram_range = (3, 5)                                       # subword 模式 n-gram 的长度范围(含边界符 < >)
+        self.cache_path = dataset + '/data/cache'                       # 编码后数据集的缓存目录, None则不缓存
+        self.stream = False                                             # 分块读取csv并写成磁盘分片, 用于大于内存的数据集
+        self.shard_size = 100000                                        # 流式读取时每个分片的行数
+        self.bucket_sampler = False                                     # 按长度分桶采样, 每个batch只pad到本batch最长的句子(不短于 min_len)
+        self.min_len = 3                                                # 按长度分桶时每个batch至少保留的长度, region 卷积需要至少3个位置
+        self.seed = 1                                                   # 随机种子
+        self.prefetch = 0                                               # 后台预取的batch数, 0则不预取
+        self.prefetch_workers = 2                                       # 预取线程数
+        self.pin_memory = False                                         # 预取的batch放入锁页内存并异步拷到GPU
+        self.eval_every = 100                                           # 每多少个batch在验证集上评估一次
+        self.eval_subsample = 0                                         # 按类别分层固定抽取的验证子集大小, 高频评估和早停只用子集, 0则用全集
+        self.full_eval_every = 1000                                     # 使用子集时每多少个batch评估一次全集(应为 eval_every 的整数倍)
+        self.async_checkpoint = True                                    # 在后台线程写 checkpoint
+        self.checkpoint_every = 1000                                    # 每多少个batch保存一次完整训练状态(模型、优化器、迭代位置、随机数状态), 0则不保存
+        self.bf16 = False                                               # 前向用 bfloat16 autocast(参数和优化器状态仍为fp32), cpu 需支持 AVX512-BF16/AMX 才有加速
+        self.num_threads = 0                                            # torch 算子内并行线程数(intra-op), 0则使用默认值
+        self.num_interop_threads = 0                                    # torch 算子间并行线程数(inter-op), 0则使用默认值
+        self.dist_backend = 'gloo'                                      # 多进程数据并行(DDP)训练的通信后端
+        self.rank = 0                                                   # 本进程的 rank, 用 torchrun 启动时在运行时赋值
+        self.world_size = 1                                             # 数据并行的进程数, 用 torchrun 启动时在运行时赋值
+        self.profile = False                                            # 统计训练各阶段耗时、吞吐和峰值内存, 写入 tensorboard 和 profile.json
+        self.profile_trace = None                                       # (开始步, 步数): 用 torch.profiler 记录这几步的 trace, 需要 profile=True
         self.embed = self.embedding_pretrained.size(1)\
             if self.embedding_pretrained is not None else 300           # 字向量维度
         self.num_filters = 250                                          # 卷积核数量(channels数)
@@ -40,54 +69,75 @@ class Config(object):
 '''Deep Pyramid Convolutional Neural Networks for Text Categorization'''
 
 
+def num_blocks(length: int) -> int:
+    """长度为 length 的特征经过多少个 _block(每个长度减半)降到1"""
+    n = 0
+    while length > 1:
+        length = length // 2
+        n += 1
+    return n
+
+
 class Model(nn.Module):
+    """区域嵌入和等长卷积都用 Conv1d([batch_size, channels, seq_len]), padding 由卷积自身完成;
+    金字塔的块数由 pad_size 预先算出, 前向没有依赖数据的循环条件, 可以 torch.jit.script / trace.
+    与原先 Conv2d + ZeroPad2d 的实现数值等价, 旧 checkpoint 的 4 维卷积权重在 load_state_dict 时自动转换.
+    金字塔最终长度为2的 pad_size(如 48)原先 squeeze 后无法接 fc, 现在多做一个块降到1.
+    """
+
     def __init__(self, config):
         super(Model, self).__init__()
+        if config.pad_size < 3:
+            raise ValueError(f'DPCNN needs pad_size >= 3, got {config.pad_size}')
         if config.embedding_pretrained is not None:
             self.embedding = nn.Embedding.from_pretrained(config.embedding_pretrained, freeze=False)
         else:
             self.embedding = nn.Embedding(config.n_vocab, config.embed, padding_idx=config.n_vocab - 1)
-        self.conv_region = nn.Conv2d(1, config.num_filters, (3, config.embed), stride=1)
-        self.conv = nn.Conv2d(config.num_filters, config.num_filters, (3, 1), stride=1)
-        self.max_pool = nn.MaxPool2d(kernel_size=(3, 1), stride=2)
-        self.padding1 = nn.ZeroPad2d((0, 0, 1, 1))  # top bottom
-        self.padding2 = nn.ZeroPad2d((0, 0, 0, 1))  # bottom
-        self.relu = nn.ReLU()
+        self.oov_embedding = OOVEmbedding(config.n_vocab, config.oov_buckets, config.embed, config.oov_mode,
+                                          config.max_ngrams, config.ngram_range) if config.oov_mode != 'unk' else None
+        self.conv_region = nn.Conv1d(config.embed, config.num_filters, 3)
+        self.conv = nn.Conv1d(config.num_filters, config.num_filters, 3, padding=1)  # 所有等长卷积共用
         self.fc = nn.Linear(config.num_filters, config.num_classes)
+        self.region_len = config.pad_size - 2
+        self.num_blocks = num_blocks(self.region_len)
+        self._register_load_state_dict_pre_hook(self._convert_conv2d)
 
-    def forward(self, x):
+    def forward(self, x: Tuple[torch.Tensor, torch.Tensor]):
         x = x[0]
-        x = self.embedding(x)
-        x = x.unsqueeze(1)  # [batch_size, 250, seq_len, 1]
-
-        # Region embedding 区域嵌入 3-gram
-        x = self.conv_region(x)  # [batch_size, 250, seq_len-3+1, 1]
+        if self.oov_embedding is None:
+            x = self.embedding(x)
+        else:
+            x = self.oov_embedding(x, self.embedding.weight, self.embedding.padding_idx)
+        x = self.conv_region(x.transpose(1, 2))  # [batch_size, 250, seq_len-3+1]
 
-        x = self.padding1(x)  # [batch_size, 250, seq_len, 1]
-        x = self.relu(x)
-        x = self.conv(x)  # [batch_size, 250, seq_len-3+1, 1]
-        x = self.padding1(x)  # [batch_size, 250, seq_len, 1]
-        x = self.relu(x)
-        x = self.conv(x)  # [batch_size, 250, seq_len-3+1, 1]
+        # 先补零再 relu 与先 relu 再补零相同, 补零交给卷积的 padding
+        x = self.conv(F.relu(x))  # [batch_size, 250, seq_len-3+1]
+        x = self.conv(F.relu(x))
 
-        while x.size()[2] > 2:
+        # 输入不是 pad_size 时(如按长度分桶的batch)按实际长度计算块数
+        n = self.num_blocks if x.size(2) == self.region_len else num_blocks(x.size(2))
+        for _ in range(n):
             x = self._block(x)
-        x = x.squeeze()  # [batch_size, num_filters(250)]
+        x = x.squeeze(2)  # [batch_size, num_filters(250)]
         x = self.fc(x)
         return x
 
     def _block(self, x):
-        x = self.padding2(x)
-        px = self.max_pool(x)
-
-        x = self.padding1(px)
-        x = F.relu(x)
-        x = self.conv(x)
+        # 池化前在末尾补一个0(不是 -inf), 长度为偶数时最后一个窗口包含这个0
+        px = F.max_pool1d(F.pad(x, (0, 1)), kernel_size=3, stride=2)
 
-        x = self.padding1(x)
-        x = F.relu(x)
-        x = self.conv(x)
+        x = self.conv(F.relu(px))
+        x = self.conv(F.relu(x))
 
         # Short Cut
-        x = x + px
-        return x
+        return x + px
+
+    @staticmethod
+    def _convert_conv2d(state_dict, prefix, *args):
+        """旧实现的 Conv2d 权重: conv_region [250, 1, 3, embed] -> [250, embed, 3], conv [250, 250, 3, 1] -> [250, 250, 3]"""
+        w = state_dict.get(prefix + 'conv_region.weight')
+        if w is not None and w.dim() == 4:
+            state_dict[prefix + 'conv_region.weight'] = w.squeeze(1).transpose(1, 2)
+        w = state_dict.get(prefix + 'conv.weight')
+        if w is not None and w.dim() == 4:
+            state_dict[prefix + 'conv.weight'] = w.squeeze(3)
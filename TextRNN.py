@@ -1,7 +1,7 @@
 # coding: UTF-8
 import torch
 import torch.nn as nn
-import numpy as np
+from utils import load_embedding, OOVEmbedding
 
 
 
@@ -19,9 +19,9 @@ class Config(object):
             dataset + '/class.txt', encoding='utf-8').readlines()]              # 类别名单
         self.vocab_path = dataset + '/vocab.pkl'                                # 词表
         self.save_path = dataset + '/saved_dict/' + self.model_name + '.ckpt'        # 模型训练结果
+        self.state_path = dataset + '/saved_dict/' + self.model_name + '.state.ckpt'  # 完整训练状态, 用于 --resume
         self.log_path = dataset + '/log/' + self.model_name
-        self.embedding_pretrained = torch.tensor(
-            np.load(dataset + embedding)["embeddings"].astype('float32'))\
+        self.embedding_pretrained = load_embedding(dataset + embedding)\
             if embedding != 'random' else None                                       # 预训练词向量
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')   # 设备
 
@@ -33,10 +33,39 @@ class Config(object):
         self.batch_size = 256                                           # mini-batch大小
         self.pad_size = 160                                             # 每句话处理成的长度(短填长切)
         self.learning_rate = 1e-3                                       # 学习率
+        self.num_workers = 4                                            # 预处理进程数
+        self.vocab_capacity = 0                                         # 建词表时近似计数保留的词数上限, 用于原始词表大于内存的语料, 0则精确计数
+        self.oov_mode = 'unk'                                           # 词表外的词: unk 映射为<UNK>; hash 哈希到 oov_buckets 个桶; subword 拆成字符 n-gram 哈希到桶后取平均
+        self.oov_buckets = 10000                                        # hash/subword 模式的桶数, 嵌入表只增加这么多行
+        self.max_ngrams = 8                                             # subword 模式每个词最多的 n-gram 数, 编码后的数据集是 unk/hash 模式的这么多倍
+        self.ngram_range = (3, 5)                                       # subword 模式 n-gram 的长度范围(含边界符 < >)
+        self.cache_path = dataset + '/cache'                            # 编码后数据集的缓存目录, None则不缓存
+        self.stream = False                                             # 分块读取csv并写成磁盘分片, 用于大于内存的数据集
+        self.shard_size = 100000                                        # 流式读取时每个分片的行数
+        self.bucket_sampler = False                                     # 按长度分桶采样, 每个batch只pad到本batch最长的句子
+        self.min_len = 1                                                # 按长度分桶时每个batch至少保留的长度
+        self.seed = 1                                                   # 随机种子
+        self.prefetch = 0                                               # 后台预取的batch数, 0则不预取
+        self.prefetch_workers = 2                                       # 预取线程数
+        self.pin_memory = False                                         # 预取的batch放入锁页内存并异步拷到GPU
+        self.eval_every = 100                                           # 每多少个batch在验证集上评估一次
+        self.eval_subsample = 0                                         # 按类别分层固定抽取的验证子集大小, 高频评估和早停只用子集, 0则用全集
+        self.full_eval_every = 1000                                     # 使用子集时每多少个batch评估一次全集(应为 eval_every 的整数倍)
+        self.async_checkpoint = True                                    # 在后台线程写 checkpoint
+        self.checkpoint_every = 1000                                    # 每多少个batch保存一次完整训练状态(模型、优化器、迭代位置、随机数状态), 0则不保存
+        self.bf16 = False                                               # 前向用 bfloat16 autocast(参数和优化器状态仍为fp32), cpu 需支持 AVX512-BF16/AMX 才有加速
+        self.num_threads = 0                                            # torch 算子内并行线程数(intra-op), 0则使用默认值
+        self.num_interop_threads = 0                                    # torch 算子间并行线程数(inter-op), 0则使用默认值
+        self.dist_backend = 'gloo'                                      # 多进程数据并行(DDP)训练的通信后端
+        self.rank = 0                                                   # 本进程的 rank, 用 torchrun 启动时在运行时赋值
+        self.world_size = 1                                             # 数据并行的进程数, 用 torchrun 启动时在运行时赋值
+        self.profile = False                                            # 统计训练各阶段耗时、吞吐和峰值内存, 写入 tensorboard 和 profile.json
+        self.profile_trace = None                                       # (开始步, 步数): 用 torch.profiler 记录这几步的 trace, 需要 profile=True
         self.embed = self.embedding_pretrained.size(1)\
             if self.embedding_pretrained is not None else 300           # 字向量维度, 若使用了预训练词向量，则维度统一
         self.hidden_size = 256                                          # lstm隐藏层
         self.num_layers = 3                                             # lstm层数
+        self.packed = False                                             # 用 pack_padded_sequence 跳过 <PAD>, 取最终 hidden state 分类
 
 
 
@@ -61,30 +90,31 @@ class Model(nn.Module):
             self.embedding = nn.Embedding.from_pretrained(config.embedding_pretrained, freeze=False)
         else:
             self.embedding = nn.Embedding(config.n_vocab, config.embed, padding_idx=config.n_vocab - 1)
+        self.oov_embedding = OOVEmbedding(config.n_vocab, config.oov_buckets, config.embed, config.oov_mode,
+                                          config.max_ngrams, config.ngram_range) if config.oov_mode != 'unk' else None
         self.lstm = nn.LSTM(config.embed, config.hidden_size, config.num_layers,
                             bidirectional=True, batch_first=True, dropout=config.dropout)
         self.fc = nn.Linear(config.hidden_size * 2, config.num_classes)
+        self.packed = config.packed
 
     def forward(self, x):
-        x, _ = x
-        out = self.embedding(x)  # [batch_size, seq_len, embeding] = [128, 32, 300]
+        x, seq_len = x
+        # [batch_size, seq_len, embeding] = [128, 32, 300]
+        if self.oov_embedding is None:
+            out = self.embedding(x)
+        else:
+            out = self.oov_embedding(x, self.embedding.weight, self.embedding.padding_idx)
+        if self.packed:
+            return self._forward_packed(out, seq_len)
         out, _ = self.lstm(out) # [batch_size, seq_len, hidden_size * 2]=[128, 32, 256]
         out = self.fc(out[:, -1, :]) # [batch_size, hidden_size * 2] = [128, 256]
         return out
 
-    '''变长RNN，效果差不多，甚至还低了点...'''
-    # def forward(self, x):
-    #     x, seq_len = x
-    #     out = self.embedding(x)
-    #     _, idx_sort = torch.sort(seq_len, dim=0, descending=True)  # 长度从长到短排序（index）
-    #     _, idx_unsort = torch.sort(idx_sort)  # 排序后，原序列的 index
-    #     out = torch.index_select(out, 0, idx_sort)
-    #     seq_len = list(seq_len[idx_sort])
-    #     out = nn.utils.rnn.pack_padded_sequence(out, seq_len, batch_first=True)
-    #     # [batche_size, seq_len, num_directions * hidden_size]
-    #     out, (hn, _) = self.lstm(out)
-    #     out = torch.cat((hn[2], hn[3]), -1)
-    #     # out, _ = nn.utils.rnn.pad_packed_sequence(out, batch_first=True)
-    #     out = out.index_select(0, idx_unsort)
-    #     out = self.fc(out)
-    #     return out
+    def _forward_packed(self, out, seq_len):
+        """变长RNN: 只在真实长度内计算, 取最后一层正反两个方向的最终 hidden state"""
+        # pack_padded_sequence 要求长度在 cpu 上且大于0, 空文本按长度1处理
+        lengths = seq_len.clamp(min=1).cpu()
+        out = nn.utils.rnn.pack_padded_sequence(out, lengths, batch_first=True, enforce_sorted=False)
+        _, (hn, _) = self.lstm(out)  # hn: [num_layers * 2, batch_size, hidden_size], 已恢复原顺序
+        out = torch.cat((hn[-2], hn[-1]), -1)  # [batch_size, hidden_size * 2]
+        return self.fc(out)
@@ -0,0 +1,84 @@
+# coding: UTF-8
+"""单机多进程数据并行(DDP, gloo)训练的扩展效率
+
+每个进程数用 torchrun 单独启动, 每个进程的 batch 大小固定(weak scaling), 线程数为 cpu 核数 / 进程数。
+扩展效率 = N 进程的吞吐 / (N x 1 进程的吞吐)。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from types import SimpleNamespace
+from importlib import import_module
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+import torch
+import torch.nn.functional as F
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel
+from common import MODEL_CONFIGS, make_data
+
+parser = argparse.ArgumentParser(description='DDP (gloo) scaling benchmark')
+parser.add_argument('--model', default='DPCNN', type=str)
+parser.add_argument('--procs', default=[1, 2, 4, 8], type=int, nargs='+', help='进程数列表')
+parser.add_argument('--steps', default=50, type=int, help='每个进程计时的训练 batch 数')
+parser.add_argument('--batch_size', default=128, type=int, help='每个进程的 batch 大小')
+parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+
+
+def run(args):
+    dist.init_process_group('gloo')
+    rank, world_size = dist.get_rank(), dist.get_world_size()
+    torch.set_num_threads(max(os.cpu_count() // world_size, 1))
+    from utils import DatasetIterater
+    from train_eval import init_network
+
+    config = SimpleNamespace(embedding_pretrained=None, n_vocab=10002, num_classes=4, **MODEL_CONFIGS[args.model])
+    rng = np.random.RandomState(1)
+    torch.manual_seed(1)
+    n = args.batch_size * (args.steps + 1) * world_size
+    train_data = make_data(n, config.pad_size, config.n_vocab, config.num_classes, rng)
+    train_iter = DatasetIterater(train_data, args.batch_size, 'cpu', shuffle=True, rank=rank, world_size=world_size,
+                                 even=True)
+    model = import_module(args.model).Model(config)
+    init_network(model)
+    for param in model.embedding.parameters():
+        param.requires_grad = False
+    net = DistributedDataParallel(model)
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
+    for step, (trains, labels) in enumerate(train_iter):
+        if step == 1:
+            dist.barrier()
+            start = time.perf_counter()  # 第一步作为预热不计时
+        outputs = net(trains)
+        model.zero_grad()
+        F.cross_entropy(outputs, labels).backward()
+        optimizer.step()
+    dist.barrier()
+    elapsed = time.perf_counter() - start
+    if rank == 0:
+        print(json.dumps({'procs': world_size, 'threads_per_proc': torch.get_num_threads(),
+                          'samples_per_sec': args.steps * args.batch_size * world_size / elapsed}))
+    dist.destroy_process_group()
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if args.worker:
+        run(args)
+        sys.exit()
+
+    print(f"{args.model}, 每进程 batch {args.batch_size}, cpu 核数 {os.cpu_count()}")
+    base = None
+    for procs in args.procs:
+        out = subprocess.run([sys.executable, '-m', 'torch.distributed.run', '--standalone', '--nproc_per_node',
+                              str(procs), __file__, '--worker', '--model', args.model, '--steps', str(args.steps),
+                              '--batch_size', str(args.batch_size)], check=True, capture_output=True, text=True)
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        base = base or r['samples_per_sec']
+        speedup = r['samples_per_sec'] / base
+        print(f"{procs:>2} 进程 x {r['threads_per_proc']:>2} 线程: {r['samples_per_sec']:8.1f} samples/sec, "
+              f"加速 {speedup:.2f}x, 扩展效率 {speedup / procs:.0%}")
@@ -0,0 +1,128 @@
+# coding: UTF-8
+"""DPCNN 原先的 Conv2d + ZeroPad2d + while 循环实现(Legacy)与现在的 Conv1d 实现的对比
+
+每个 pad_size 下加载同一份权重, 检查两者输出一致, 然后比较
+  前向(推理, no_grad)和前向+反向的耗时(fp32 与 bf16 autocast),
+  一次前向为反向保存的激活大小(MB, 由 saved_tensors_hooks 统计, 与设备无关).
+Legacy 不支持金字塔最终长度为2的 pad_size(如 48), 这些 pad_size 只测新实现.
+"""
+import os
+import sys
+import argparse
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from common import MODEL_CONFIGS, timeit
+from DPCNN import Model
+
+parser = argparse.ArgumentParser(description='DPCNN implementation benchmark')
+parser.add_argument('--pad_sizes', default=[14, 64, 256], type=int, nargs='+')
+parser.add_argument('--batch_size', default=128, type=int)
+parser.add_argument('--precision', default=['fp32', 'bf16'], nargs='+')
+parser.add_argument('--repeats', default=5, type=int)
+parser.add_argument('--threads', default=None, type=int)
+
+
+class Legacy(nn.Module):
+    """原先的实现, 只保留 oov_mode='unk'"""
+
+    def __init__(self, config):
+        super(Legacy, self).__init__()
+        self.embedding = nn.Embedding(config.n_vocab, config.embed, padding_idx=config.n_vocab - 1)
+        self.conv_region = nn.Conv2d(1, config.num_filters, (3, config.embed), stride=1)
+        self.conv = nn.Conv2d(config.num_filters, config.num_filters, (3, 1), stride=1)
+        self.max_pool = nn.MaxPool2d(kernel_size=(3, 1), stride=2)
+        self.padding1 = nn.ZeroPad2d((0, 0, 1, 1))
+        self.padding2 = nn.ZeroPad2d((0, 0, 0, 1))
+        self.relu = nn.ReLU()
+        self.fc = nn.Linear(config.num_filters, config.num_classes)
+
+    def forward(self, x):
+        x = self.embedding(x[0]).unsqueeze(1)
+        x = self.conv_region(x)
+        x = self.conv(self.relu(self.padding1(x)))
+        x = self.conv(self.relu(self.padding1(x)))
+        while x.size()[2] > 2:
+            x = self._block(x)
+        return self.fc(x.squeeze())
+
+    def _block(self, x):
+        px = self.max_pool(self.padding2(x))
+        x = self.conv(F.relu(self.padding1(px)))
+        x = self.conv(F.relu(self.padding1(x)))
+        return x + px
+
+
+def saved_mb(model, x, bf16):
+    """一次前向中 autograd 为反向保存的张量大小"""
+    total = [0]
+    seen = set()
+
+    def pack(t):
+        key = (t.data_ptr(), t.shape, t.dtype)
+        if key not in seen:
+            seen.add(key)
+            total[0] += t.numel() * t.element_size()
+        return t
+
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda t: t):
+        with torch.autocast('cpu', dtype=torch.bfloat16, enabled=bf16):
+            model(x)
+    return total[0] / 2 ** 20
+
+
+def bench(model, x, y, bf16, repeats):
+    def forward():
+        with torch.no_grad(), torch.autocast('cpu', dtype=torch.bfloat16, enabled=bf16):
+            model(x)
+
+    def step():
+        with torch.autocast('cpu', dtype=torch.bfloat16, enabled=bf16):
+            out = model(x)
+        model.zero_grad()
+        F.cross_entropy(out.float(), y).backward()
+
+    model.train()
+    return {'forward': timeit(forward, repeats, items=len(y)), 'train': timeit(step, repeats, items=len(y)),
+            'saved_mb': saved_mb(model, x, bf16)}
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    print(f"torch {torch.__version__}, {torch.get_num_threads()} 线程, batch {args.batch_size}")
+    for pad_size in args.pad_sizes:
+        config = SimpleNamespace(embedding_pretrained=None, n_vocab=10002, num_classes=4,
+                                 **{**MODEL_CONFIGS['DPCNN'], 'pad_size': pad_size})
+        torch.manual_seed(1)
+        new = Model(config)
+        x = (torch.randint(0, config.n_vocab, (args.batch_size, pad_size)), torch.full((args.batch_size,), pad_size))
+        y = torch.randint(0, config.num_classes, (args.batch_size,))
+        old = Legacy(config)
+        new.load_state_dict(old.state_dict())  # 旧 checkpoint 的权重直接加载
+        old.eval(), new.eval()
+        try:
+            with torch.no_grad():
+                diff = (old(x) - new(x)).abs().max().item()
+        except RuntimeError:
+            old = None  # 金字塔最终长度为2, 旧实现无法运行
+        print(f"pad_size {pad_size}, {new.num_blocks} 个块" +
+              (f", 输出最大差 {diff:.1e}" if old is not None else ", Legacy 无法运行"))
+        for precision in args.precision:
+            bf16 = precision == 'bf16'
+            rows = [('conv1d', bench(new, x, y, bf16, args.repeats))]
+            if old is not None:
+                rows.insert(0, ('legacy', bench(old, x, y, bf16, args.repeats)))
+            for name, r in rows:
+                speedup = ''
+                if old is not None and name == 'conv1d':
+                    base = rows[0][1]
+                    speedup = (f"  (前向 {base['forward']['median_sec'] / r['forward']['median_sec']:.2f}x, "
+                               f"训练 {base['train']['median_sec'] / r['train']['median_sec']:.2f}x)")
+                print(f"  {precision:<5} {name:<7} 前向 {r['forward']['items_per_sec']:8.0f} samples/sec, "
+                      f"前向+反向 {r['train']['items_per_sec']:7.0f} samples/sec, "
+                      f"反向保存的激活 {r['saved_mb']:7.1f} MB{speedup}")
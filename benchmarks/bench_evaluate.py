@@ -0,0 +1,68 @@
+# coding: UTF-8
+"""对比旧 evaluate() 的指标计算(每个batch loss.item() + np.append + sklearn)与 MetricsAccumulator 的耗时
+
+模型前向用预先生成的 logits 代替, 只测量指标累加本身的开销。
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+import torch
+import torch.nn.functional as F
+from sklearn import metrics
+from train_eval import MetricsAccumulator, classification_report
+
+parser = argparse.ArgumentParser(description='evaluate() metrics benchmark')
+parser.add_argument('--rows', default=500000, type=int, help='合成验证集条数')
+parser.add_argument('--batch_size', default=128, type=int)
+parser.add_argument('--num_classes', default=4, type=int)
+parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu', type=str)
+
+
+def legacy(batches, class_list):
+    loss_total = 0
+    predict_all = np.array([], dtype=int)
+    labels_all = np.array([], dtype=int)
+    for outputs, labels in batches:
+        loss = F.cross_entropy(outputs, labels)
+        loss_total += loss.item()
+        labels = labels.data.cpu().numpy()
+        predic = torch.max(outputs.data, 1)[1].cpu().numpy()
+        labels_all = np.append(labels_all, labels)
+        predict_all = np.append(predict_all, predic)
+    acc = metrics.accuracy_score(labels_all, predict_all)
+    report = metrics.classification_report(labels_all, predict_all, target_names=class_list, digits=4)
+    return acc, loss_total / len(batches), report
+
+
+def accumulated(batches, class_list, device):
+    meter = MetricsAccumulator(len(class_list), device)
+    for outputs, labels in batches:
+        meter.update(outputs, labels, F.cross_entropy(outputs, labels))
+    acc, loss, confusion = meter.compute()
+    return acc, loss, classification_report(confusion, class_list, digits=4)
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    torch.manual_seed(1)
+    class_list = [f'class{i}' for i in range(args.num_classes)]
+    labels = torch.randint(0, args.num_classes, (args.rows,), device=args.device)
+    logits = torch.randn(args.rows, args.num_classes, device=args.device)
+    logits[torch.arange(args.rows), labels] += 1
+    batches = list(zip(logits.split(args.batch_size), labels.split(args.batch_size)))
+
+    start = time.perf_counter()
+    old = legacy(batches, class_list)
+    old_time = time.perf_counter() - start
+    start = time.perf_counter()
+    new = accumulated(batches, class_list, args.device)
+    new_time = time.perf_counter() - start
+
+    assert abs(old[0] - new[0]) < 1e-12 and abs(old[1] - new[1]) < 1e-6 and old[2] == new[2]
+    print(f"{args.rows:,} 条, {len(batches):,} 个batch ({args.device})")
+    print(f"legacy      {old_time:7.2f}s")
+    print(f"accumulator {new_time:7.2f}s ({old_time / new_time:.1f}x)")
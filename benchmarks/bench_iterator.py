@@ -0,0 +1,76 @@
+# coding: UTF-8
+"""对比旧的 list-of-tuples 数据集与 TextDataset 的峰值内存(RSS)和 batches/sec
+
+每种模式在单独的子进程里运行，峰值 RSS 互不影响。
+"""
+import os
+import sys
+import time
+import argparse
+import resource
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+parser = argparse.ArgumentParser(description='DatasetIterater benchmark')
+parser.add_argument('--rows', default=1000000, type=int, help='合成数据集条数')
+parser.add_argument('--pad_size', default=160, type=int)
+parser.add_argument('--batch_size', default=256, type=int)
+parser.add_argument('--mode', default=None, type=str, help='list 或 array, 不指定则两者都跑')
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class ListIterater(object):
+    """原 DatasetIterater 的逐元素构建方式"""
+
+    def __init__(self, batches, batch_size):
+        self.batches = batches
+        self.batch_size = batch_size
+
+    def __iter__(self):
+        import torch
+        for i in range(0, len(self.batches), self.batch_size):
+            datas = self.batches[i: i + self.batch_size]
+            x = torch.LongTensor([_[0] for _ in datas])
+            y = torch.LongTensor([_[1] for _ in datas])
+            seq_len = torch.LongTensor([_[2] for _ in datas])
+            yield (x, seq_len), y
+
+
+def run(mode, rows, pad_size, batch_size):
+    import numpy as np
+    from preprocess import TextDataset
+    from utils import DatasetIterater
+
+    rng = np.random.RandomState(1)
+    seq_len = np.minimum(rng.geometric(1 / 30, rows), pad_size).astype(np.int64)
+    tokens = rng.randint(0, 10000, (rows, pad_size), dtype=np.int32)
+    tokens[np.arange(pad_size) >= seq_len[:, None]] = 10001
+    labels = rng.randint(0, 4, rows).astype(np.int64)
+
+    start = time.perf_counter()
+    if mode == 'list':
+        data = list(zip(tokens.tolist(), labels.tolist(), seq_len.tolist()))
+        del tokens, labels, seq_len
+        data_iter = ListIterater(data, batch_size)
+    else:
+        data_iter = DatasetIterater(TextDataset(tokens, labels, seq_len), batch_size, 'cpu')
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    n = sum(1 for _ in data_iter)
+    speed = n / (time.perf_counter() - start)
+    print(f"{mode}: 构建 {build:.2f}s, {speed:,.0f} batches/sec, 峰值RSS {peak_rss_mb():,.0f} MB")
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if args.mode:
+        run(args.mode, args.rows, args.pad_size, args.batch_size)
+    else:
+        for mode in ('list', 'array'):
+            subprocess.run([sys.executable, __file__, '--mode', mode, '--rows', str(args.rows),
+                            '--pad_size', str(args.pad_size), '--batch_size', str(args.batch_size)], check=True)
@@ -0,0 +1,62 @@
+# coding: UTF-8
+"""对比 TextNormalizer 与原 clean_contractions + clean_special_chars 的吞吐(docs/sec)"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tool import (TextNormalizer, clean_contractions, clean_special_chars,
+                  CONTRACTION_MAPPING, PUNCT, PUNCT_MAPPING)
+
+parser = argparse.ArgumentParser(description='Normalizer benchmark')
+parser.add_argument('--csv', default=None, type=str, help='用真实数据集的 Text 列做基准, 不指定则生成合成文本')
+parser.add_argument('--docs', default=50000, type=int, help='合成文本条数')
+parser.add_argument('--words', default=40, type=int, help='合成文本平均词数')
+parser.add_argument('--seed', default=1, type=int)
+
+
+def synthetic_docs(n_docs, n_words, seed):
+    rng = random.Random(seed)
+    words = ('the of and to in a is that for it as was with be by on not he this are or his from at '
+             'which but have an they you were her she there one all we their said new').split()
+    noisy = ["don't", "it's", "they’re", "U.S.", "(AP)", "“quote”", "—", "co-op", "$5", "10%", "…", "e-mail"]
+    docs = []
+    for _ in range(n_docs):
+        length = max(1, int(rng.expovariate(1.0 / n_words)))
+        docs.append(' '.join(rng.choice(noisy) if rng.random() < 0.1 else rng.choice(words) for _ in range(length)))
+    return docs
+
+
+def original(text):
+    text = text.lower()
+    text = clean_contractions(text, CONTRACTION_MAPPING)
+    return clean_special_chars(text, PUNCT, PUNCT_MAPPING)
+
+
+def bench(fn, docs):
+    start = time.perf_counter()
+    out = [fn(d) for d in docs]
+    return out, len(docs) / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if args.csv:
+        import pandas as pd
+        docs = pd.read_csv(args.csv, encoding='utf-8', sep=',')['Text'].fillna('').tolist()
+    else:
+        docs = synthetic_docs(args.docs, args.words, args.seed)
+
+    normalizer = TextNormalizer()
+    expected, old_speed = bench(original, docs)
+    result, new_speed = bench(normalizer, docs)
+    mismatch = sum(a != b for a, b in zip(expected, result))
+
+    print(f"文本数========{len(docs)}")
+    print(f"原实现========{old_speed:,.0f} docs/sec")
+    print(f"TextNormalizer========{new_speed:,.0f} docs/sec ({new_speed / old_speed:.2f}x)")
+    print(f"输出不一致========{mismatch}")
+    if mismatch:
+        sys.exit(1)
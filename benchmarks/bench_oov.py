@@ -0,0 +1,95 @@
+# coding: UTF-8
+"""对比词表外的词的三种编码方式(unk / hash / subword)的覆盖率、内存和吞吐
+
+在 synthetic.py 生成的数据集上按 MAX_VOCAB_SIZE 建词表, 每种方式分别:
+  编码 train.csv 的速度(docs/sec), 编码后数据集的大小, 映射为 <UNK> 的词的比例,
+  嵌入表大小(与把所有出现过的词都放进词表相比), 训练吞吐(samples/sec)和训练 --epochs 轮后的验证集准确率。
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+from types import SimpleNamespace
+from importlib import import_module
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+import torch
+import torch.nn.functional as F
+import synthetic
+from common import MODEL_CONFIGS
+
+parser = argparse.ArgumentParser(description='out-of-vocabulary encoding benchmark', parents=[synthetic.parser],
+                                 conflict_handler='resolve')
+parser.add_argument('--out', default=None, type=str, help='合成数据集目录, 默认为临时目录')
+parser.add_argument('--rows', default=20000, type=int)
+parser.add_argument('--model', default='DPCNN', type=str)
+parser.add_argument('--pad_size', default=32, type=int)
+parser.add_argument('--modes', default=['unk', 'hash', 'subword'], nargs='+')
+parser.add_argument('--oov_buckets', default=10000, type=int)
+parser.add_argument('--max_ngrams', default=8, type=int)
+parser.add_argument('--epochs', default=1, type=int)
+parser.add_argument('--batch_size', default=128, type=int)
+
+
+def run(mode, vocab, paths, args):
+    from utils import UNK, PAD, DatasetIterater, make_oov
+    from preprocess import encode_csv, TextDataset
+    from train_eval import evaluate, init_network
+
+    config = SimpleNamespace(embedding_pretrained=None, n_vocab=len(vocab), num_classes=args.num_classes,
+                             device=torch.device('cpu'), bf16=False, **{**MODEL_CONFIGS[args.model],
+                             'pad_size': args.pad_size, 'oov_mode': mode}, oov_buckets=args.oov_buckets,
+                             max_ngrams=args.max_ngrams, ngram_range=(3, 5))
+    oov = make_oov(config)
+    start = time.perf_counter()
+    tokens, labels, seq_len, count, _ = encode_csv(paths['train'], vocab, config.pad_size, vocab[UNK], vocab[PAD],
+                                                   oov=oov)
+    encode_speed = len(labels) / (time.perf_counter() - start)
+    dev = encode_csv(paths['val'], vocab, config.pad_size, vocab[UNK], vocab[PAD], oov=oov)
+    words = tokens if tokens.ndim == 2 else tokens[..., 0]
+    real = np.arange(config.pad_size) < seq_len[:, None]
+    unk_rate = float((words[real] == vocab[UNK]).mean())
+
+    torch.manual_seed(1)
+    model = import_module(args.model).Model(config)
+    init_network(model)
+    embed_params = sum(p.numel() for name, p in model.named_parameters() if 'embedding' in name)
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
+    train_iter = DatasetIterater(TextDataset(tokens, labels, seq_len), args.batch_size, 'cpu', shuffle=True)
+    model.train()
+    start = time.perf_counter()
+    for _ in range(args.epochs):
+        for trains, y in train_iter:
+            outputs = model(trains)
+            model.zero_grad()
+            F.cross_entropy(outputs, y).backward()
+            optimizer.step()
+    train_speed = args.epochs * len(labels) / (time.perf_counter() - start)
+    dev_acc, _ = evaluate(config, model, DatasetIterater(TextDataset(*dev[:3]), args.batch_size, 'cpu'))
+    return {'mode': mode, 'encode_docs_per_sec': encode_speed, 'dataset_mb': tokens.nbytes / 2 ** 20,
+            'unk_rate': unk_rate, 'embedding_mb': embed_params * 4 / 2 ** 20, 'train_samples_per_sec': train_speed,
+            'dev_acc': float(dev_acc)}
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    from utils import build_vocab, MAX_VOCAB_SIZE
+    from vocabulary import count_words
+    from preprocess import normalizer
+    import pandas as pd
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = synthetic.generate(SimpleNamespace(**{**vars(args), 'out': args.out or tmp}))
+        vocab = build_vocab(paths['train'], MAX_VOCAB_SIZE, 1)
+        texts = pd.read_csv(paths['train'], encoding='utf-8')['Text'].fillna('').tolist()
+        n_words = len(count_words(texts, normalizer.tokenize))
+        embed = MODEL_CONFIGS[args.model]['embed']
+        print(f"{args.model}, 词表 {len(vocab):,} 词, train 中出现 {n_words:,} 个不同的词; "
+              f"全部放进词表的嵌入表为 {n_words * embed * 4 / 2 ** 20:.1f} MB")
+        for mode in args.modes:
+            r = run(mode, vocab, paths, args)
+            print(f"{r['mode']:<8} UNK {r['unk_rate']:6.2%}, 嵌入表 {r['embedding_mb']:6.1f} MB, "
+                  f"数据集 {r['dataset_mb']:6.1f} MB, 编码 {r['encode_docs_per_sec']:8.0f} docs/sec, "
+                  f"训练 {r['train_samples_per_sec']:6.0f} samples/sec, dev acc {r['dev_acc']:.2%}")
@@ -0,0 +1,86 @@
+# coding: UTF-8
+"""TextRNN / DPCNN 在不同线程数和精度(fp32 / bf16 autocast)下的训练吞吐(samples/sec)和验证集准确率
+
+每种设置在单独的子进程里运行(inter-op 线程数每个进程只能设置一次)。
+数据为合成的可学习数据: 每个类别有10个标志词, 文本中约1/5的词换成本类别的标志词, 其余为随机词。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from types import SimpleNamespace
+from importlib import import_module
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+import torch
+import torch.nn.functional as F
+from common import MODEL_CONFIGS, make_data
+
+parser = argparse.ArgumentParser(description='precision / thread count training benchmark')
+parser.add_argument('--models', default=['TextRNN', 'DPCNN'], nargs='+')
+parser.add_argument('--threads', default=None, type=int, nargs='+', help='线程数列表, 默认 1 和全部核数')
+parser.add_argument('--precision', default=['fp32', 'bf16'], nargs='+')
+parser.add_argument('--steps', default=30, type=int, help='计时的训练 batch 数')
+parser.add_argument('--batch_size', default=128, type=int)
+parser.add_argument('--dev', default=2000, type=int, help='合成验证集条数')
+parser.add_argument('--worker', default=None, type=str, help=argparse.SUPPRESS)
+
+
+def run(model_name, threads, precision, args):
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(threads)
+    from utils import DatasetIterater
+    from train_eval import autocast, evaluate, init_network
+
+    config = SimpleNamespace(embedding_pretrained=None, n_vocab=10002, num_classes=4, device=torch.device('cpu'),
+                             bf16=precision == 'bf16', **MODEL_CONFIGS[model_name])
+    rng = np.random.RandomState(1)
+    torch.manual_seed(1)
+    train_data = make_data(args.batch_size * (args.steps + 1), config.pad_size, config.n_vocab, config.num_classes, rng)
+    dev_data = make_data(args.dev, config.pad_size, config.n_vocab, config.num_classes, rng)
+    model = import_module(model_name).Model(config)
+    init_network(model)
+    for param in model.embedding.parameters():
+        param.requires_grad = False  # 与 run.py 一致
+    model.train()
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
+    for step, (trains, labels) in enumerate(DatasetIterater(train_data, args.batch_size, 'cpu')):
+        if step == 1:
+            start = time.perf_counter()  # 第一步作为预热不计时
+        with autocast(config):
+            outputs = model(trains)
+        model.zero_grad()
+        F.cross_entropy(outputs.float(), labels).backward()
+        optimizer.step()
+    speed = args.steps * args.batch_size / (time.perf_counter() - start)
+    start = time.perf_counter()
+    dev_acc, dev_loss = evaluate(config, model, DatasetIterater(dev_data, args.batch_size, 'cpu'))
+    eval_speed = args.dev / (time.perf_counter() - start)
+    return {'model': model_name, 'threads': threads, 'precision': precision, 'train_samples_per_sec': speed,
+            'eval_samples_per_sec': eval_speed, 'dev_acc': float(dev_acc), 'dev_loss': float(dev_loss)}
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if args.worker:
+        model_name, threads, precision = args.worker.split(',')
+        print(json.dumps(run(model_name, int(threads), precision, args)))
+        sys.exit()
+
+    threads_list = args.threads or sorted({1, os.cpu_count()})
+    for model_name in args.models:
+        results = []
+        for threads in threads_list:
+            for precision in args.precision:
+                out = subprocess.run([sys.executable, __file__, '--worker', f'{model_name},{threads},{precision}',
+                                      '--steps', str(args.steps), '--batch_size', str(args.batch_size),
+                                      '--dev', str(args.dev)], check=True, capture_output=True, text=True)
+                results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+        base = results[0]['train_samples_per_sec']
+        for r in results:
+            print(f"{r['model']:>7} threads {r['threads']:>2} {r['precision']}: "
+                  f"train {r['train_samples_per_sec']:8.1f} samples/sec ({r['train_samples_per_sec'] / base:.2f}x), "
+                  f"eval {r['eval_samples_per_sec']:8.1f} samples/sec, dev acc {r['dev_acc']:.2%}")
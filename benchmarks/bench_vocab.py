@@ -0,0 +1,93 @@
+# coding: UTF-8
+"""对比旧的建词表方式(dict + try/except 计数, 对整个词表排序)与 vocabulary.count_words + 堆选取 top-k 的耗时,
+以及近似计数(ApproxCounter)在不同 capacity 下保留的词数和与精确词表的重合率;
+最后对比 vocab.pkl 与紧凑词表(Vocab)的加载耗时和整批查表的耗时
+
+只统计计数、选取和查表, 文本预先切好词, 不包含规范化的耗时。
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import pickle as pkl
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+from vocabulary import count_words, make_vocab, save_vocab, Vocab, table_path
+
+parser = argparse.ArgumentParser(description='vocabulary builder benchmark')
+parser.add_argument('--tokens', default=20000000, type=int, help='总词数')
+parser.add_argument('--vocab_size', default=1000000, type=int, help='不同词的个数(Zipf 分布)')
+parser.add_argument('--max_size', default=10000, type=int)
+parser.add_argument('--num_workers', default=[1, 4], type=int, nargs='+')
+parser.add_argument('--capacity', default=[20000, 50000], type=int, nargs='+')
+
+
+def legacy(sentences, max_size):
+    vocab_dic = {}
+    for sentence in sentences:
+        for word in sentence:
+            try:
+                vocab_dic[word] += 1
+            except KeyError:
+                vocab_dic[word] = 1
+    vocab_list = sorted([_ for _ in vocab_dic.items() if _[1] >= 1], key=lambda x: x[1], reverse=True)[:max_size]
+    return {word_count[0]: idx for idx, word_count in enumerate(vocab_list)}
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    rng = np.random.RandomState(1)
+    words = np.array([f'w{i}' for i in range(args.vocab_size)], dtype=object)
+    probs = 1 / np.arange(1, args.vocab_size + 1)
+    ids = rng.choice(args.vocab_size, args.tokens, p=probs / probs.sum())
+    sentences = [list(words[ids[i: i + 30]]) for i in range(0, args.tokens, 30)]
+    print(f"{args.tokens:,} 词, {len(sentences):,} 句, 不同词 {len(np.unique(ids)):,}")
+
+    start = time.perf_counter()
+    old = legacy(sentences, args.max_size)
+    base = time.perf_counter() - start
+    print(f"legacy              {base:7.2f}s")
+    for num_workers in args.num_workers:
+        start = time.perf_counter()
+        new = make_vocab(count_words(sentences, num_workers=num_workers), args.max_size)
+        elapsed = time.perf_counter() - start
+        assert list(new.items()) == list(old.items())
+        print(f"exact   {num_workers} 进程      {elapsed:7.2f}s ({base / elapsed:.2f}x)")
+    for capacity in args.capacity:
+        start = time.perf_counter()
+        counts = count_words(sentences, capacity=capacity)
+        new = make_vocab(counts, args.max_size)
+        elapsed = time.perf_counter() - start
+        print(f"approx  {capacity:>7,}     {elapsed:7.2f}s ({base / elapsed:.2f}x), 保留 {len(counts):,} 词, "
+              f"误差上界 {counts.error:,}, 与精确词表重合 {len(set(new) & set(old)) / len(old):.2%}")
+
+    counts = count_words(sentences)
+    vocab = make_vocab(counts, len(counts))
+    flat = [word for sentence in sentences for word in sentence]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'vocab.pkl')
+        save_vocab(vocab, path)
+        start = time.perf_counter()
+        with open(path, 'rb') as f:
+            old = pkl.load(f)
+        load_pkl = time.perf_counter() - start
+        start = time.perf_counter()
+        new = Vocab.load(table_path(path))
+        load_table = time.perf_counter() - start
+        start = time.perf_counter()
+        new.index
+        build_index = time.perf_counter() - start
+        print(f"加载 {len(vocab):,} 词: pickle {load_pkl * 1000:.1f} ms, mmap {load_table * 1000:.2f} ms, "
+              f"首次查询建立索引 {build_index * 1000:.1f} ms")
+        start = time.perf_counter()
+        get = old.get
+        ids_old = np.asarray([get(word, 0) for word in flat], dtype=np.int32)
+        lookup_old = time.perf_counter() - start
+        start = time.perf_counter()
+        ids_new = new.encode(flat, 0)
+        lookup_new = time.perf_counter() - start
+        assert np.array_equal(ids_old, ids_new)
+        print(f"查表 {len(flat):,} 词: dict.get {lookup_old / len(flat) * 1e9:.0f} ns/词, "
+              f"Vocab.encode {lookup_new / len(flat) * 1e9:.0f} ns/词")
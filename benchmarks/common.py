@@ -0,0 +1,43 @@
+# coding: UTF-8
+"""各 benchmark 共用的模型配置、合成数据和计时函数"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+
+# 与各模型 Config 的默认值一致
+MODEL_CONFIGS = {
+    'TextRNN': dict(embed=300, hidden_size=256, num_layers=3, dropout=0.5, pad_size=160, packed=False,
+                    oov_mode='unk'),
+    'DPCNN': dict(embed=300, num_filters=250, dropout=0.5, pad_size=14, oov_mode='unk'),
+}
+
+
+def make_data(n, pad_size, n_vocab, num_classes, rng):
+    """可学习的合成数据: 每个类别有10个标志词, 文本中约1/5的词换成本类别的标志词, 其余为随机词"""
+    from preprocess import TextDataset
+    labels = rng.randint(0, num_classes, n).astype(np.int64)
+    seq_len = np.clip(rng.geometric(1 / 30, n), 3, pad_size).astype(np.int64)
+    tokens = rng.randint(num_classes * 10, n_vocab - 2, (n, pad_size)).astype(np.int32)
+    mark = rng.rand(n, pad_size) < 0.2
+    tokens[mark] = (labels[:, None] * 10 + rng.randint(0, 10, (n, pad_size)))[mark]
+    tokens[np.arange(pad_size) >= seq_len[:, None]] = n_vocab - 1
+    return TextDataset(tokens, labels, seq_len)
+
+
+def timeit(fn, repeats=3, warmup=1, items=None):
+    """运行 warmup + repeats 次 fn, 返回每次耗时(秒)的中位数/最小值; items 为每次处理的条数, 用于计算吞吐"""
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    result = {'median_sec': float(np.median(times)), 'min_sec': float(np.min(times)), 'repeats': repeats}
+    if items:
+        result['items'] = items
+        result['items_per_sec'] = items / result['median_sec']
+    return result
@@ -0,0 +1,60 @@
+# coding: UTF-8
+"""比较两次 suite.py 的结果, 新结果比基线慢超过 --threshold 的阶段标记为 REGRESSION, 有回退时退出码为1
+
+    python benchmarks/compare.py base.json new.json --threshold 0.1
+"""
+import sys
+import json
+import argparse
+
+parser = argparse.ArgumentParser(description='compare two benchmark suite results')
+parser.add_argument('base', type=str, help='基线结果 json')
+parser.add_argument('new', type=str, help='新结果 json')
+parser.add_argument('--threshold', default=0.1, type=float, help='耗时增加超过该比例视为回退')
+parser.add_argument('--metric', default='median_sec', choices=['median_sec', 'min_sec'])
+
+
+def compare(base, new, threshold=0.1, metric='median_sec'):
+    """返回 [(阶段, 基线秒数, 新秒数, 新/基线, 状态)], 状态为 REGRESSION / improved / ok / new / missing"""
+    rows = []
+    for stage in list(base) + [s for s in new if s not in base]:
+        if stage not in new or stage not in base:
+            rows.append((stage, base.get(stage, {}).get(metric), new.get(stage, {}).get(metric), None,
+                         'missing' if stage not in new else 'new'))
+            continue
+        old_t, new_t = base[stage][metric], new[stage][metric]
+        ratio = new_t / old_t
+        if ratio > 1 + threshold:
+            status = 'REGRESSION'
+        elif ratio < 1 / (1 + threshold):
+            status = 'improved'
+        else:
+            status = 'ok'
+        rows.append((stage, old_t, new_t, ratio, status))
+    return rows
+
+
+def main(args):
+    with open(args.base, encoding='utf-8') as f:
+        base = json.load(f)
+    with open(args.new, encoding='utf-8') as f:
+        new = json.load(f)
+    for key in ('commit', 'torch', 'cpu_count', 'threads'):
+        old_v, new_v = base['environment'].get(key), new['environment'].get(key)
+        print(f"{key:<10} {old_v} -> {new_v}" if old_v != new_v else f"{key:<10} {old_v}")
+
+    rows = compare(base['results'], new['results'], args.threshold, args.metric)
+    print(f"{'stage':<36} {'base ms':>10} {'new ms':>10} {'change':>8}")
+    for stage, old_t, new_t, ratio, status in rows:
+        old_s = f"{old_t * 1000:>10.2f}" if old_t is not None else f"{'-':>10}"
+        new_s = f"{new_t * 1000:>10.2f}" if new_t is not None else f"{'-':>10}"
+        change = f"{ratio - 1:>+8.1%}" if ratio is not None else f"{'':>8}"
+        print(f"{stage:<36} {old_s} {new_s} {change}  {status}")
+    regressions = [row[0] for row in rows if row[4] == 'REGRESSION']
+    if regressions:
+        print(f"{len(regressions)} 个阶段变慢超过 {args.threshold:.0%}: {', '.join(regressions)}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(parser.parse_args()))
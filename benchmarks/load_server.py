@@ -0,0 +1,76 @@
+# coding: UTF-8
+"""server.py 的压测脚本: 以不同并发数发送单条文本请求, 统计吞吐与延迟
+
+用法:
+    python server.py --model TextRNN &
+    python benchmarks/load_server.py --concurrency 1 8 32 --duration 10
+"""
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import numpy as np
+
+parser = argparse.ArgumentParser(description='Load generator for server.py')
+parser.add_argument('--host', default='127.0.0.1', type=str)
+parser.add_argument('--port', default=8000, type=int)
+parser.add_argument('--concurrency', default=[1, 8, 32], type=int, nargs='+', help='concurrent clients per run')
+parser.add_argument('--duration', default=10., type=float, help='seconds per concurrency level')
+parser.add_argument('--batch', default=1, type=int, help='texts per request')
+parser.add_argument('--texts', default=None, type=str, help='file with one text per line, synthetic texts if omitted')
+
+
+async def request(reader, writer, method, path, body=b''):
+    writer.write(f'{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n'
+                 f'Content-Length: {len(body)}\r\n\r\n'.encode('latin-1') + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        if line.lower().startswith(b'content-length:'):
+            length = int(line.split(b':')[1])
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def client(args, texts, deadline, latencies, errors):
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    rng = random.Random()
+    while time.time() < deadline:
+        batch = [rng.choice(texts) for _ in range(args.batch)]
+        body = json.dumps({'text': batch[0]} if args.batch == 1 else {'texts': batch}).encode('utf-8')
+        start = time.time()
+        status, _ = await request(reader, writer, 'POST', '/predict', body)
+        latencies.append(time.time() - start)
+        if status != 200:
+            errors.append(status)
+    writer.close()
+
+
+async def main(args):
+    if args.texts:
+        texts = [line.rstrip('\n') for line in open(args.texts, encoding='utf-8') if line.strip()]
+    else:
+        words = 'the of and to in a is that for it as was with be by on not he said new world sport tech market'.split()
+        texts = [' '.join(random.choice(words) for _ in range(random.randint(5, 40))) for _ in range(1000)]
+    for concurrency in args.concurrency:
+        latencies, errors = [], []
+        start = time.time()
+        await asyncio.gather(*[client(args, texts, start + args.duration, latencies, errors)
+                               for _ in range(concurrency)])
+        elapsed = time.time() - start
+        ms = np.asarray(latencies) * 1000
+        print(f"并发 {concurrency:>4}: {len(ms) / elapsed:8.1f} req/s, {len(ms) * args.batch / elapsed:8.1f} texts/s, "
+              f"p50 {np.percentile(ms, 50):7.1f} ms, p99 {np.percentile(ms, 99):7.1f} ms, 错误 {len(errors)}")
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    _, metrics = await request(reader, writer, 'GET', '/metrics')
+    writer.close()
+    print(json.dumps(metrics, indent=2), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,176 @@
+# coding: UTF-8
+"""数据管线和两个模型的分阶段 benchmark, 结果写成 json, 用 compare.py 和基线比较
+
+先用 synthetic.py 的参数生成合成数据集(同样的参数和 seed 得到同样的数据), 然后依次计时:
+  build_vocab                      utils.build_vocab 读 train.csv 建词表
+  load_dataset / load_dataset_cached  load_or_encode_csv 编码 train.csv(不用缓存 / 读 .npy 缓存)
+  clean_special_chars / clean_contractions / normalizer  对 train.csv 的全部文本做规范化
+  iterator / iterator_shuffle_bucket  DatasetIterater 遍历一轮 train
+  train_step/<model>/b<batch_size>_p<pad_size>  一个 batch 的前向 + 反向 + 参数更新
+  evaluate/<model>                 evaluate() 遍历 val
+每个阶段预热一次后重复 --repeats 次, 记录耗时的中位数和最小值。
+
+    python benchmarks/suite.py --out base.json
+    (修改代码)
+    python benchmarks/suite.py --out new.json
+    python benchmarks/compare.py base.json new.json
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from types import SimpleNamespace
+from importlib import import_module
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn.functional as F
+from common import MODEL_CONFIGS, make_data, timeit
+import synthetic
+
+STAGES = ['build_vocab', 'load_dataset', 'load_dataset_cached', 'clean_special_chars', 'clean_contractions',
+          'normalizer', 'iterator', 'iterator_shuffle_bucket', 'train_step', 'evaluate']
+
+parser = argparse.ArgumentParser(description='data pipeline and model benchmark suite', parents=[synthetic.parser],
+                                 conflict_handler='resolve')
+parser.add_argument('--out', default='benchmark.json', type=str, help='结果 json 路径')
+parser.add_argument('--data', default=None, type=str, help='合成数据集目录, 默认为临时目录, 运行结束后删除')
+parser.add_argument('--rows', default=20000, type=int, help='train.csv 条数, val/test 各为其 1/5')
+parser.add_argument('--stages', default=STAGES, nargs='+', choices=STAGES)
+parser.add_argument('--models', default=['TextRNN', 'DPCNN'], nargs='+')
+parser.add_argument('--batch_sizes', default=[32, 128], type=int, nargs='+')
+parser.add_argument('--pad_sizes', default=[16, 64], type=int, nargs='+')
+parser.add_argument('--pad_size', default=32, type=int, help='数据管线各阶段使用的 pad_size')
+parser.add_argument('--batch_size', default=128, type=int, help='iterator / evaluate 使用的 batch 大小')
+parser.add_argument('--num_workers', default=1, type=int, help='load_dataset 的编码进程数')
+parser.add_argument('--repeats', default=3, type=int)
+parser.add_argument('--threads', default=None, type=int, help='torch intra-op 线程数')
+
+
+def environment(args):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'torch': torch.__version__,
+            'numpy': np.__version__, 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+            'threads': torch.get_num_threads(), 'args': vars(args)}
+
+
+def pipeline_stages(args, paths, results):
+    from utils import build_vocab, MAX_VOCAB_SIZE, UNK, PAD, DatasetIterater
+    from preprocess import load_or_encode_csv, normalizer
+    from tool import clean_special_chars, clean_contractions, PUNCT, PUNCT_MAPPING, CONTRACTION_MAPPING
+
+    stages = set(args.stages)
+    texts = pd.read_csv(paths['train'], encoding='utf-8')['Text'].fillna('').tolist()
+    vocab = build_vocab(paths['train'], MAX_VOCAB_SIZE, 1)
+    if 'build_vocab' in stages:
+        results['build_vocab'] = timeit(lambda: build_vocab(paths['train'], MAX_VOCAB_SIZE, 1), args.repeats,
+                                        items=len(texts))
+
+    def load(cache_dir=None):
+        return load_or_encode_csv(paths['train'], vocab, args.pad_size, vocab[UNK], vocab[PAD], args.num_workers,
+                                  cache_dir)[0]
+
+    if 'load_dataset' in stages:
+        results['load_dataset'] = timeit(load, args.repeats, items=len(texts))
+    if 'load_dataset_cached' in stages:
+        cache_dir = os.path.join(paths['dir'], 'cache')
+        results['load_dataset_cached'] = timeit(lambda: load(cache_dir), args.repeats, items=len(texts))
+
+    lowered = [t.lower() for t in texts]
+    if 'clean_special_chars' in stages:
+        results['clean_special_chars'] = timeit(
+            lambda: [clean_special_chars(t, PUNCT, PUNCT_MAPPING) for t in lowered], args.repeats, items=len(texts))
+    if 'clean_contractions' in stages:
+        results['clean_contractions'] = timeit(
+            lambda: [clean_contractions(t, CONTRACTION_MAPPING) for t in lowered], args.repeats, items=len(texts))
+    if 'normalizer' in stages:
+        results['normalizer'] = timeit(lambda: [normalizer.tokenize(t) for t in texts], args.repeats,
+                                       items=len(texts))
+
+    train = load()
+    for name, kwargs in (('iterator', {}), ('iterator_shuffle_bucket', {'shuffle': True, 'bucket': True})):
+        if name in stages:
+            it = DatasetIterater(train, args.batch_size, 'cpu', **kwargs)
+            results[name] = timeit(lambda: sum(1 for _ in it), args.repeats, items=len(train))
+    return vocab
+
+
+def model_config(name, pad_size, num_classes, n_vocab=10002):
+    return SimpleNamespace(embedding_pretrained=None, n_vocab=n_vocab, num_classes=num_classes,
+                           device=torch.device('cpu'), bf16=False, **{**MODEL_CONFIGS[name], 'pad_size': pad_size})
+
+
+def model_stages(args, paths, vocab, results):
+    from utils import UNK, PAD, DatasetIterater
+    from train_eval import evaluate, init_network
+    from preprocess import TextDataset, load_or_encode_csv
+
+    stages = set(args.stages)
+    rng = np.random.RandomState(args.seed)
+    for name in args.models:
+        module = import_module(name)
+        if 'train_step' in stages:
+            for pad_size in args.pad_sizes:
+                config = model_config(name, pad_size, args.num_classes)
+                torch.manual_seed(args.seed)
+                model = module.Model(config)
+                init_network(model)
+                model.train()
+                optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
+                data = make_data(max(args.batch_sizes), pad_size, config.n_vocab, config.num_classes, rng)
+                for batch_size in args.batch_sizes:
+                    (x, seq_len), y = next(DatasetIterater(
+                        TextDataset(data.tokens[:batch_size], data.labels[:batch_size], data.seq_len[:batch_size]),
+                        batch_size, 'cpu'))
+
+                    def step():
+                        model.zero_grad()
+                        F.cross_entropy(model((x, seq_len)), y).backward()
+                        optimizer.step()
+
+                    results[f'train_step/{name}/b{batch_size}_p{pad_size}'] = timeit(step, args.repeats,
+                                                                                      items=batch_size)
+        if 'evaluate' in stages:
+            config = model_config(name, args.pad_size, args.num_classes, len(vocab))
+            torch.manual_seed(args.seed)
+            model = module.Model(config)
+            init_network(model)
+            dev = load_or_encode_csv(paths['val'], vocab, args.pad_size, vocab[UNK], vocab[PAD])[0]
+            it = DatasetIterater(dev, args.batch_size, 'cpu')
+            results[f'evaluate/{name}'] = timeit(lambda: evaluate(config, model, it), args.repeats, items=len(dev))
+
+
+def main(args):
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    data_dir = args.data or tempfile.mkdtemp(prefix='textrnn_bench_')
+    try:
+        paths = synthetic.generate(SimpleNamespace(**{**vars(args), 'out': data_dir}))
+        paths['dir'] = data_dir
+        results = {}
+        vocab = pipeline_stages(args, paths, results)
+        model_stages(args, paths, vocab, results)
+    finally:
+        if args.data is None:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    report = {'environment': environment(args), 'results': results}
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    for stage, r in results.items():
+        print(f"{stage:<36} {r['median_sec'] * 1000:>10.2f} ms  {r.get('items_per_sec', 0):>12.1f} items/sec")
+    print(f"结果========{args.out}")
+
+
+if __name__ == '__main__':
+    main(parser.parse_args())
@@ -0,0 +1,94 @@
+# coding: UTF-8
+"""生成合成数据集: train.csv / val.csv / test.csv (Text, Starts 两列) 和 class.txt, 格式与 datasets/ 一致
+
+词频服从 Zipf 分布, 每个类别有10个标志词(约1/5的词), 模型可以学到东西;
+文本中混入大小写、缩写、弯引号和特殊标点, 使 clean_* 和 TextNormalizer 有实际的工作量。
+同样的参数和 seed 生成的文件逐字节相同。
+
+    python benchmarks/synthetic.py --out /tmp/bench_data --rows 100000 --length_dist lognormal --mean_len 40
+"""
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+parser = argparse.ArgumentParser(description='synthetic dataset generator')
+parser.add_argument('--out', required=True, type=str, help='输出目录')
+parser.add_argument('--rows', default=100000, type=int, help='train.csv 条数, val/test 各为其 1/5')
+parser.add_argument('--length_dist', default='geometric', choices=['geometric', 'lognormal', 'uniform', 'fixed'])
+parser.add_argument('--mean_len', default=30, type=int, help='平均词数')
+parser.add_argument('--max_len', default=1000, type=int, help='最大词数')
+parser.add_argument('--vocab_size', default=50000, type=int, help='不同词的个数')
+parser.add_argument('--num_classes', default=4, type=int)
+parser.add_argument('--seed', default=1, type=int)
+
+LETTERS = np.array(list('abcdefghijklmnopqrstuvwxyz'))
+NOISE = ["don't", "it's", "they’re", "can't", "we'll", "U.S.", "(AP)", "“quote”", "—", "co-op", "$5", "10%", "…",
+         "e-mail", "#1", "a&b", "½", "‘single’", "™", "x²"]
+
+
+def make_words(vocab_size, rng):
+    """随机生成 vocab_size 个不重复的小写词, 约1/10首字母大写"""
+    words = set()
+    while len(words) < vocab_size:
+        lengths = rng.randint(2, 10, vocab_size)
+        letters = rng.choice(LETTERS, (vocab_size, 10))
+        words.update(''.join(row[:n]) for row, n in zip(letters, lengths))
+    words = np.array(sorted(words)[:vocab_size], dtype=object)
+    words = words[rng.permutation(vocab_size)]
+    capital = rng.rand(vocab_size) < 0.1
+    words[capital] = [w.capitalize() for w in words[capital]]
+    return words
+
+
+def sample_lengths(n, dist, mean_len, max_len, rng):
+    if dist == 'geometric':
+        lengths = rng.geometric(1 / mean_len, n)
+    elif dist == 'lognormal':
+        sigma = 0.8
+        lengths = rng.lognormal(np.log(mean_len) - sigma ** 2 / 2, sigma, n)
+    elif dist == 'uniform':
+        lengths = rng.randint(1, 2 * mean_len, n)
+    else:
+        lengths = np.full(n, mean_len)
+    return np.clip(lengths, 1, max_len).astype(np.int64)
+
+
+def make_frame(n, words, classes, args, rng):
+    vocab_size = len(words)
+    ranks = np.arange(1, vocab_size + 1)
+    probs = 1 / ranks
+    probs /= probs.sum()
+    labels = rng.randint(0, len(classes), n)
+    lengths = sample_lengths(n, args.length_dist, args.mean_len, args.max_len, rng)
+    total = lengths.sum()
+    tokens = words[rng.choice(vocab_size, total, p=probs)]
+    owner = np.repeat(labels, lengths)
+    mark = rng.rand(total) < 0.2
+    tokens[mark] = words[owner[mark] * 10 + rng.randint(0, 10, mark.sum())]  # 标志词取词表的前 num_classes*10 个
+    noise = rng.rand(total) < 0.05
+    tokens[noise] = np.array(NOISE, dtype=object)[rng.randint(0, len(NOISE), noise.sum())]
+    bounds = np.concatenate([[0], np.cumsum(lengths)])
+    texts = [' '.join(tokens[bounds[i]:bounds[i + 1]]) for i in range(n)]
+    return pd.DataFrame({'Text': texts, 'Starts': np.array(classes)[labels]})
+
+
+def generate(args):
+    """按 args 生成数据集, 返回 {'train': path, 'val': path, 'test': path, 'class': path}"""
+    rng = np.random.RandomState(args.seed)
+    os.makedirs(args.out, exist_ok=True)
+    classes = [f'class{i}' for i in range(args.num_classes)]
+    words = make_words(args.vocab_size, rng)
+    paths = {'class': os.path.join(args.out, 'class.txt')}
+    with open(paths['class'], 'w', encoding='utf-8') as f:
+        f.write('\n'.join(classes) + '\n')
+    for split, n in (('train', args.rows), ('val', args.rows // 5), ('test', args.rows // 5)):
+        paths[split] = os.path.join(args.out, split + '.csv')
+        make_frame(n, words, classes, args, rng).to_csv(paths[split], index=False, encoding='utf-8')
+    return paths
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    for split, path in generate(args).items():
+        print(f"{split:<5} {path}")
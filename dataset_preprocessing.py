@@ -1,155 +1,126 @@
-import operator
+# coding: UTF-8
+"""预训练词向量对语料词表的覆盖率分析
+
+对每个清洗阶段(原文 / 小写 / 去特殊字符 / 去缩写 / 训练时使用的 TextNormalizer)统计语料的词频, 与每个词向量文件的
+词集合比较, 给出词表覆盖率(不同的词)和文本覆盖率(按出现次数)以及出现次数最多的未覆盖词, 写成 json。
+语料只读一遍: 每块文本依次做各阶段的清洗并分别计数, 各块在进程池中并行; 词向量文件只读取词
+(借助 extracting_pre-trained_word_vectors 的索引, 第二次起直接读索引), 不解析向量, 与语料计数同时在进程池中读取。
+
+    python dataset_preprocessing.py --csv ./datasets/train.csv ./datasets/test.csv \
+        --embeddings ./glove/glove.6B.50d.txt ./fasttext/wiki-news-300d-1M.vec --out coverage.json
+"""
+import json
+import heapq
+import argparse
+from collections import Counter
+from importlib import import_module
+from itertools import chain, islice
+from multiprocessing import Pool
+from operator import itemgetter
 import pandas as pd
-from tqdm import tqdm
-import numpy as np
-from gensim.models import KeyedVectors
-
-
-# 创建英文词典
-def build_vocab(sentences, verbose=True):
-    vocab = {}
-    for sentence in tqdm(sentences, disable=(not verbose)):
-        for word in sentence:
-            try:
-                vocab[word] += 1
-            except KeyError:
-                vocab[word] = 1
-    return vocab
-
-
-# ## 加载预训练词向量
-def load_embed(file):
-    def get_coefs(word, *arr):
-        return word, np.asarray(arr, dtype='float32')
-
-    if file == './fasttext/wiki-news-300d-1M.vec':
-        embeddings_index = dict(get_coefs(*o.split(" "))
-                                for o in open(file, encoding='utf-8') if len(o) > 100)
-    elif file == './GoogleNews-vectors-negative300/GoogleNews-vectors-negative300.bin':
-        model = KeyedVectors.load_word2vec_format(file, binary=True)
-        embeddings_index = {}
-        for word, vector in zip(model.vocab, model.vectors):
-            embeddings_index[word] = vector
-    else:
-        embeddings_index = dict(get_coefs(*o.split(" "))
-                                for o in open(file, encoding='latin'))
-
-    return embeddings_index
-
-
-# ## 检查预训练embeddings和vocab的覆盖情况
-def check_coverage(vocab, embeddings_index):
-    known_words = {}
-    unknown_words = {}  
-    nb_known_words = 0  
-    nb_unknown_words = 0
-    for word in tqdm(vocab):
-        try:
-            known_words[word] = embeddings_index[word]
-            nb_known_words += vocab[word]
-        except:
-            unknown_words[word] = vocab[word]
-            nb_unknown_words += vocab[word]
-            pass
-
-    print('Found embeddings for {:.2%} of vocab'.format(
-        len(known_words) / len(vocab)))  
-    print('Found embeddings for  {:.2%} of all text'.format(
-        nb_known_words / (nb_known_words + nb_unknown_words))) 
-    unknown_words = sorted(unknown_words.items(),
-                           key=operator.itemgetter(1))[::-1]
-    print("unknown words : ", unknown_words[:30])
-    return unknown_words
-
-
-
-def clean_special_chars(text, punct, mapping):
-    for p in mapping:
-        text = text.replace(p, mapping[p])
-    for p in punct:
-        text = text.replace(p, f' {p} ')
-    specials = {'\u200b': ' ', '…': ' ... ', '\ufeff': '', 'करना': '',
-                'है': ''}  # Other special characters that I have to deal with in last
-    for s in specials:
-        text = text.replace(s, specials[s])
-    return text
-
-
-
-def known_contractions(embed):
-    known = []
-    for contract in contraction_mapping:
-        if contract in embed:
-            known.append(contract)
-    return known
-
-
-# 去除英语缩写
-def clean_contractions(text, mapping):
-    specials = ["’", "‘", "´", "`"]
-    for s in specials:
-        text = text.replace(s, "'")
-    text = ' '.join(
-        [mapping[t] if t in mapping else t for t in text.split(" ")])
-    return text
-
-
-# ## 进度条初始化
-tqdm.pandas()
-# ## 加载数据集
-train_df = pd.read_csv("./datasets/train.csv", encoding='utf-8', sep=',')
-test_df = pd.read_csv("./datasets/test.csv", encoding='utf-8', sep=',')
-# test = pd.read_csv("../input/test.csv")  # Test shape = (56370, 2)
-df = pd.concat([train_df, test_df])  # shape=(206916, 2)
-df['Text'] = df['Text'].fillna('')
-
-# ## 创建词典
-sentences = df['Text'].progress_apply(lambda x: x.split()).values
-vocab = build_vocab(sentences)
-# print(vocab)
-# ## 加载词向量
-glove = './glove/glove.6B.50d.txt'
-fasttext = './fasttext/wiki-news-300d-1M.vec'
-embed_glove = load_embed(glove)
-embed_fasttext = load_embed(fasttext)
-oov_glove = check_coverage(vocab, embed_glove)
-oov_fasttext = check_coverage(vocab, embed_fasttext)
-
-# ## 词典全部小写
-print("=========转化小写后")
-sentences = df['Text'].apply(lambda x: x.lower())
-sentences = sentences.progress_apply(lambda x: x.split()).values
-vocab_low = build_vocab(sentences)
-oov_glove = check_coverage(vocab_low, embed_glove)
-oov_fasttext = check_coverage(vocab_low, embed_fasttext)
-
-# ## 去除特殊字符
-print("=========去除特殊字符后")
-punct = "/-'?!.,#$%\'()*+-/:;<=>@[\\]^_`{|}~" + \
-    '""“”’' + '∞θ÷α•à−β∅³π‘₹´°£€\×™√²—–&'
-punct_mapping = {"‘": "'", "₹": "e", "´": "'", "°": "", "€": "e", "™": "tm", "√": " sqrt ", "×": "x", "²": "2", "—": "-", "–": "-", "’": "'", "_": "-", "`": "'",
-                 '“': '"', '”': '"', '“': '"', "£": "e", '∞': 'infinity', 'θ': 'theta', '÷': '/', 'α': 'alpha', '•': '.', 'à': 'a', '−': '-', 'β': 'beta', '∅': '', '³': '3', 'π': 'pi', }
-sentences = df['Text'].apply(
-    lambda x: clean_special_chars(x, punct, punct_mapping))
-sentences = sentences.apply(lambda x: x.lower()).progress_apply(
-    lambda x: x.split()).values
-vocab_punct = build_vocab(sentences)
-oov_glove = check_coverage(vocab_punct, embed_glove)
-oov_fasttext = check_coverage(vocab_punct, embed_fasttext)
-
-# ## 去除’英语缩写
-print("=========去除’英语缩写后")
-contraction_mapping = {"here's": "here is", "it's": "it is", "ain't": "is not", "aren't": "are not", "can't": "cannot", "'cause": "because", "could've": "could have", "couldn't": "could not", "didn't": "did not",  "doesn't": "does not", "don't": "do not", "hadn't": "had not", "hasn't": "has not", "haven't": "have not", "he'd": "he would", "he'll": "he will", "he's": "he is", "how'd": "how did", "how'd'y": "how do you", "how'll": "how will", "how's": "how is",  "I'd": "I would", "I'd've": "I would have", "I'll": "I will", "I'll've": "I will have", "I'm": "I am", "I've": "I have", "i'd": "i would", "i'd've": "i would have", "i'll": "i will",  "i'll've": "i will have", "i'm": "i am", "i've": "i have", "isn't": "is not", "it'd": "it would", "it'd've": "it would have", "it'll": "it will", "it'll've": "it will have", "it's": "it is", "let's": "let us", "ma'am": "madam", "mayn't": "may not", "might've": "might have", "mightn't": "might not", "mightn't've": "might not have", "must've": "must have", "mustn't": "must not", "mustn't've": "must not have", "needn't": "need not", "needn't've": "need not have", "o'clock": "of the clock", "oughtn't": "ought not", "oughtn't've": "ought not have", "shan't": "shall not", "sha'n't": "shall not", "shan't've": "shall not have", "she'd": "she would", "she'd've": "she would have", "she'll": "she will", "she'll've": "she will have", "she's": "she is", "should've": "should have", "shouldn't": "should not",
-                       "shouldn't've": "should not have", "so've": "so have", "so's": "so as", "this's": "this is", "that'd": "that would", "that'd've": "that would have", "that's": "that is", "there'd": "there would", "there'd've": "there would have", "there's": "there is", "here's": "here is", "they'd": "they would", "they'd've": "they would have", "they'll": "they will", "they'll've": "they will have", "they're": "they are", "they've": "they have", "to've": "to have", "wasn't": "was not", "we'd": "we would", "we'd've": "we would have", "we'll": "we will", "we'll've": "we will have", "we're": "we are", "we've": "we have", "weren't": "were not", "what'll": "what will", "what'll've": "what will have", "what're": "what are",  "what's": "what is", "what've": "what have", "when's": "when is", "when've": "when have", "where'd": "where did", "where's": "where is", "where've": "where have", "who'll": "who will", "who'll've": "who will have", "who's": "who is", "who've": "who have", "why's": "why is", "why've": "why have", "will've": "will have", "won't": "will not", "won't've": "will not have", "would've": "would have", "wouldn't": "would not", "wouldn't've": "would not have", "y'all": "you all", "y'all'd": "you all would", "y'all'd've": "you all would have", "y'all're": "you all are", "y'all've": "you all have", "you'd": "you would", "you'd've": "you would have", "you'll": "you will", "you'll've": "you will have", "you're": "you are", "you've": "you have"}
-print("- Known Contractions -")
-print("   Glove :")
-print(known_contractions(embed_glove))
-print("   FastText :")
-print(known_contractions(embed_fasttext))
-sentences = df['Text'].apply(
-    lambda x: clean_special_chars(x, punct, punct_mapping))
-sentences = sentences.apply(lambda x: x.lower()).apply(lambda x: clean_contractions(
-    x, contraction_mapping)).progress_apply(lambda x: x.split()).values
-vocab_contraction = build_vocab(sentences)
-oov_glove = check_coverage(vocab_contraction, embed_glove)
-oov_fasttext = check_coverage(vocab_contraction, embed_fasttext)
+from tool import clean_special_chars, clean_contractions, PUNCT, PUNCT_MAPPING, CONTRACTION_MAPPING
+from preprocess import normalizer
+from vocabulary import iter_chunks
+
+parser = argparse.ArgumentParser(description='pre-trained embedding coverage of the corpus vocabulary')
+parser.add_argument('--csv', default=['./datasets/train.csv', './datasets/test.csv'], nargs='+', help='语料, 读取 Text 列')
+parser.add_argument('--embeddings', default=['./glove/glove.6B.50d.txt', './fasttext/wiki-news-300d-1M.vec'], nargs='+',
+                    help='词向量文件(.txt/.vec/.bin)')
+parser.add_argument('--stages', default=None, nargs='+', help='清洗阶段, 默认全部')
+parser.add_argument('--top', default=30, type=int, help='输出出现次数最多的多少个未覆盖词')
+parser.add_argument('--num_workers', default=4, type=int)
+parser.add_argument('--chunk_size', default=10000, type=int, help='每块的文本数')
+parser.add_argument('--out', default='coverage.json', type=str)
+
+# 依次叠加的清洗阶段, 与原先逐步检查覆盖率的顺序一致; normalizer 为训练和预测时实际使用的规范化
+STAGES = ['raw', 'lower', 'punct', 'contractions', 'normalizer']
+
+
+def stage_tokens(text, stages):
+    """一条文本在各阶段的切词结果, 去特殊字符并小写的结果在 punct 和 contractions 两个阶段共用"""
+    tokens = []
+    cleaned = None
+    for stage in stages:
+        if stage == 'raw':
+            tokens.append(text.split())
+        elif stage == 'lower':
+            tokens.append(text.lower().split())
+        elif stage in ('punct', 'contractions'):
+            if cleaned is None:
+                cleaned = clean_special_chars(text, PUNCT, PUNCT_MAPPING).lower()
+            tokens.append(cleaned.split() if stage == 'punct' else
+                          clean_contractions(cleaned, CONTRACTION_MAPPING).split())
+        elif stage == 'normalizer':
+            tokens.append(normalizer.tokenize(text))
+        else:
+            raise ValueError(f'unknown stage {stage!r}')
+    return tokens
+
+
+def _count_chunk(task):
+    """一块文本在各阶段的词频"""
+    texts, stages = task
+    per_stage = zip(*(stage_tokens(text, stages) for text in texts))
+    return [Counter(chain.from_iterable(tokens)) for tokens in per_stage]
+
+
+def load_keys(path):
+    """词向量文件中的词集合, 不读取向量"""
+    return frozenset(import_module('extracting_pre-trained_word_vectors').load_index(path))
+
+
+def iter_texts(paths, chunk_size):
+    for path in paths:
+        for df in pd.read_csv(path, encoding='utf-8', sep=',', usecols=['Text'], chunksize=chunk_size):
+            yield from df['Text'].fillna('').tolist()
+
+
+def coverage(counts, keys, top=30):
+    """词表覆盖率(不同的词)、文本覆盖率(按出现次数)和出现次数最多的未覆盖词"""
+    known = counts.keys() & keys
+    known_tokens = sum(map(counts.__getitem__, known))
+    tokens = sum(counts.values())
+    oov = heapq.nlargest(top, ((w, c) for w, c in counts.items() if w not in keys), key=itemgetter(1))
+    return {'vocab_coverage': len(known) / max(len(counts), 1), 'token_coverage': known_tokens / max(tokens, 1),
+            'oov_words': len(counts) - len(known), 'top_oov': oov}
+
+
+def analyze(csv_paths, embed_paths, stages=None, top=30, num_workers=4, chunk_size=10000):
+    stages = stages or STAGES
+    totals = [Counter() for _ in stages]
+    chunks = iter_chunks(iter_texts(csv_paths, chunk_size), chunk_size)
+    with Pool(num_workers) as pool:
+        keys = pool.map_async(load_keys, embed_paths)  # 与语料计数同时读取
+        while True:
+            # 每次最多读入 num_workers 块, 内存与语料大小无关
+            wave = [(chunk, stages) for chunk in islice(chunks, num_workers)]
+            if not wave:
+                break
+            for counts in pool.map(_count_chunk, wave):
+                for total, c in zip(totals, counts):
+                    total.update(c)
+        keys = dict(zip(embed_paths, keys.get()))
+
+    report = {'csv': list(csv_paths),
+              'embeddings': {path: {'words': len(k), 'known_contractions': [c for c in CONTRACTION_MAPPING if c in k]}
+                             for path, k in keys.items()},
+              'stages': {}}
+    for stage, counts in zip(stages, totals):
+        report['stages'][stage] = {'vocab_size': len(counts), 'tokens': sum(counts.values()),
+                                   'coverage': {path: coverage(counts, k, top) for path, k in keys.items()}}
+    return report
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    report = analyze(args.csv, args.embeddings, args.stages, args.top, args.num_workers, args.chunk_size)
+    for path, info in report['embeddings'].items():
+        print(f"{path}: {info['words']:,} 词, 含 {len(info['known_contractions'])} 个缩写")
+    for stage, info in report['stages'].items():
+        print(f"========{stage}: 词表 {info['vocab_size']:,} 词, 共 {info['tokens']:,} 词")
+        for path, cov in info['coverage'].items():
+            print(f"  {path}: 词表覆盖 {cov['vocab_coverage']:.2%}, 文本覆盖 {cov['token_coverage']:.2%}, "
+                  f"未覆盖最多的词 {[w for w, _ in cov['top_oov'][:10]]}")
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"报告========{args.out}")
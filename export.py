@@ -0,0 +1,145 @@
+# coding: UTF-8
+import os
+import copy
+import json
+import time
+import argparse
+import torch
+import torch.nn as nn
+from predict import Predictor
+from preprocess import load_or_encode_csv
+from utils import UNK, PAD, build_iterator
+from train_eval import evaluate
+
+parser = argparse.ArgumentParser(description='English Text Classification - int8 quantization and export')
+parser.add_argument('--model', type=str, required=True, help='choose a model: TextRNN, DPCNN')
+parser.add_argument('--dataset', default='./datasets', type=str, help='dataset directory holding class.txt, vocab.pkl and test.csv')
+parser.add_argument('--ckpt', default=None, type=str, help='checkpoint path, defaults to config.save_path')
+parser.add_argument('--out', default=None, type=str, help='output directory, defaults to the checkpoint directory')
+parser.add_argument('--oov', default=None, choices=['unk', 'hash', 'subword'], help='out-of-vocabulary encoding the checkpoint was trained with, needed only for checkpoints and TorchScript files that do not record it')
+parser.add_argument('--onnx', action='store_true', help='also export the fp32 model to ONNX (needs onnx, onnxruntime to evaluate)')
+parser.add_argument('--threads', default=None, type=int, help='torch intra-op threads used for the timings')
+parser.add_argument('--max_acc_drop', default=0.005, type=float, help='largest test accuracy drop for which int8 is considered safe')
+
+
+def quantize(model):
+    """LSTM/Linear 权重动态量化为 int8, 激活在运行时量化; DPCNN 的卷积不支持动态量化, 只量化 fc"""
+    return torch.ao.quantization.quantize_dynamic(copy.deepcopy(model), {nn.LSTM, nn.Linear}, dtype=torch.qint8)
+
+
+def example_input(config, batch_size=2):
+    shape = (batch_size, config.pad_size)
+    if config.oov_mode == 'subword':
+        shape += (config.max_ngrams,)  # 每个词的 n-gram 桶
+    x = torch.full(shape, config.n_vocab - 1, dtype=torch.long)
+    seq_len = torch.full((batch_size,), config.pad_size, dtype=torch.long)
+    return x, seq_len
+
+
+def to_torchscript(model, config, path):
+    """trace 成 TorchScript; 输入固定为 pad_size, batch 维可变"""
+    if getattr(model, 'packed', False):
+        raise ValueError('the packed forward cannot be traced, export the padded forward instead')
+    with torch.no_grad():
+        traced = torch.jit.trace(model, (example_input(config),))
+    # 词表外的词的编码方式写进文件, Predictor 加载时据此编码输入
+    oov = {'mode': config.oov_mode, 'buckets': config.oov_buckets, 'max_ngrams': config.max_ngrams,
+           'ngram_range': list(config.ngram_range)}
+    traced.save(path, _extra_files={'oov.json': json.dumps(oov)})
+    return traced
+
+
+def to_onnx(model, config, path):
+    if getattr(model, 'packed', False):
+        raise ValueError('the packed forward cannot be exported to ONNX, export the padded forward instead')
+    batch = {0: 'batch'}
+    torch.onnx.export(model, (example_input(config),), path, input_names=['tokens', 'seq_len'],
+                      output_names=['logits'], dynamic_axes={'tokens': batch, 'seq_len': batch, 'logits': batch},
+                      dynamo=False)
+
+
+class OnnxModel(object):
+    """用 onnxruntime 执行 ONNX 模型, 接口与 Model 相同, 可直接传给 evaluate()"""
+
+    def __init__(self, path):
+        import onnxruntime
+        # onnxruntime 的规则优化会把池化前的补零融合进 MaxPool 的 pads(按 -inf 填充), 改变 DPCNN 的结果, 因此关闭
+        self.session = onnxruntime.InferenceSession(path, providers=['CPUExecutionProvider'],
+                                                    disabled_optimizers=['Level1_RuleBasedTransformer'])
+        self.inputs = [i.name for i in self.session.get_inputs()]  # 未使用的输入(如 seq_len)会被导出时删除
+
+    def eval(self):
+        return self
+
+    def __call__(self, x):
+        feeds = dict(zip(['tokens', 'seq_len'], (t.numpy() for t in x)))
+        return torch.from_numpy(self.session.run(None, {name: feeds[name] for name in self.inputs})[0])
+
+
+def measure(config, model, test_iter, n_docs):
+    """在 test 集上用 evaluate() 计算准确率和 loss, 并记录耗时"""
+    with torch.no_grad():
+        model.eval()
+        model(example_input(config))  # 预热
+    start = time.perf_counter()
+    acc, loss = evaluate(config, model, test_iter)
+    elapsed = time.perf_counter() - start
+    return {'acc': float(acc), 'loss': float(loss), 'seconds': elapsed, 'docs_per_sec': n_docs / elapsed}
+
+
+def main(args):
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    predictor = Predictor(args.model, args.dataset, args.ckpt, oov_mode=args.oov)
+    config, model = predictor.config, predictor.model
+    name = config.model_name
+    out = args.out or os.path.dirname(args.ckpt or config.save_path)
+    os.makedirs(out, exist_ok=True)
+
+    test_data, _, _ = load_or_encode_csv(config.test_path, predictor.vocab, config.pad_size,
+                                         predictor.vocab.get(UNK), predictor.vocab.get(PAD),
+                                         config.num_workers, config.cache_path, oov=predictor.oov)
+    test_iter = build_iterator(test_data, config)
+
+    int8 = quantize(model)
+    variants = [('fp32', model, args.ckpt or config.save_path),
+                ('int8', int8, None)]
+    path = os.path.join(out, name + '.ts.pt')
+    variants.append(('fp32-torchscript', to_torchscript(model, config, path), path))
+    path = os.path.join(out, name + '.int8.ts.pt')
+    variants.append(('int8-torchscript', to_torchscript(int8, config, path), path))
+    if args.onnx:
+        path = os.path.join(out, name + '.onnx')
+        to_onnx(model, config, path)
+        try:
+            variants.append(('fp32-onnx', OnnxModel(path), path))
+        except ImportError:
+            print(f"已导出 {path}, 未安装 onnxruntime, 跳过评估")
+
+    report = {'model': name, 'test_path': config.test_path, 'threads': torch.get_num_threads(), 'variants': {}}
+    for variant, m, path in variants:
+        result = measure(config, m, test_iter, len(test_data))
+        if path is not None:
+            result['path'] = path
+            result['size_mb'] = os.path.getsize(path) / 2 ** 20
+        report['variants'][variant] = result
+
+    base = report['variants']['fp32']
+    msg = '{0:<18} Test Acc: {1:>6.2%} ({2:>+6.2%}),  Test Loss: {3:>6.4f},  {4:>8.1f} docs/sec ({5:.2f}x){6}'
+    for variant, result in report['variants'].items():
+        result['acc_delta'] = result['acc'] - base['acc']
+        result['speedup'] = result['docs_per_sec'] / base['docs_per_sec']
+        size = f",  {result['size_mb']:.1f} MB" if 'size_mb' in result else ''
+        print(msg.format(variant, result['acc'], result['acc_delta'], result['loss'],
+                         result['docs_per_sec'], result['speedup'], size))
+    report['int8_safe'] = -report['variants']['int8']['acc_delta'] <= args.max_acc_drop
+    print(f"int8 准确率下降{'不超过' if report['int8_safe'] else '超过'} {args.max_acc_drop:.2%}")
+
+    report_path = os.path.join(out, name + '.export.json')
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"报告========{report_path}")
+
+
+if __name__ == '__main__':
+    main(parser.parse_args())
@@ -1,41 +1,98 @@
+import os
+import mmap
 import numpy as np
 import pickle as pkl
-from gensim.models import KeyedVectors
+from vocabulary import load_vocab
 
 
-# ## 加载预训练词向量
-def load_embed(file):
-    def get_coefs(word, *arr):
-        return word, np.asarray(arr, dtype='float32')
+# ## 词向量文件格式
+def embed_format(embed_path):
+    """.bin 为 word2vec 二进制格式, 其余(.txt/.vec)为每行 "词 v1 v2 ..." 的文本格式"""
+    return 'bin' if embed_path.endswith('.bin') else 'text'
 
-    if file == './fasttext/wiki-news-300d-1M.vec':
-        embeddings_index = dict(get_coefs(*o.split(" ")) for o in open(file, encoding='utf-8') if len(o) > 100)
-    elif file == './GoogleNews-vectors-negative300/GoogleNews-vectors-negative300.bin':
-        model = KeyedVectors.load_word2vec_format(file, binary=True)
-        embeddings_index = {}
-        for word, vector in zip(model.vocab, model.vectors):
-            embeddings_index[word] = vector
-    else:
-        embeddings_index = dict(get_coefs(*o.split(" ")) for o in open(file, encoding='latin'))
 
-    return embeddings_index
+def _scan_text(f, encoding):
+    """逐行扫描文本格式, 产出 (词, 行首偏移); 跳过 fastText .vec 的 "词数 维度" 表头"""
+    offset = f.tell()
+    for lineno, line in enumerate(iter(f.readline, b'')):
+        word = line.split(b' ', 1)[0].decode(encoding, errors='replace')
+        if not (lineno == 0 and len(line.split()) == 2):
+            yield word, offset
+        offset += len(line)
 
 
-ebed = []
+def _scan_bin(mm, encoding):
+    """扫描 word2vec 二进制格式, 产出 (词, 向量起始偏移)"""
+    header_end = mm.find(b'\n')
+    n_words, dim = map(int, mm[:header_end].split())
+    pos = header_end + 1
+    for _ in range(n_words):
+        word_end = mm.find(b' ', pos)
+        yield mm[pos:word_end].strip().decode(encoding, errors='replace'), word_end + 1
+        pos = word_end + 1 + dim * 4
 
-def get_embed(vocab_path, embed_path,dim):
-    vocab = pkl.load(open(vocab_path, 'rb'))
-    embed_glove = load_embed(embed_path)
-    for v in vocab:
-        if v not in embed_glove.keys():
-            ebed.append(np.asarray([0 for i in range(0,dim)], dtype='float32'))
+
+def _bin_dim(mm):
+    return int(mm[:mm.find(b'\n')].split()[1])
+
+
+# ## 词 -> 文件偏移的索引
+def load_index(embed_path, encoding='utf-8'):
+    """读取或建立词向量文件的索引, 索引与文件大小、修改时间绑定, 文件变化后自动重建"""
+    index_path = embed_path + '.index.pkl'
+    stat = os.stat(embed_path)
+    if os.path.exists(index_path):
+        index = pkl.load(open(index_path, 'rb'))
+        if index['size'] == stat.st_size and index['mtime'] == stat.st_mtime_ns:
+            return index['offsets']
+    with open(embed_path, 'rb') as f:
+        if embed_format(embed_path) == 'bin':
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                offsets = dict(_scan_bin(mm, encoding))
+        else:
+            offsets = dict(_scan_text(f, encoding))
+    pkl.dump({'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'offsets': offsets}, open(index_path, 'wb'))
+    return offsets
+
+
+def get_embed(vocab_path, embed_path, dim, encoding='utf-8', use_index=True):
+    """按词表 id 顺序构建 [len(vocab), dim] 的 float32 词向量矩阵, 词向量文件中没有的词为0向量
+
+    use_index=True 时借助索引只读取词表中的词; 否则单次顺序扫描文件, 只解析词表中的词.
+    """
+    vocab = load_vocab(vocab_path)
+    embed = np.zeros((len(vocab), dim), dtype='float32')
+    fmt = embed_format(embed_path)
+    with open(embed_path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if fmt == 'bin' else None
+        if fmt == 'bin' and _bin_dim(mm) != dim:
+            raise ValueError(f'{embed_path} has dim {_bin_dim(mm)}, expected {dim}')
+        if use_index:
+            offsets = load_index(embed_path, encoding)
+            found = ((word, offsets[word]) for word in vocab if word in offsets)
         else:
-            ebed.append(embed_glove[v])
-    return np.asarray(ebed, dtype='float32')
+            found = ((word, offset) for word, offset in (_scan_bin(mm, encoding) if fmt == 'bin'
+                                                           else _scan_text(f, encoding)) if word in vocab)
+        for word, offset in found:
+            if fmt == 'bin':
+                embed[vocab[word]] = np.frombuffer(mm[offset: offset + dim * 4], dtype='float32')
+            else:
+                pos = f.tell()
+                f.seek(offset)
+                vector = f.readline().rstrip().split(b' ')[1:]
+                f.seek(pos)
+                if len(vector) != dim:
+                    raise ValueError(f'{embed_path}: vector of {word!r} has dim {len(vector)}, expected {dim}')
+                embed[vocab[word]] = np.asarray(vector, dtype='float32')
+        if mm is not None:
+            mm.close()
+    return embed
 
 
-vocab_path = './datasets/vocab.pkl'
-embed_path = './glove/glove.6B.300d.txt'
-dim = 300
+if __name__ == "__main__":
+    vocab_path = './datasets/vocab.pkl'
+    embed_path = './glove/glove.6B.300d.txt'
+    dim = 300
 
-np.savez('./datasets/glove.6B.300d.npz',embeddings=get_embed(vocab_path, embed_path, dim))
+    # 不压缩的 .npy, 训练/推理时可直接 mmap (见 utils.load_embedding)
+    np.save('./datasets/glove.6B.300d.npy', get_embed(vocab_path, embed_path, dim))
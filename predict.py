@@ -0,0 +1,165 @@
+# coding: UTF-8
+import sys
+import json
+import time
+import argparse
+from collections import deque
+from importlib import import_module
+import numpy as np
+import torch
+import torch.nn.functional as F
+from utils import UNK, PAD, make_oov
+from preprocess import encode_texts, TextDataset
+from vocabulary import load_vocab
+
+parser = argparse.ArgumentParser(description='English Text Classification - batch inference')
+parser.add_argument('--model', type=str, required=True, help='choose a model: TextRNN, DPCNN')
+parser.add_argument('--dataset', default='./datasets', type=str, help='dataset directory holding class.txt and vocab.pkl')
+parser.add_argument('--ckpt', default=None, type=str, help='checkpoint path, defaults to config.save_path')
+parser.add_argument('--max_tokens', default=32768, type=int, help='token budget (batch rows x padded length) per forward pass')
+parser.add_argument('--chunk', default=10000, type=int, help='number of input lines read per chunk')
+parser.add_argument('--proba', action='store_true', help='also print the probability of the predicted class')
+parser.add_argument('--packed', action='store_true', help='TextRNN only: packed-sequence forward with per-batch trimming')
+parser.add_argument('--oov', default=None, choices=['unk', 'hash', 'subword'], help='out-of-vocabulary encoding the checkpoint was trained with, needed only for checkpoints and TorchScript files that do not record it')
+parser.add_argument('files', nargs='*', help='text files, one document per line; reads stdin when omitted')
+
+
+class Predictor(object):
+    """加载一次 checkpoint 和词表, 对原始文本批量预测
+
+    文本与 build_dataset 使用同一个规范化器编码; 按长度排序后按 token 预算动态组 batch,
+    只有与 pad 无关的模型(TextRNN packed)才把每个 batch 裁剪到最长句子, 否则保持训练时的 pad_size.
+    """
+
+    def __init__(self, model_name, dataset='./datasets', ckpt=None, device='cpu', max_tokens=32768, packed=False,
+                 oov_mode=None):
+        x = import_module(model_name)
+        self.config = x.Config(dataset, 'random')
+        self.config.device = torch.device(device)
+        if packed:
+            self.config.packed = True
+        if oov_mode is not None:
+            self.config.oov_mode = oov_mode
+        self.vocab = load_vocab(self.config.vocab_path)
+        if ckpt is not None and ckpt.endswith('.ts.pt'):
+            # export.py 导出的 TorchScript(可能已 int8 量化), 输入固定为 pad_size
+            self.config.packed = False
+            extra = {'oov.json': ''}
+            self.model = torch.jit.load(ckpt, map_location=self.config.device, _extra_files=extra)
+            if extra['oov.json']:
+                saved = json.loads(extra['oov.json'])
+                self.config.oov_buckets = saved.pop('buckets')
+                self._use_saved_oov(saved, oov_mode)
+        else:
+            state = torch.load(ckpt or self.config.save_path, map_location=self.config.device)
+            # 词向量维度以 checkpoint 为准, 不需要再读取预训练词向量文件
+            self.config.n_vocab, self.config.embed = state['embedding.weight'].shape
+            self._set_oov(state, oov_mode)
+            self.model = x.Model(self.config).to(self.config.device)
+            self.model.load_state_dict(state)
+        self.model.eval()
+        self.oov = make_oov(self.config)
+        self.max_tokens = max_tokens
+        self.trim = getattr(self.config, 'packed', False)
+        self.latencies = deque(maxlen=100000)  # 最近每次前向的耗时(秒)
+
+    def _set_oov(self, state, oov_mode):
+        """词表外的词的编码方式以 checkpoint 为准, 较早的 checkpoint 没有保存时才需要 oov_mode 指定"""
+        if 'oov_embedding.bag.weight' not in state:
+            if oov_mode not in (None, 'unk'):
+                raise ValueError(f'the checkpoint has no OOV bucket embeddings, it was trained with oov_mode unk, '
+                                 f'not {oov_mode}')
+            self.config.oov_mode = 'unk'
+            return
+        self.config.oov_buckets = state['oov_embedding.bag.weight'].shape[0] - 1
+        saved = state.get('oov_embedding._extra_state')
+        if saved is None:
+            if self.config.oov_mode == 'unk':
+                raise ValueError('the checkpoint has OOV bucket embeddings, set oov_mode to hash or subword')
+            return
+        self._use_saved_oov(saved, oov_mode)
+
+    def _use_saved_oov(self, saved, oov_mode):
+        if oov_mode is not None and oov_mode != saved['mode']:
+            raise ValueError(f"the checkpoint was trained with oov_mode {saved['mode']}, not {oov_mode}")
+        self.config.oov_mode = saved['mode']
+        self.config.max_ngrams = saved['max_ngrams']
+        self.config.ngram_range = tuple(saved['ngram_range'])
+
+    def encode(self, texts):
+        tokens, seq_len, _ = encode_texts(list(texts), self.vocab, self.config.pad_size,
+                                          self.vocab.get(UNK), self.vocab.get(PAD), oov=self.oov)
+        return TextDataset(tokens, np.zeros(len(seq_len), dtype=np.int64), seq_len)
+
+    def _batches(self, dataset):
+        """按长度排序, 每个 batch 的行数 x pad 后长度不超过 max_tokens"""
+        order = np.argsort(dataset.seq_len, kind='stable')
+        start = 0
+        while start < len(order):
+            width = self.config.pad_size
+            rows = max(self.max_tokens // width, 1)
+            if self.trim:
+                # 排序后 batch 内最长的是最后一条, 逐步放大直到超过预算
+                rows = 1
+                while start + rows < len(order) and \
+                        (rows + 1) * max(int(dataset.seq_len[order[start + rows]]), 1) <= self.max_tokens:
+                    rows += 1
+            yield order[start: start + rows]
+            start += rows
+
+    def predict_proba(self, texts):
+        dataset = self.encode(texts)
+        probs = np.zeros((len(dataset), self.config.num_classes), dtype=np.float32)
+        with torch.inference_mode():
+            for index in self._batches(dataset):
+                batch = dataset[index]
+                tokens = batch.tokens
+                if self.trim:
+                    tokens = tokens[:, :max(int(batch.seq_len.max()), 1)]
+                start = time.time()
+                x = torch.from_numpy(tokens).to(self.config.device).long()
+                seq_len = torch.from_numpy(batch.seq_len).to(self.config.device)
+                outputs = self.model((x, seq_len))
+                probs[index] = F.softmax(outputs, dim=1).cpu().numpy()
+                self.latencies.append(time.time() - start)
+        return probs
+
+    def predict(self, texts):
+        probs = self.predict_proba(texts)
+        labels = probs.argmax(1)
+        return [self.config.class_list[i] for i in labels], probs[np.arange(len(labels)), labels]
+
+
+def read_chunks(files, chunk):
+    streams = [open(f, encoding='utf-8') for f in files] if files else [sys.stdin]
+    lines = []
+    for stream in streams:
+        for line in stream:
+            lines.append(line.rstrip('\n'))
+            if len(lines) >= chunk:
+                yield lines
+                lines = []
+    if lines:
+        yield lines
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    predictor = Predictor(args.model, args.dataset, args.ckpt, max_tokens=args.max_tokens, packed=args.packed,
+                          oov_mode=args.oov)
+    start_time = time.time()
+    n_docs = 0
+    for texts in read_chunks(args.files, args.chunk):
+        labels, probs = predictor.predict(texts)
+        if args.proba:
+            sys.stdout.write(''.join(f'{label}\t{p:.4f}\n' for label, p in zip(labels, probs)))
+        else:
+            sys.stdout.write(''.join(f'{label}\n' for label in labels))
+        n_docs += len(texts)
+    elapsed = time.time() - start_time
+    latencies = np.asarray(predictor.latencies) * 1000
+    if n_docs:
+        print(f"文本数========{n_docs}", file=sys.stderr)
+        print(f"吞吐========{n_docs / elapsed:.1f} docs/sec", file=sys.stderr)
+        print(f"batch延迟========p50 {np.percentile(latencies, 50):.1f} ms, p99 {np.percentile(latencies, 99):.1f} ms"
+              f" ({len(latencies)} batches)", file=sys.stderr)
@@ -0,0 +1,266 @@
+# coding: UTF-8
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+from multiprocessing import Pool
+from tool import TextNormalizer
+from vocabulary import Vocab
+
+normalizer = TextNormalizer()  # 文本规范化器，建词表与编码共用
+_state = {}  # 子进程内的词表等状态，由 _init_worker 设置
+CACHE_VERSION = 2  # 缓存格式版本，编码逻辑变化时加一使旧缓存失效
+
+
+def _init_worker(vocab, pad_size, unk_id, oov=None):
+    _state['vocab'] = vocab if isinstance(vocab, Vocab) else Vocab.from_dict(vocab)
+    _state['pad_size'] = pad_size
+    _state['unk_id'] = unk_id
+    _state['oov'] = oov
+
+
+def _encode_chunk(texts):
+    """规范化并编码一块文本，返回(截断后的扁平 id 数组, 截断前的长度数组)"""
+    pad_size = _state['pad_size']
+    words, lengths = [], []
+    for text in texts:
+        token = normalizer.tokenize(text)
+        lengths.append(len(token))
+        words.extend(token[:pad_size] if pad_size else token)
+    # 整块的词一次查表
+    return _state['vocab'].encode(words, _state['unk_id'], _state['oov']), np.asarray(lengths, dtype=np.int64)
+
+
+class TextDataset(object):
+    """连续存储的数据集: tokens [n, pad_size] int32, labels [n] int64, seq_len [n] int64"""
+
+    def __init__(self, tokens, labels, seq_len):
+        self.tokens = tokens
+        self.labels = labels
+        self.seq_len = seq_len
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, index):
+        # 切片得到的是原数组的视图
+        return TextDataset(self.tokens[index], self.labels[index], self.seq_len[index])
+
+    def permutation(self, rng):
+        return rng.permutation(len(self))
+
+
+class ShardedDataset(object):
+    """由多个磁盘分片(mmap 的 TextDataset)拼成的数据集, 按全局下标访问, 只有被访问的分片页会进入内存"""
+
+    def __init__(self, shards):
+        self.shards = shards
+        self.offsets = np.cumsum([0] + [len(shard) for shard in shards])
+        self._seq_len = None
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    @property
+    def seq_len(self):
+        if self._seq_len is None:
+            self._seq_len = np.concatenate([np.asarray(shard.seq_len) for shard in self.shards])
+        return self._seq_len
+
+    @property
+    def labels(self):
+        return np.concatenate([np.asarray(shard.labels) for shard in self.shards])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if start >= stop:
+                return self.shards[0][0:0]
+            shard_id = np.searchsorted(self.offsets, start, side='right') - 1
+            if step == 1 and stop <= self.offsets[shard_id + 1]:
+                # 落在同一个分片内的连续切片直接返回视图
+                offset = self.offsets[shard_id]
+                return self.shards[shard_id][start - offset: stop - offset]
+            index = np.arange(start, stop, step)
+        shard_ids = np.searchsorted(self.offsets, index, side='right') - 1
+        first = self.shards[0]
+        tokens = np.empty((len(index),) + first.tokens.shape[1:], dtype=first.tokens.dtype)
+        labels = np.empty(len(index), dtype=first.labels.dtype)
+        seq_len = np.empty(len(index), dtype=first.seq_len.dtype)
+        for shard_id in np.unique(shard_ids):
+            mask = shard_ids == shard_id
+            part = self.shards[shard_id][index[mask] - self.offsets[shard_id]]
+            tokens[mask], labels[mask], seq_len[mask] = part.tokens, part.labels, part.seq_len
+        return TextDataset(tokens, labels, seq_len)
+
+    def permutation(self, rng):
+        """打乱分片顺序, 再在分片内打乱, 保持读取的局部性"""
+        return np.concatenate([self.offsets[i] + rng.permutation(len(self.shards[i]))
+                               for i in rng.permutation(len(self.shards))])
+
+
+def encode_texts(texts, vocab, pad_size, unk_id, pad_id, num_workers=1, chunk_size=10000, pool=None, oov=None):
+    """把文本切块后在进程池中规范化、编码
+
+    各块按原顺序合并，结果与进程数无关。可传入已创建的进程池(由 make_pool 创建)重复使用。
+    返回 tokens [n, pad_size] int32 (subword 模式为 [n, pad_size, max_ngrams]), seq_len [n] (超过pad_size的设为pad_size),
+    截断前的总词数
+    """
+    chunks = [texts[i: i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    if pool is not None:
+        results = pool.map(_encode_chunk, chunks)
+    elif num_workers > 1 and len(chunks) > 1:
+        with make_pool(vocab, pad_size, unk_id, num_workers, oov) as pool:
+            results = pool.map(_encode_chunk, chunks)
+    else:
+        _init_worker(vocab, pad_size, unk_id, oov)
+        results = [_encode_chunk(chunk) for chunk in chunks]
+
+    token_shape = oov.token_shape if oov is not None else ()
+    flat = np.concatenate([r[0] for r in results]) if results else np.zeros((0,) + token_shape, dtype=np.int32)
+    lengths = np.concatenate([r[1] for r in results]) if results else np.zeros(0, dtype=np.int64)
+    width = pad_size if pad_size else int(lengths.max(initial=0))
+    seq_len = np.minimum(lengths, width)
+    # 按行写入: 每行前 seq_len 个位置是词 id，其余为 PAD
+    tokens = np.full((len(texts), width) + token_shape, pad_id, dtype=np.int32)
+    tokens[np.arange(width) < seq_len[:, None]] = flat
+    return tokens, seq_len, int(lengths.sum())
+
+
+def make_pool(vocab, pad_size, unk_id, num_workers, oov=None):
+    return Pool(num_workers, initializer=_init_worker, initargs=(vocab, pad_size, unk_id, oov))
+
+
+def encode_csv(path, vocab, pad_size, unk_id, pad_id, num_workers=1, chunk_size=10000, oov=None):
+    """读取 csv 并编码，返回 tokens, labels, seq_len, 总词数, 标签集合"""
+    df = pd.read_csv(path, encoding='utf-8', sep=',')
+    texts = df['Text'].fillna('').tolist()
+    tokens, seq_len, count = encode_texts(texts, vocab, pad_size, unk_id, pad_id, num_workers, chunk_size, oov=oov)
+    # 标签 id 为排序后标签集合中的下标
+    label_values, labels = np.unique(df['Starts'].values, return_inverse=True)
+    return tokens, labels.astype(np.int64), seq_len, count, label_values
+
+
+def iter_encode_csv(path, vocab, pad_size, unk_id, pad_id, num_workers=1, shard_size=100000, oov=None):
+    """分块读取 csv 并逐块编码, 内存占用与 shard_size 成正比
+
+    先只读标签列得到完整的标签集合, 保证标签 id 与一次性读取时一致。
+    依次产出 (tokens, labels, seq_len, 截断前的总词数), 最后返回标签集合。
+    """
+    if not pad_size:
+        raise ValueError('streaming mode needs a fixed pad_size')
+    uniques = [np.unique(chunk['Starts'].values)
+               for chunk in pd.read_csv(path, encoding='utf-8', sep=',', usecols=['Starts'], chunksize=shard_size)]
+    label_values = np.unique(np.concatenate(uniques))
+    pool = make_pool(vocab, pad_size, unk_id, num_workers, oov) if num_workers > 1 else None
+    try:
+        for df in pd.read_csv(path, encoding='utf-8', sep=',', chunksize=shard_size):
+            texts = df['Text'].fillna('').tolist()
+            tokens, seq_len, count = encode_texts(texts, vocab, pad_size, unk_id, pad_id, pool=pool, oov=oov)
+            labels = np.searchsorted(label_values, df['Starts'].values).astype(np.int64)
+            yield tokens, labels, seq_len, count
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return label_values
+
+
+def file_digest(path, block_size=1 << 20):
+    """文件内容的 sha1"""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cache_key(path, vocab, pad_size, oov=None):
+    """由 csv 内容、词表、pad_size、规范化规则和词表外的词的编码方式共同决定的缓存键"""
+    h = hashlib.sha1()
+    h.update(f'v{CACHE_VERSION}|{pad_size}|'.encode('utf-8'))
+    h.update(file_digest(path).encode('utf-8'))
+    h.update(repr(sorted(vocab.items())).encode('utf-8'))
+    h.update(normalizer.fingerprint().encode('utf-8'))
+    if oov is not None:
+        h.update(oov.fingerprint().encode('utf-8'))
+    return h.hexdigest()[:16]
+
+
+def _save_shard(directory, index, tokens, labels, seq_len):
+    np.save(os.path.join(directory, f'tokens-{index:05d}.npy'), tokens)
+    np.save(os.path.join(directory, f'labels-{index:05d}.npy'), labels)
+    np.save(os.path.join(directory, f'seq_len-{index:05d}.npy'), seq_len)
+
+
+def _load_shard(directory, index):
+    # 以写时复制的 mmap 方式读取, 数组可写(torch.from_numpy 需要)但不会改动文件
+    return TextDataset(np.load(os.path.join(directory, f'tokens-{index:05d}.npy'), mmap_mode='c'),
+                       np.load(os.path.join(directory, f'labels-{index:05d}.npy'), mmap_mode='c'),
+                       np.load(os.path.join(directory, f'seq_len-{index:05d}.npy'), mmap_mode='c'))
+
+
+def load_or_encode_csv(path, vocab, pad_size, unk_id, pad_id, num_workers=1, cache_dir=None, stream=False,
+                       shard_size=100000, oov=None):
+    """带缓存的 encode_csv, 返回 (数据集, 截断前的总词数, 标签集合)
+
+    缓存为一组 .npy 分片加 meta.json, 以 mmap 方式读取。stream=True 时分块读取 csv 并逐块写分片,
+    返回 ShardedDataset, 用于大于内存的数据集。
+    """
+    if not cache_dir:
+        if stream:
+            raise ValueError('streaming mode needs a cache_path to write shards to')
+        tokens, labels, seq_len, count, label_values = encode_csv(path, vocab, pad_size, unk_id, pad_id, num_workers,
+                                                                  oov=oov)
+        return TextDataset(tokens, labels, seq_len), count, label_values
+    name = os.path.splitext(os.path.basename(path))[0]
+    cache = os.path.join(cache_dir, f'{name}-{cache_key(path, vocab, pad_size, oov)}')
+    if os.path.exists(os.path.join(cache, 'meta.json')):
+        print(f"加载缓存========{cache}")
+    else:
+        # 先写临时目录再重命名，中途中断或多进程同时写都不会留下不完整的缓存
+        tmp = f'{cache}.tmp{os.getpid()}'
+        os.makedirs(tmp, exist_ok=True)
+        try:
+            shards, count = [], 0
+            if stream:
+                encoder = iter_encode_csv(path, vocab, pad_size, unk_id, pad_id, num_workers, shard_size, oov)
+                while True:
+                    try:
+                        tokens, labels, seq_len, n_words = next(encoder)
+                    except StopIteration as stop:
+                        label_values = stop.value
+                        break
+                    _save_shard(tmp, len(shards), tokens, labels, seq_len)
+                    shards.append(len(labels))
+                    count += n_words
+                if not shards:
+                    # 只有表头的 csv: 存一个空分片, 与非流式读取一样得到空数据集
+                    token_shape = oov.token_shape if oov is not None else ()
+                    _save_shard(tmp, 0, np.zeros((0, pad_size) + token_shape, dtype=np.int32),
+                                np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+                    shards.append(0)
+            else:
+                tokens, labels, seq_len, count, label_values = encode_csv(path, vocab, pad_size, unk_id, pad_id,
+                                                                          num_workers, oov=oov)
+                _save_shard(tmp, 0, tokens, labels, seq_len)
+                shards.append(len(labels))
+            with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+                json.dump({'path': path, 'pad_size': pad_size, 'count': count, 'shards': shards,
+                           'label_values': label_values.tolist()}, f, ensure_ascii=False)
+        except BaseException:
+            # 编码失败或被中断时删除写了一半的临时目录
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        try:
+            os.replace(tmp, cache)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    with open(os.path.join(cache, 'meta.json'), encoding='utf-8') as f:
+        meta = json.load(f)
+    shards = [_load_shard(cache, i) for i in range(len(meta['shards']))]
+    dataset = shards[0] if len(shards) == 1 and not stream else ShardedDataset(shards)
+    return dataset, meta['count'], np.asarray(meta['label_values'])
@@ -0,0 +1,141 @@
+# coding: UTF-8
+import json
+import time
+import resource
+from contextlib import contextmanager, nullcontext
+import numpy as np
+import torch
+
+
+class Profiler(object):
+    """训练/评估的分阶段计时
+
+    section(name) 统计一段代码的耗时, iterate(iterable, name) 统计每次取 batch 的耗时(DatasetIterater 的
+    切片和 _to_tensor), step(batch_size) 在每个训练步结束时记录该步的总耗时. 在 cuda 上计时前后会同步.
+    trace=(start, steps) 时用 torch.profiler 记录第 start 步之后 steps 步的 trace, 写到 trace_dir, 可用 tensorboard 查看.
+    enabled=False 时所有方法都不做任何事, 不影响训练速度.
+    """
+
+    def __init__(self, enabled=False, device='cpu', trace=None, trace_dir=None):
+        self.enabled = enabled
+        self.cuda = enabled and torch.device(device).type == 'cuda'
+        self.totals = {}  # 阶段 -> 累计秒数
+        self.counts = {}
+        self.step_times = []
+        self.samples = 0
+        self.logged = {}  # 上一次 log() 时的累计值, 用于计算区间平均
+        self.last_step = None
+        self.start = time.perf_counter()
+        self.torch_profiler = None
+        if enabled and trace is not None:
+            start, steps = trace
+            self.torch_profiler = torch.profiler.profile(
+                schedule=torch.profiler.schedule(skip_first=start, wait=0, warmup=1, active=steps, repeat=1),
+                on_trace_ready=torch.profiler.tensorboard_trace_handler(trace_dir),
+                record_shapes=True, profile_memory=True)
+            self.torch_profiler.start()
+
+    def _now(self):
+        if self.cuda:
+            torch.cuda.synchronize()
+        return time.perf_counter()
+
+    def _add(self, name, seconds):
+        self.totals[name] = self.totals.get(name, 0.) + seconds
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    @contextmanager
+    def _section(self, name):
+        with torch.profiler.record_function(name):
+            start = self._now()
+            yield
+            self._add(name, self._now() - start)
+
+    def section(self, name):
+        return self._section(name) if self.enabled else nullcontext()
+
+    def iterate(self, iterable, name='data'):
+        if not self.enabled:
+            return iterable
+        return self._iterate(iterable, name)
+
+    def _iterate(self, iterable, name):
+        it = iter(iterable)
+        while True:
+            with self._section(name):
+                try:
+                    batch = next(it)
+                except StopIteration:
+                    return
+            yield batch
+
+    def step(self, batch_size):
+        """一个训练步(取 batch、前向、反向、更新参数)结束, 耗时从上一步结束或 reset_clock() 算起"""
+        if not self.enabled:
+            return
+        now = self._now()
+        if self.last_step is not None:
+            self.step_times.append(now - self.last_step)
+            self.samples += batch_size
+        self.last_step = now
+        if self.torch_profiler is not None:
+            self.torch_profiler.step()
+
+    def reset_clock(self):
+        """评估、写 checkpoint 等不属于训练步的时间不计入下一步的耗时"""
+        if self.enabled:
+            self.last_step = self._now()
+
+    @staticmethod
+    def peak_memory():
+        memory = {'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+        if torch.cuda.is_available():
+            memory['peak_cuda_mb'] = torch.cuda.max_memory_allocated() / 2 ** 20
+        return memory
+
+    def log(self, writer, step):
+        """把上次 log 以来各阶段每次的平均耗时(ms)、每步耗时、吞吐和峰值内存写入 tensorboard"""
+        if not self.enabled or writer is None:
+            return
+        for name, total in self.totals.items():
+            last_total, last_count = self.logged.get(name, (0., 0))
+            if self.counts[name] > last_count:
+                writer.add_scalar(f"profile/{name}_ms", (total - last_total) / (self.counts[name] - last_count) * 1000, step)
+            self.logged[name] = (total, self.counts[name])
+        last_steps, last_samples = self.logged.get('steps', (0, 0))
+        recent = self.step_times[last_steps:]
+        if recent:
+            writer.add_scalar("profile/step_ms", np.mean(recent) * 1000, step)
+            writer.add_scalar("profile/samples_per_sec", (self.samples - last_samples) / np.sum(recent), step)
+        self.logged['steps'] = (len(self.step_times), self.samples)
+        for name, value in self.peak_memory().items():
+            writer.add_scalar(f"profile/{name}", value, step)
+
+    def summary(self):
+        """fraction 为该阶段占 Profiler 创建以来总时间的比例, 嵌套的阶段(如 evaluate/forward 属于 evaluate)会重复计入"""
+        steps = np.asarray(self.step_times)
+        wall = time.perf_counter() - self.start
+        return {
+            'wall_sec': wall,
+            'steps': len(steps),
+            'samples_per_sec': self.samples / steps.sum() if len(steps) else 0.,
+            'step_ms': {k: float(v) * 1000 for k, v in zip(
+                ('mean', 'p50', 'p90', 'p99', 'max'),
+                (steps.mean(), *np.percentile(steps, (50, 90, 99)), steps.max()))} if len(steps) else {},
+            'sections': {name: {'total_sec': t, 'count': self.counts[name], 'mean_ms': t / self.counts[name] * 1000,
+                                'fraction': t / wall} for name, t in self.totals.items()},
+            **self.peak_memory(),
+        }
+
+    def close(self, path=None):
+        """结束 torch.profiler 并把汇总写成 json"""
+        if not self.enabled:
+            return None
+        if self.torch_profiler is not None:
+            self.torch_profiler.stop()
+            self.torch_profiler = None
+        summary = self.summary()
+        if path is not None:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(summary, f, indent=2)
+        return summary
@@ -1,22 +1,37 @@
 # coding: UTF-8
+import os
 import time
 import torch
+import torch.distributed as dist
 import numpy as np
 from train_eval import train, init_network
 from importlib import import_module
 import argparse
-from utils import build_dataset, build_iterator, get_time_dif
+from utils import build_dataset, build_iterator, get_time_dif, stratified_subsample
 import random
 
 parser = argparse.ArgumentParser(description='English Text Classification')
 parser.add_argument('--model', type=str, required=True, help='choose a model: TextCNN, TextRNN, TextRCNN, DPCNN')
 parser.add_argument('--embedding', default='pre_trained', type=str, help='random or pre_trained')
+parser.add_argument('--num_workers', default=None, type=int, help='number of preprocessing processes')
+parser.add_argument('--bucket', action='store_true', help='shuffle and batch by length buckets, padding each batch to its longest text')
+parser.add_argument('--prefetch', default=None, type=int, help='number of batches to prepare ahead in background threads')
+parser.add_argument('--stream', action='store_true', help='read the CSVs in chunks into on-disk shards (datasets larger than RAM)')
+parser.add_argument('--eval_subsample', default=None, type=int, help='size of the fixed stratified dev subset used for frequent evaluation, 0 for the full dev set')
+parser.add_argument('--resume', action='store_true', help='continue from the last full training state in config.state_path')
+parser.add_argument('--bf16', action='store_true', help='bfloat16 autocast for the forward pass (fp32 weights)')
+parser.add_argument('--threads', default=None, type=int, help='torch intra-op threads')
+parser.add_argument('--interop_threads', default=None, type=int, help='torch inter-op threads')
+parser.add_argument('--profile', action='store_true', help='time data loading, forward, backward, optimizer, evaluation and checkpoint I/O')
+parser.add_argument('--profile_trace', default=None, type=int, nargs=2, metavar=('START', 'STEPS'), help='also record a torch.profiler trace of STEPS steps after step START')
+parser.add_argument('--oov', default=None, choices=['unk', 'hash', 'subword'], help='encode out-of-vocabulary words as <UNK>, hashed buckets, or hashed character n-grams')
+parser.add_argument('--oov_buckets', default=None, type=int, help='number of hash buckets for --oov hash/subword')
 args = parser.parse_args()
 
 
 if __name__ == '__main__':
     dataset = './datasets'
-    embedding = './datasets/glove.6B.300d.npz'
+    embedding = './datasets/glove.6B.300d.npy'
     if args.embedding == 'random':
         embedding = 'random'
 
@@ -24,21 +39,65 @@ if __name__ == '__main__':
 
     x = import_module(model_name)
     config = x.Config(dataset, embedding)
-    random.seed(1)
+    if args.num_workers is not None:
+        config.num_workers = args.num_workers
+    if args.bucket:
+        config.bucket_sampler = True
+    if args.prefetch is not None:
+        config.prefetch = args.prefetch
+    if args.stream:
+        config.stream = True
+    if args.oov is not None:
+        config.oov_mode = args.oov
+    if args.oov_buckets is not None:
+        config.oov_buckets = args.oov_buckets
+    if args.eval_subsample is not None:
+        config.eval_subsample = args.eval_subsample
+    if args.bf16:
+        config.bf16 = True
+    if args.profile or args.profile_trace:
+        config.profile = True
+    if args.profile_trace:
+        config.profile_trace = tuple(args.profile_trace)
+    if args.threads is not None:
+        config.num_threads = args.threads
+    if args.interop_threads is not None:
+        config.num_interop_threads = args.interop_threads
+    if int(os.environ.get('WORLD_SIZE', 1)) > 1:
+        # 由 torchrun --nproc_per_node N run.py ... 启动的多进程数据并行训练
+        dist.init_process_group(config.dist_backend)
+        config.rank, config.world_size = dist.get_rank(), dist.get_world_size()
+        if config.dist_backend == 'gloo':
+            config.device = torch.device('cpu')
+        if config.num_threads == 0:
+            # 同一台机器上的进程平分 cpu 核
+            config.num_threads = max(os.cpu_count() // int(os.environ.get('LOCAL_WORLD_SIZE', config.world_size)), 1)
+    if config.num_threads > 0:
+        torch.set_num_threads(config.num_threads)
+    if config.num_interop_threads > 0:
+        torch.set_num_interop_threads(config.num_interop_threads)
+    # 各 rank 的 dropout 等随机数不同; 初始参数由 DDP 从 rank 0 广播, batch 顺序由 config.seed 决定
+    random.seed(config.seed + config.rank)
 
-    np.random.seed(1)
+    np.random.seed(config.seed + config.rank)
 
-    torch.manual_seed(1)
+    torch.manual_seed(config.seed + config.rank)
 
-    torch.cuda.manual_seed_all(1)
+    torch.cuda.manual_seed_all(config.seed + config.rank)
     torch.backends.cudnn.deterministic = True  # 保证每次结果一样
 
     start_time = time.time()
     print("Loading data...")
+    if config.rank != 0:
+        dist.barrier()  # 等 rank 0 建好词表和缓存, 其余 rank 直接读取
     vocab, train_data, dev_data, test_data = build_dataset(config)
-    train_iter = build_iterator(train_data, config)
+    if config.rank == 0 and config.world_size > 1:
+        dist.barrier()
+    train_iter = build_iterator(train_data, config, shuffle=config.bucket_sampler, even=True)
     dev_iter = build_iterator(dev_data, config)
     test_iter = build_iterator(test_data, config)
+    dev_sample_iter = build_iterator(stratified_subsample(dev_data, config.eval_subsample, config.seed), config)\
+        if config.eval_subsample > 0 else None
     time_dif = get_time_dif(start_time)
     print("Time usage:", time_dif)
     # train
@@ -51,4 +110,6 @@ if __name__ == '__main__':
     if model_name != 'Transformer':
         init_network(model)
     print(model.parameters)
-    train(config, model, train_iter, dev_iter, test_iter)
\ No newline at end of file
+    train(config, model, train_iter, dev_iter, test_iter, dev_sample_iter, resume=args.resume)
+    if config.world_size > 1:
+        dist.destroy_process_group()
\ No newline at end of file
@@ -0,0 +1,160 @@
+# coding: UTF-8
+import json
+import time
+import asyncio
+import argparse
+from collections import deque
+import numpy as np
+from predict import Predictor
+
+parser = argparse.ArgumentParser(description='English Text Classification - HTTP prediction server')
+parser.add_argument('--model', type=str, required=True, help='choose a model: TextRNN, DPCNN')
+parser.add_argument('--dataset', default='./datasets', type=str, help='dataset directory holding class.txt and vocab.pkl')
+parser.add_argument('--ckpt', default=None, type=str, help='checkpoint path, defaults to config.save_path')
+parser.add_argument('--packed', action='store_true', help='TextRNN only: packed-sequence forward with per-batch trimming')
+parser.add_argument('--oov', default=None, choices=['unk', 'hash', 'subword'], help='out-of-vocabulary encoding the checkpoint was trained with, needed only for checkpoints and TorchScript files that do not record it')
+parser.add_argument('--host', default='127.0.0.1', type=str)
+parser.add_argument('--port', default=8000, type=int)
+parser.add_argument('--max_batch_size', default=64, type=int, help='max texts coalesced into one forward pass')
+parser.add_argument('--max_wait_ms', default=5., type=float, help='max time the first queued text waits for a batch to fill')
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           500: 'Internal Server Error'}
+
+
+class MicroBatcher(object):
+    """把并发请求中的文本合并成 micro-batch, 每个 batch 只做一次前向
+
+    第一条文本入队后最多等待 max_wait 秒或凑满 max_batch_size 条; 前向在单独的线程中执行, 不阻塞事件循环.
+    """
+
+    def __init__(self, predictor, max_batch_size=64, max_wait=0.005):
+        self.predictor = predictor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue()
+        self.batch_sizes = {}  # batch 大小(按2的幂分桶) -> 次数
+        self.latencies = deque(maxlen=10000)  # 最近请求的耗时(秒)
+        self.n_requests = 0
+        self.n_texts = 0
+
+    async def predict(self, texts):
+        loop = asyncio.get_running_loop()
+        start = time.time()
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            self.queue.put_nowait((text, future))
+            futures.append(future)
+        results = await asyncio.gather(*futures)
+        self.latencies.append(time.time() - start)
+        self.n_requests += 1
+        self.n_texts += len(texts)
+        return results
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            bucket = 1 << (len(batch) - 1).bit_length()
+            self.batch_sizes[bucket] = self.batch_sizes.get(bucket, 0) + 1
+            try:
+                probs = await loop.run_in_executor(None, self.predictor.predict_proba, [t for t, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), prob in zip(batch, probs):
+                if not future.done():
+                    label = int(prob.argmax())
+                    future.set_result((self.predictor.config.class_list[label], float(prob[label])))
+
+    def metrics(self):
+        latencies = np.asarray(self.latencies) * 1000
+        return {
+            'queue_depth': self.queue.qsize(),
+            'requests': self.n_requests,
+            'texts': self.n_texts,
+            'batch_size_histogram': {f'<={k}': v for k, v in sorted(self.batch_sizes.items())},
+            'latency_ms': {f'p{q}': float(np.percentile(latencies, q)) for q in (50, 90, 99)} if len(latencies) else {},
+        }
+
+
+async def handle(batcher, reader, writer):
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            method, path, _ = request_line.decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                key, _, value = line.decode('latin-1').partition(':')
+                headers[key.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+            status, payload = 200, None
+            if path == '/metrics':
+                payload = batcher.metrics()
+            elif path != '/predict':
+                status, payload = 404, {'error': 'not found'}
+            elif method != 'POST':
+                status, payload = 405, {'error': 'use POST'}
+            else:
+                try:
+                    request = json.loads(body)
+                    single = 'text' in request
+                    texts = [request['text']] if single else request['texts']
+                    if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+                        raise ValueError('text must be a string and texts a list of strings')
+                except (ValueError, KeyError, TypeError) as e:
+                    status, payload = 400, {'error': f'expected {{"text": str}} or {{"texts": [str]}}: {e}'}
+                else:
+                    try:
+                        results = await batcher.predict(texts)
+                    except Exception as e:
+                        status, payload = 500, {'error': repr(e)}
+                    else:
+                        predictions = [{'label': label, 'prob': prob} for label, prob in results]
+                        payload = predictions[0] if single else {'predictions': predictions}
+
+            data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            writer.write(f'HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\n'
+                         f'Content-Length: {len(data)}\r\n\r\n'.encode('latin-1') + data)
+            await writer.drain()
+            if headers.get('connection', '').lower() == 'close':
+                break
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def main(args):
+    predictor = Predictor(args.model, args.dataset, args.ckpt, packed=args.packed, oov_mode=args.oov)
+    batcher = MicroBatcher(predictor, args.max_batch_size, args.max_wait_ms / 1000)
+    batch_task = asyncio.ensure_future(batcher.run())
+    server = await asyncio.start_server(lambda r, w: handle(batcher, r, w), args.host, args.port)
+    print(f"serving {args.model} on http://{args.host}:{args.port} (POST /predict, GET /metrics)")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batch_task.cancel()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,72 @@
+# coding: UTF-8
+"""最初版本的文本清洗、建词表和编码(逐条 Python 循环), 作为各项优化结果一致性的参照, 不随源码修改"""
+import pandas as pd
+from tool import CONTRACTION_MAPPING
+
+UNK, PAD = '<UNK>', '<PAD>'
+PUNCT = "/-'?!.,#$%\'()*+-/:;<=>@[\\]^_`{|}~" + '""“”’' + '∞θ÷α•à−β∅³π‘₹´°£€\×™√²—–&'
+PUNCT_MAPPING = {"‘": "'", "₹": "e", "´": "'", "°": "", "€": "e", "™": "tm", "√": " sqrt ", "×": "x", "²": "2",
+                 "—": "-", "–": "-", "’": "'", "_": "-", "`": "'", '“': '"', '”': '"', '“': '"', "£": "e",
+                 '∞': 'infinity', 'θ': 'theta', '÷': '/', 'α': 'alpha', '•': '.', 'à': 'a', '−': '-', 'β': 'beta',
+                 '∅': '', '³': '3', 'π': 'pi', }
+
+
+def clean_special_chars(text, punct, mapping):
+    for p in mapping:
+        text = text.replace(p, mapping[p])
+    for p in punct:
+        text = text.replace(p, f' {p} ')
+    specials = {'​': ' ', '…': ' ... ', '﻿': '', 'करना': '', 'है': ''}
+    for s in specials:
+        text = text.replace(s, specials[s])
+    return text
+
+
+def clean_contractions(text, mapping):
+    specials = ["’", "‘", "´", "`"]
+    for s in specials:
+        text = text.replace(s, "'")
+    text = ' '.join([mapping[t] if t in mapping else t for t in text.split(" ")])
+    return text
+
+
+def normalize(text):
+    text = clean_contractions(text.lower(), CONTRACTION_MAPPING)
+    return clean_special_chars(text, PUNCT, PUNCT_MAPPING)
+
+
+def read_sentences(path):
+    df = pd.read_csv(path, encoding='utf-8', sep=',')
+    df['Text'] = df['Text'].fillna('')
+    return [normalize(text).split() for text in df['Text']], df['Starts']
+
+
+def build_vocab(path, max_size, min_freq=1):
+    vocab_dic = {}
+    for sentence in read_sentences(path)[0]:
+        for word in sentence:
+            try:
+                vocab_dic[word] += 1
+            except KeyError:
+                vocab_dic[word] = 1
+    vocab_list = sorted([_ for _ in vocab_dic.items() if _[1] >= min_freq], key=lambda x: x[1], reverse=True)[:max_size]
+    vocab_dic = {word_count[0]: idx for idx, word_count in enumerate(vocab_list)}
+    vocab_dic.update({UNK: len(vocab_dic), PAD: len(vocab_dic) + 1})
+    return vocab_dic
+
+
+def load_dataset(path, vocab, pad_size):
+    """[(词 id 列表, 标签下标, seq_len)]"""
+    sentences, labels = read_sentences(path)
+    labels_id = sorted(set(labels))
+    contents = []
+    for i, token in enumerate(sentences):
+        seq_len = len(token)
+        if pad_size:
+            if len(token) < pad_size:
+                token.extend([PAD] * (pad_size - len(token)))
+            else:
+                token = token[:pad_size]
+                seq_len = pad_size
+        contents.append(([vocab.get(word, vocab.get(UNK)) for word in token], labels_id.index(labels[i]), seq_len))
+    return contents
@@ -0,0 +1,36 @@
+# coding: UTF-8
+import os
+import sys
+import random
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'benchmarks')]
+
+# 原清洗逻辑里容易出错的输入: 缩写的大小写和撇号变体、多字符特殊串、零宽字符、空文本
+TRICKY = ["I'm sure they’re right, don't you think?", "It's 10% off — only $5 (AP)…", "Y'ALL'D'VE won’t",
+          "e-mail co-op U.S. “quoted” ‘single’ ´acute` ×²√", "करना है​﻿ zero width", "", "   ",
+          "α β θ π ∞ ÷ • à − ∅ ³ ₹ ° € ™ £ – _", "can't've o'clock ma'am 'cause"]
+
+
+def noisy_docs(n_docs, seed=1):
+    from bench_normalizer import synthetic_docs
+    rng = random.Random(seed)
+    docs = synthetic_docs(n_docs, 12, seed)
+    return [doc + ' ' + rng.choice(TRICKY) if rng.random() < 0.3 else doc for doc in docs] + TRICKY
+
+
+@pytest.fixture
+def csv_dataset(tmp_path):
+    """train/val/test 三个 csv(Starts, Text), 含空文本和长度超过 pad_size 的文本"""
+    import pandas as pd
+    docs = noisy_docs(600)
+    rng = random.Random(2)
+    paths = {}
+    for split, part in (('train', docs[:400]), ('val', docs[400:500]), ('test', docs[500:])):
+        labels = [rng.choice(['business', 'sci_tech', 'sports', 'world']) for _ in part]
+        texts = [doc if rng.random() > 0.02 else None for doc in part]
+        paths[split] = str(tmp_path / f'{split}.csv')
+        pd.DataFrame({'Starts': labels, 'Text': texts}).to_csv(paths[split], index=False)
+    return paths
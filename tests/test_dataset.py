@@ -0,0 +1,41 @@
+# coding: UTF-8
+from types import SimpleNamespace
+
+import pytest
+
+import baseline
+from utils import build_dataset, build_vocab, MAX_VOCAB_SIZE
+
+
+def make_config(paths, tmp_path, **kwargs):
+    config = dict(vocab_path=str(tmp_path / 'vocab.pkl'), train_path=paths['train'], dev_path=paths['val'],
+                  test_path=paths['test'], pad_size=14, num_workers=1, vocab_capacity=0, oov_mode='unk',
+                  cache_path=None, stream=False, shard_size=100000)
+    config.update(kwargs)
+    return SimpleNamespace(**config)
+
+
+def as_lists(dataset):
+    data = dataset[0:len(dataset)]
+    return list(zip(data.tokens.tolist(), data.labels.tolist(), data.seq_len.tolist()))
+
+
+@pytest.mark.parametrize('num_workers', [1, 2])
+def test_build_vocab_matches_baseline(csv_dataset, num_workers):
+    vocab = build_vocab(csv_dataset['train'], max_size=MAX_VOCAB_SIZE, min_freq=1, num_workers=num_workers)
+    assert list(vocab.items()) == list(baseline.build_vocab(csv_dataset['train'], MAX_VOCAB_SIZE).items())
+
+
+@pytest.mark.parametrize('options', [dict(), dict(num_workers=2), dict(cache_path='cache'),
+                                     dict(cache_path='cache', stream=True, shard_size=64)])
+def test_build_dataset_matches_baseline(csv_dataset, tmp_path, options):
+    if 'cache_path' in options:
+        options['cache_path'] = str(tmp_path / options['cache_path'])
+    config = make_config(csv_dataset, tmp_path, **options)
+    expected_vocab = baseline.build_vocab(csv_dataset['train'], MAX_VOCAB_SIZE)
+    # 第二次从词表文件和缓存读取
+    for _ in range(2):
+        vocab, train, dev, test = build_dataset(config)
+        assert dict(vocab.items()) == expected_vocab
+        for dataset, split in ((train, 'train'), (dev, 'val'), (test, 'test')):
+            assert as_lists(dataset) == baseline.load_dataset(csv_dataset[split], expected_vocab, config.pad_size)
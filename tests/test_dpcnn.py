@@ -0,0 +1,51 @@
+# coding: UTF-8
+from types import SimpleNamespace
+
+import pytest
+import torch
+import torch.nn.functional as F
+
+from bench_dpcnn import Legacy
+from DPCNN import Model
+
+
+def make_config(pad_size):
+    return SimpleNamespace(embedding_pretrained=None, n_vocab=502, num_classes=4, embed=16, num_filters=8,
+                           dropout=0.5, pad_size=pad_size, oov_mode='unk')
+
+
+def make_input(config, batch_size=6):
+    return (torch.randint(0, config.n_vocab, (batch_size, config.pad_size)),
+            torch.full((batch_size,), config.pad_size))
+
+
+@pytest.mark.parametrize('pad_size', [3, 5, 14, 17, 32, 65])
+def test_conv1d_matches_legacy(pad_size):
+    config = make_config(pad_size)
+    torch.manual_seed(1)
+    old, new = Legacy(config), Model(config)
+    new.load_state_dict(old.state_dict())  # 旧 checkpoint 的 Conv2d 权重直接加载
+    # float64 下比较: 部分 cpu 上 oneDNN 的 fp32 Conv2d 对权重的梯度本身有误差
+    old, new = old.double().eval(), new.double().eval()
+    x = make_input(config)
+    y = torch.randint(0, config.num_classes, (len(x[0]),))
+    out_old, out_new = old(x), new(x)
+    torch.testing.assert_close(out_new, out_old)
+    F.cross_entropy(out_old, y).backward()
+    F.cross_entropy(out_new, y).backward()
+    grads = {name: param.grad for name, param in old.named_parameters()}
+    Model._convert_conv2d(grads, '')  # 梯度按权重的方式换成 Conv1d 的形状
+    for name, param in new.named_parameters():
+        torch.testing.assert_close(param.grad, grads[name])
+
+
+@pytest.mark.parametrize('pad_size', [3, 14, 48])
+def test_batch_of_one_and_script(pad_size):
+    # 金字塔最终长度为2(如 48)时旧实现无法运行, 单条 batch 时旧实现 squeeze 掉了 batch 维
+    config = make_config(pad_size)
+    model = Model(config).eval()
+    x = make_input(config)
+    out = model(x)
+    assert out.shape == (len(x[0]), config.num_classes)
+    assert model((x[0][:1], x[1][:1])).shape == (1, config.num_classes)
+    torch.testing.assert_close(torch.jit.script(model)(x), out)
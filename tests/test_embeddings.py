@@ -0,0 +1,52 @@
+# coding: UTF-8
+import os
+import importlib.util
+
+import numpy as np
+import pytest
+from gensim.models import KeyedVectors
+
+from conftest import ROOT
+from vocabulary import save_vocab
+
+spec = importlib.util.spec_from_file_location(
+    'extracting', os.path.join(ROOT, 'extracting_pre-trained_word_vectors.py'))
+extracting = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(extracting)
+
+DIM = 7
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.RandomState(1)
+    words = [f'w{i}' for i in range(300)] + ['ünïcode', '中文', "it's", '-', '...']
+    kv = KeyedVectors(DIM)
+    kv.add_vectors(words, rng.randn(len(words), DIM).astype('float32'))
+    return kv
+
+
+@pytest.fixture
+def vocab_path(tmp_path):
+    # 一部分词不在词向量文件中, 对应行应为0
+    words = [f'w{i}' for i in range(0, 600, 3)] + ['中文', "it's", '...', 'missing', '<UNK>', '<PAD>']
+    path = str(tmp_path / 'vocab.pkl')
+    save_vocab({word: i for i, word in enumerate(words)}, path)
+    return path
+
+
+@pytest.mark.parametrize('fmt', ['glove.txt', 'fasttext.vec', 'word2vec.bin'])
+@pytest.mark.parametrize('use_index', [True, False])
+def test_get_embed_matches_gensim(tmp_path, vectors, vocab_path, fmt, use_index):
+    embed_path = str(tmp_path / fmt)
+    binary, no_header = fmt.endswith('.bin'), fmt.startswith('glove')
+    vectors.save_word2vec_format(embed_path, binary=binary, write_header=not no_header)
+    expected = KeyedVectors.load_word2vec_format(embed_path, binary=binary, no_header=no_header)
+    # 第二次读取已建好的索引
+    for _ in range(2 if use_index else 1):
+        embed = extracting.get_embed(vocab_path, embed_path, DIM, use_index=use_index)
+        vocab = extracting.load_vocab(vocab_path)
+        assert embed.shape == (len(vocab), DIM) and embed.dtype == np.float32
+        for word, i in vocab.items():
+            row = expected[word] if word in expected.key_to_index else np.zeros(DIM, 'float32')
+            np.testing.assert_array_equal(embed[i], row)
@@ -0,0 +1,19 @@
+# coding: UTF-8
+from conftest import noisy_docs
+import baseline
+from tool import TextNormalizer, clean_contractions, clean_special_chars, CONTRACTION_MAPPING, PUNCT, PUNCT_MAPPING
+
+
+def test_normalizer_matches_baseline():
+    normalizer = TextNormalizer()
+    for doc in noisy_docs(2000):
+        assert normalizer(doc) == baseline.normalize(doc)
+        assert normalizer.tokenize(doc) == baseline.normalize(doc).split()
+
+
+def test_clean_functions_match_baseline():
+    for doc in noisy_docs(500):
+        text = clean_contractions(doc.lower(), CONTRACTION_MAPPING)
+        assert text == baseline.clean_contractions(doc.lower(), CONTRACTION_MAPPING)
+        assert clean_special_chars(text, PUNCT, PUNCT_MAPPING) == \
+            baseline.clean_special_chars(text, baseline.PUNCT, baseline.PUNCT_MAPPING)
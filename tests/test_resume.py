@@ -0,0 +1,82 @@
+# coding: UTF-8
+import os
+import importlib
+
+import numpy as np
+import pytest
+import torch
+
+import train_eval
+from common import make_data
+from train_eval import train, init_network
+from utils import DatasetIterater
+
+
+class Interrupted(Exception):
+    pass
+
+
+class InterruptedIterater(DatasetIterater):
+    """取到第 stop_after 个 batch 时抛出异常, 模拟训练中途被杀掉"""
+
+    def __init__(self, *args, stop_after=None, **kwargs):
+        super(InterruptedIterater, self).__init__(*args, **kwargs)
+        self.stop_after = stop_after
+        self.taken = 0
+
+    def __next__(self):
+        if self.taken == self.stop_after:
+            raise Interrupted
+        batch = super(InterruptedIterater, self).__next__()
+        self.taken += 1
+        return batch
+
+
+# TextRNN 的多层 LSTM 有 dropout, 用来检查随机数状态的恢复
+@pytest.fixture(params=['DPCNN', 'TextRNN'])
+def model_config(request, tmp_path, monkeypatch):
+    os.makedirs(tmp_path / 'data')
+    os.makedirs(tmp_path / 'saved_dict')
+    # TextRNN 的类别名单在数据集目录下, DPCNN 的在 data/ 下
+    for path in (tmp_path / 'class.txt', tmp_path / 'data' / 'class.txt'):
+        path.write_text('a\nb\nc\nd\n', encoding='utf-8')
+    x = importlib.import_module(request.param)
+    config = x.Config(str(tmp_path), 'random')
+    config.device = torch.device('cpu')
+    config.n_vocab, config.embed, config.num_filters, config.hidden_size = 202, 16, 8, 8
+    config.pad_size = 14
+    config.batch_size, config.num_epochs, config.eval_every = 16, 2, 5
+    config.checkpoint_every, config.async_checkpoint = 7, False
+    # 只比较训练得到的参数, 不在测试集上评估、不画 loss 图
+    monkeypatch.setattr(train_eval, 'test', lambda *args: None)
+    monkeypatch.setattr(train_eval, 'plot_losses', lambda *args: None)
+    return x, config
+
+
+def run(x, config, train_data, dev_data, resume=False, stop_after=None):
+    torch.manual_seed(0 if not resume else 99)  # 恢复时的初始参数不同, 应被 checkpoint 覆盖
+    model = x.Model(config)
+    init_network(model)
+    train_iter = InterruptedIterater(train_data, config.batch_size, config.device, bucket=True, shuffle=True,
+                                     seed=config.seed, min_len=config.min_len, stop_after=stop_after)
+    dev_iter = DatasetIterater(dev_data, config.batch_size, config.device)
+    train(config, model, train_iter, dev_iter, dev_iter, resume=resume)
+    return model
+
+
+def test_resume_is_bit_exact(model_config):
+    x, config = model_config
+    rng = np.random.RandomState(1)
+    train_data = make_data(250, config.pad_size, config.n_vocab, config.num_classes, rng)
+    dev_data = make_data(40, config.pad_size, config.n_vocab, config.num_classes, rng)
+    expected = run(x, config, train_data, dev_data).state_dict()
+    os.remove(config.state_path)
+
+    # 第二轮中途(第 7 * 3 = 21 个 batch 的 checkpoint 之后)中断, 再从 checkpoint 恢复
+    with pytest.raises(Interrupted):
+        run(x, config, train_data, dev_data, stop_after=24)
+    assert torch.load(config.state_path, weights_only=False)['total_batch'] == 21
+    resumed = run(x, config, train_data, dev_data, resume=True).state_dict()
+    assert expected.keys() == resumed.keys()
+    for name in expected:
+        assert torch.equal(expected[name], resumed[name]), name
@@ -1,20 +1,68 @@
 import operator
+import re
+import hashlib
 import pandas as pd
 from tqdm import tqdm
 import numpy as np
 from gensim.models import KeyedVectors
+from vocabulary import count_words
+
+
+# 英语缩写表
+CONTRACTION_MAPPING = {"here's": "here is", "it's": "it is", "ain't": "is not", "aren't": "are not",
+                       "can't": "cannot", "'cause": "because", "could've": "could have", "couldn't": "could not",
+                       "didn't": "did not", "doesn't": "does not", "don't": "do not", "hadn't": "had not",
+                       "hasn't": "has not", "haven't": "have not", "he'd": "he would", "he'll": "he will",
+                       "he's": "he is", "how'd": "how did", "how'd'y": "how do you", "how'll": "how will",
+                       "how's": "how is", "I'd": "I would", "I'd've": "I would have", "I'll": "I will",
+                       "I'll've": "I will have", "I'm": "I am", "I've": "I have", "i'd": "i would",
+                       "i'd've": "i would have", "i'll": "i will", "i'll've": "i will have", "i'm": "i am",
+                       "i've": "i have", "isn't": "is not", "it'd": "it would", "it'd've": "it would have",
+                       "it'll": "it will", "it'll've": "it will have", "it's": "it is", "let's": "let us",
+                       "ma'am": "madam", "mayn't": "may not", "might've": "might have", "mightn't": "might not",
+                       "mightn't've": "might not have", "must've": "must have", "mustn't": "must not",
+                       "mustn't've": "must not have", "needn't": "need not", "needn't've": "need not have",
+                       "o'clock": "of the clock", "oughtn't": "ought not", "oughtn't've": "ought not have",
+                       "shan't": "shall not", "sha'n't": "shall not", "shan't've": "shall not have",
+                       "she'd": "she would", "she'd've": "she would have", "she'll": "she will",
+                       "she'll've": "she will have", "she's": "she is", "should've": "should have",
+                       "shouldn't": "should not", "shouldn't've": "should not have", "so've": "so have",
+                       "so's": "so as", "this's": "this is", "that'd": "that would", "that'd've": "that would have",
+                       "that's": "that is", "there'd": "there would", "there'd've": "there would have",
+                       "there's": "there is", "here's": "here is", "they'd": "they would",
+                       "they'd've": "they would have", "they'll": "they will", "they'll've": "they will have",
+                       "they're": "they are", "they've": "they have", "to've": "to have", "wasn't": "was not",
+                       "we'd": "we would", "we'd've": "we would have", "we'll": "we will",
+                       "we'll've": "we will have", "we're": "we are", "we've": "we have", "weren't": "were not",
+                       "what'll": "what will", "what'll've": "what will have", "what're": "what are",
+                       "what's": "what is", "what've": "what have", "when's": "when is", "when've": "when have",
+                       "where'd": "where did", "where's": "where is", "where've": "where have",
+                       "who'll": "who will", "who'll've": "who will have", "who's": "who is", "who've": "who have",
+                       "why's": "why is", "why've": "why have", "will've": "will have", "won't": "will not",
+                       "won't've": "will not have", "would've": "would have", "wouldn't": "would not",
+                       "wouldn't've": "would not have", "y'all": "you all", "y'all'd": "you all would",
+                       "y'all'd've": "you all would have", "y'all're": "you all are", "y'all've": "you all have",
+                       "you'd": "you would", "you'd've": "you would have", "you'll": "you will",
+                       "you'll've": "you will have", "you're": "you are", "you've": "you have"}
+
+# 需要切分的标点
+PUNCT = "/-'?!.,#$%\'()*+-/:;<=>@[\\]^_`{|}~" + \
+    '""“”’' + '∞θ÷α•à−β∅³π‘₹´°£€\×™√²—–&'
+# 特殊字符映射
+PUNCT_MAPPING = {"‘": "'", "₹": "e", "´": "'", "°": "", "€": "e", "™": "tm", "√": " sqrt ", "×": "x", "²": "2",
+                 "—": "-", "–": "-", "’": "'", "_": "-", "`": "'", '“': '"', '”': '"', '“': '"', "£": "e",
+                 '∞': 'infinity', 'θ': 'theta', '÷': '/', 'α': 'alpha', '•': '.', 'à': 'a', '−': '-', 'β': 'beta',
+                 '∅': '', '³': '3', 'π': 'pi', }
+# Other special characters that I have to deal with in last
+SPECIALS = {'\u200b': ' ', '…': ' ... ', '\ufeff': '', 'करना': '', 'है': ''}
+# 去除缩写前统一成 ' 的撇号
+APOSTROPHES = ["’", "‘", "´", "`"]
 
 
 # ## 创建英文词典
 def build_vocab(sentences, verbose=True):
-    vocab = {}
-    for sentence in tqdm(sentences, disable=(not verbose)):
-        for word in sentence:
-            try:
-                vocab[word] += 1
-            except KeyError:
-                vocab[word] = 1
-    return vocab
+    """词 -> 词频(Counter), sentences 的元素为词列表"""
+    return count_words(tqdm(sentences, disable=(not verbose)))
 
 
 # ## 加载预训练词向量
@@ -65,20 +113,110 @@ def clean_special_chars(text, punct, mapping):
         text = text.replace(p, mapping[p])
     for p in punct:
         text = text.replace(p, f' {p} ')
-    specials = {'\u200b': ' ', '…': ' ... ', '\ufeff': '', 'करना': '', 'है': ''}  # Other special characters that I have to deal with in last
-    for s in specials:
-        text = text.replace(s, specials[s])
+    for s in SPECIALS:
+        text = text.replace(s, SPECIALS[s])
     return text
 
 
 # 去除英语缩写
 def clean_contractions(text, mapping):
-    specials = ["’", "‘", "´", "`"]
-    for s in specials:
+    for s in APOSTROPHES:
         text = text.replace(s, "'")
     text = ' '.join([mapping[t] if t in mapping else t for t in text.split(" ")])
     return text
 
 
+class TextNormalizer(object):
+    """预编译的文本规范化器
+
+    等价于依次执行 lower -> clean_contractions -> clean_special_chars, 输出逐字节一致.
+    缩写只在含撇号的词上查表, 单字符替换合并成一张表由一个字符集正则一次扫描完成,
+    只有多字符的特殊串(如 'करना')仍按原顺序 replace.
+    """
+
+    def __init__(self, punct=PUNCT, punct_mapping=PUNCT_MAPPING, contraction_mapping=CONTRACTION_MAPPING,
+                 specials=SPECIALS, lower=True):
+        self.lower = lower
+        self.contraction_mapping = dict(contraction_mapping)
+        # 构造参数，用于计算规范化规则的指纹(数据缓存的键)
+        self.tables = (punct, list(punct_mapping.items()), list(contraction_mapping.items()),
+                       list(specials.items()), APOSTROPHES, lower)
+        self.apostrophe_table = str.maketrans({a: "'" for a in APOSTROPHES})
+        self.apostrophe_re = re.compile('[' + re.escape("'" + ''.join(APOSTROPHES)) + ']')
+
+        # clean_special_chars 里的每一步都是按顺序的 str.replace, 单字符替换对拼接满足
+        # f(ab) = f(a)f(b), 所以对开头连续的单字符替换逐字符跑一遍原逻辑即可得到等价的映射表;
+        # 第一个多字符替换之后的步骤保持原顺序逐个 replace.
+        steps = [(p, punct_mapping[p]) for p in punct_mapping] + \
+                [(p, f' {p} ') for p in punct] + \
+                [(s, specials[s]) for s in specials]
+        n_single = 0
+        while n_single < len(steps) and len(steps[n_single][0]) == 1:
+            n_single += 1
+        single, self.tail = steps[:n_single], steps[n_single:]
+
+        # 缩写表的值里若含有撇号变体, 原逻辑不会把值里的变体替换成 ', 这时先对全文单独 translate 一遍;
+        # 否则撇号统一可以并进映射表
+        self.pre_translate = any(a in v for v in self.contraction_mapping.values() for a in APOSTROPHES)
+        chars = {p for p, _ in single}
+        if not self.pre_translate:
+            chars |= set(APOSTROPHES)
+
+        def translate_char(ch):
+            if not self.pre_translate:
+                ch = ch.translate(self.apostrophe_table)
+            for p, v in single:
+                ch = ch.replace(p, v)
+            return ch
+        self.table = {ch: translate_char(ch) for ch in chars}
+        self.table = {ch: v for ch, v in self.table.items() if v != ch}
+        self.char_re = re.compile('[' + re.escape(''.join(sorted(self.table))) + ']') if self.table else None
+
+    def _char(self, match):
+        return self.table[match.group()]
+
+    def _contractions(self, text):
+        # 原逻辑按 " " 切分后整词查表, 而缩写都带撇号, 所以只需检查含撇号的词
+        pieces = []
+        last = pos = 0
+        for m in self.apostrophe_re.finditer(text):
+            if m.start() < pos:
+                continue
+            start = text.rfind(' ', 0, m.start()) + 1
+            end = text.find(' ', m.end())
+            if end < 0:
+                end = len(text)
+            pos = end
+            value = self.contraction_mapping.get(text[start:end].translate(self.apostrophe_table))
+            if value is not None:
+                pieces.append(text[last:start])
+                pieces.append(value)
+                last = end
+        if not pieces:
+            return text
+        pieces.append(text[last:])
+        return ''.join(pieces)
+
+    def __call__(self, text):
+        if self.lower:
+            text = text.lower()
+        if self.pre_translate:
+            text = text.translate(self.apostrophe_table)
+        text = self._contractions(text)
+        if self.char_re is not None:
+            text = self.char_re.sub(self._char, text)
+        for p, v in self.tail:
+            if p in text:
+                text = text.replace(p, v)
+        return text
+
+    def tokenize(self, text):
+        return self(text).split()
+
+    def fingerprint(self):
+        """规范化规则的摘要，规则表有任何改动都会变化"""
+        return hashlib.sha1(repr(self.tables).encode('utf-8')).hexdigest()
+
+
 if __name__ == "__main__":
     pass
\ No newline at end of file
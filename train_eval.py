@@ -1,11 +1,17 @@
 # coding: UTF-8
+import os
+import random
 import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel
 from sklearn import metrics
 import time
-from utils import get_time_dif
+from concurrent.futures import ThreadPoolExecutor
+from utils import get_time_dif, PrefetchIterater
+from profiler import Profiler
 import matplotlib.pyplot as plt
 from tensorboardX import SummaryWriter
 
@@ -26,8 +32,107 @@ def init_network(model, method='xavier', exclude='embedding', seed=123):
                 pass
 
 
-def train(config, model, train_iter, dev_iter, test_iter):
+def atomic_save(obj, path):
+    """先写临时文件再 os.replace, 中途退出也不会留下写了一半的 checkpoint"""
+    tmp_path = path + '.tmp'
+    torch.save(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def is_distributed():
+    return dist.is_available() and dist.is_initialized() and dist.get_world_size() > 1
+
+
+def cpu_copy(obj):
+    """递归地把 tensor 拷贝到 cpu; 列表、字典也复制一份, 得到调用时刻的快照"""
+    if torch.is_tensor(obj):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return {k: cpu_copy(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(cpu_copy(v) for v in obj)
+    return obj
+
+
+class CheckpointWriter(object):
+    """在后台线程写 checkpoint
+
+    save() 只在调用线程里把要保存的内容拷贝到 cpu(之后的训练步会原地修改参数), 序列化和写盘在后台完成;
+    同一路径还没开始写的旧 checkpoint 会被新的取代. 后台写盘的异常在下一次 save() 或 close() 时抛出.
+    """
+
+    def __init__(self, background=True):
+        self.executor = ThreadPoolExecutor(1) if background else None
+        self.pending = {}  # 路径 -> 最近一次提交的写盘任务
+
+    def save(self, obj, path):
+        for future in self.pending.values():
+            if future.done():
+                future.result()
+        obj = cpu_copy(obj)
+        if self.executor is None:
+            atomic_save(obj, path)
+            return
+        if path in self.pending:
+            self.pending[path].cancel()
+        self.pending[path] = self.executor.submit(atomic_save, obj, path)
+
+    def wait(self):
+        for future in self.pending.values():
+            if not future.cancelled():
+                future.result()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+        self.wait()
+
+
+def rng_state():
+    state = {'torch': torch.get_rng_state(), 'numpy': np.random.get_state(), 'random': random.getstate()}
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def gather_rng_state():
+    """各 rank 的随机数状态列表(按 rank 排列), 多进程时每个 rank 都要调用"""
+    if is_distributed():
+        states = [None] * dist.get_world_size()
+        dist.all_gather_object(states, rng_state())
+        return states
+    return [rng_state()]
+
+
+def set_rng_state(state):
+    torch.set_rng_state(state['torch'])
+    np.random.set_state(state['numpy'])
+    random.setstate(state['random'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+def autocast(config):
+    """config.bf16 为 True 时在 config.device 上以 bfloat16 autocast 执行前向"""
+    return torch.autocast(config.device.type, dtype=torch.bfloat16, enabled=config.bf16)
+
+
+def train(config, model, train_iter, dev_iter, test_iter, dev_sample_iter=None, resume=False):
+    """dev_sample_iter 为验证集的固定分层子集(见 utils.stratified_subsample); 给定时每 eval_every 个 batch
+    用它评估并据此保存最优模型和早停, 每 full_eval_every 个 batch 额外评估一次完整验证集, 只用于记录
+
+    每 checkpoint_every 个 batch 把完整训练状态写到 config.state_path; resume=True 时从中恢复,
+    继续训练的结果与没有中断时逐位一致.
+
+    用 torchrun 多进程启动时(config.world_size > 1)以 DistributedDataParallel 同步梯度, 验证集指标在各 rank 间汇总,
+    只有 rank 0 写 checkpoint、日志和 tensorboard.
+
+    config.profile 为 True 时(只在 rank 0)统计取数据、前向、反向、参数更新、评估和写 checkpoint 的耗时,
+    以及每步耗时、吞吐和峰值内存, 写入 tensorboard 和本次运行日志目录下的 profile.json.
+    """
     start_time = time.time()
+    is_main = config.rank == 0
+    net = DistributedDataParallel(model) if is_distributed() else model
     model.train()
     optimizer = torch.optim.Adam(model.parameters(), lr=config.learning_rate)
 
@@ -39,55 +144,118 @@ def train(config, model, train_iter, dev_iter, test_iter):
     dev_best_loss = float('inf')
     last_improve = 0
     flag = False
-    writer = SummaryWriter(log_dir=config.log_path + '/' + time.strftime('%m-%d_%H.%M', time.localtime()))
-    
-    for epoch in range(config.num_epochs):
-        print('Epoch [{}/{}]'.format(epoch + 1, config.num_epochs))
+    writer = SummaryWriter(log_dir=config.log_path + '/' + time.strftime('%m-%d_%H.%M', time.localtime()))\
+        if is_main else None
+    checkpoint = CheckpointWriter(background=config.async_checkpoint)
+    profiler = Profiler(config.profile and is_main, config.device, config.profile_trace,
+                        os.path.join(writer.logdir, 'trace') if is_main else None)
+    eval_iter = dev_sample_iter if dev_sample_iter is not None else dev_iter
+    start_epoch, start_index = 0, 0
+    if resume and os.path.exists(config.state_path):
+        state = torch.load(config.state_path, map_location=config.device, weights_only=False)
+        model.load_state_dict(state['model'])
+        optimizer.load_state_dict(state['optimizer'])
+        start_epoch, start_index = state['epoch'], state['index']
+        total_batch, dev_best_loss, last_improve = state['total_batch'], state['dev_best_loss'], state['last_improve']
+        train_losses, dev_losses = state['train_losses'], state['dev_losses']
+        set_rng_state(state['rng'][config.rank])
+        train_iter.seek(start_epoch, start_index)
+        if is_main:
+            print(f"Resumed from {config.state_path}: epoch {start_epoch + 1}, batch {total_batch}")
+    elif resume and is_main:
+        print(f"No training state at {config.state_path}, starting from scratch")
 
-        for i, (trains, labels) in enumerate(train_iter):
-            outputs = model(trains)
-            model.zero_grad()
-            loss = F.cross_entropy(outputs, labels)
+    profiler.reset_clock()
+    for epoch in range(start_epoch, config.num_epochs):
+        if is_main:
+            print('Epoch [{}/{}]'.format(epoch + 1, config.num_epochs))
 
-            loss.backward()
+        for i, (trains, labels) in enumerate(profiler.iterate(train_iter), start_index if epoch == start_epoch else 0):
+            with profiler.section('forward'):
+                with autocast(config):
+                    outputs = net(trains)
+                model.zero_grad()
+                loss = F.cross_entropy(outputs.float(), labels)
 
-            optimizer.step()
-            if total_batch % 100 == 0:
+            with profiler.section('backward'):
+                loss.backward()
+
+            with profiler.section('optimizer'):
+                optimizer.step()
+            profiler.step(labels.size(0))
+            if total_batch % config.eval_every == 0:
 
                 true = labels.data.cpu()
                 predic = torch.max(outputs.data, 1)[1].cpu()
                 train_acc = metrics.accuracy_score(true, predic)
-                dev_acc, dev_loss = evaluate(config, model, dev_iter)
+                with profiler.section('evaluate'):
+                    dev_acc, dev_loss = evaluate(config, model, eval_iter, profiler=profiler)
                 if dev_loss < dev_best_loss:
                     dev_best_loss = dev_loss
-                    torch.save(model.state_dict(), config.save_path)
+                    if is_main:
+                        with profiler.section('checkpoint'):
+                            checkpoint.save(model.state_dict(), config.save_path)
                     improve = '*'
                     last_improve = total_batch
                 else:
                     improve = ''
                 time_dif = get_time_dif(start_time)
                 msg = 'Iter: {0:>6},  Train Loss: {1:>5.2},  Train Acc: {2:>6.2%},  Val Loss: {3:>5.2},  Val Acc: {4:>6.2%},  Time: {5} {6}'
-                print(msg.format(total_batch, loss.item(), train_acc, dev_loss, dev_acc, time_dif, improve))
-                writer.add_scalar("loss/train", loss.item(), total_batch)
-                writer.add_scalar("loss/dev", dev_loss, total_batch)
-                writer.add_scalar("acc/train", train_acc, total_batch)
-                writer.add_scalar("acc/dev", dev_acc, total_batch)
+                if is_main:
+                    print(msg.format(total_batch, loss.item(), train_acc, dev_loss, dev_acc, time_dif, improve))
+                    writer.add_scalar("loss/train", loss.item(), total_batch)
+                    writer.add_scalar("loss/dev", dev_loss, total_batch)
+                    writer.add_scalar("acc/train", train_acc, total_batch)
+                    writer.add_scalar("acc/dev", dev_acc, total_batch)
+                if dev_sample_iter is not None and total_batch % config.full_eval_every == 0:
+                    with profiler.section('evaluate'):
+                        full_acc, full_loss = evaluate(config, model, dev_iter, profiler=profiler)
+                    if is_main:
+                        print('Full Val Loss: {0:>5.2},  Full Val Acc: {1:>6.2%}'.format(full_loss, full_acc))
+                        writer.add_scalar("loss/dev_full", full_loss, total_batch)
+                        writer.add_scalar("acc/dev_full", full_acc, total_batch)
+                if is_main and isinstance(train_iter, PrefetchIterater):
+                    loader = train_iter.metrics()
+                    writer.add_scalar("loader/stall_time", loader['stall_time'], total_batch)
+                    writer.add_scalar("loader/queue_depth", loader['queue_depth'], total_batch)
+                profiler.log(writer, total_batch)
                 #loss picture
                 train_losses.append(loss.item())
                 dev_losses.append(dev_loss)
 
                 model.train()
+                profiler.reset_clock()
             total_batch += 1
             if total_batch - last_improve > config.require_improvement:
-
-                print("No optimization for a long time, auto-stopping...")
+                # 验证集指标已在各 rank 间汇总, 所有 rank 在同一步停止
+                if is_main:
+                    print("No optimization for a long time, auto-stopping...")
                 flag = True
                 break
+            if config.checkpoint_every and total_batch % config.checkpoint_every == 0:
+                rng = gather_rng_state()
+                if is_main:
+                    with profiler.section('checkpoint'):
+                        checkpoint.save({'model': model.state_dict(), 'optimizer': optimizer.state_dict(),
+                                         'epoch': epoch, 'index': i + 1, 'total_batch': total_batch,
+                                         'dev_best_loss': dev_best_loss, 'last_improve': last_improve,
+                                         'train_losses': train_losses, 'dev_losses': dev_losses,
+                                         'rng': rng}, config.state_path)
+                profiler.reset_clock()
         if flag:
             break
-    writer.close()
+    with profiler.section('checkpoint'):
+        checkpoint.close()
+    if is_main:
+        summary = profiler.close(os.path.join(writer.logdir, 'profile.json'))
+        if summary is not None:
+            print_profile(summary, writer.logdir)
+        writer.close()
+    if is_distributed():
+        dist.barrier()  # 等 rank 0 写完 checkpoint 再由各 rank 读取
     test(config, model, test_iter)
-    plot_losses(train_losses, dev_losses, config.log_path)
+    if is_main:
+        plot_losses(train_losses, dev_losses, config.log_path)
 
 
 def test(config, model, test_iter):
@@ -96,6 +264,8 @@ def test(config, model, test_iter):
     model.eval()
     start_time = time.time()
     test_acc, test_loss, test_report, test_confusion = evaluate(config, model, test_iter, test=True)
+    if config.rank != 0:
+        return
     msg = 'Test Loss: {0:>5.2},  Test Acc: {1:>6.2%}'
     print(msg.format(test_loss, test_acc))
     print("Precision, Recall and F1-Score...")
@@ -106,27 +276,91 @@ def test(config, model, test_iter):
     print("Time usage:", time_dif)
 
 
-def evaluate(config, model, data_iter, test=False):
+class MetricsAccumulator(object):
+    """在设备上累加 loss 和混淆矩阵, 每个 batch 不做同步, 只在 compute() 时拷回一次"""
+
+    def __init__(self, num_classes, device):
+        self.num_classes = num_classes
+        self.loss_total = torch.zeros((), dtype=torch.float64, device=device)
+        self.confusion = torch.zeros(num_classes * num_classes, dtype=torch.long, device=device)
+        self.n_batches = 0
+
+    def update(self, outputs, labels, loss):
+        self.loss_total += loss.detach().double()
+        predic = outputs.detach().argmax(1).to(labels.device)
+        self.confusion += torch.bincount(labels * self.num_classes + predic, minlength=self.num_classes ** 2)
+        self.n_batches += 1
+
+    def compute(self):
+        """返回 (准确率, 平均每个batch的loss, 混淆矩阵[真实, 预测]); 多进程训练时先在各 rank 间求和"""
+        confusion = self.confusion.clone()
+        totals = torch.stack([self.loss_total, torch.full_like(self.loss_total, self.n_batches)])
+        if is_distributed():
+            dist.all_reduce(confusion)
+            dist.all_reduce(totals)
+        confusion = confusion.view(self.num_classes, self.num_classes).cpu().numpy()
+        loss_total, n_batches = totals.tolist()
+        return np.trace(confusion) / max(confusion.sum(), 1), loss_total / max(n_batches, 1), confusion
+
+
+def precision_recall_f1(confusion):
+    """由混淆矩阵计算每个类别的 precision/recall/F1 和 support, 分母为0时记为0(与 sklearn 一致)"""
+    tp = np.diag(confusion).astype(np.float64)
+    pred = confusion.sum(0)
+    support = confusion.sum(1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(pred > 0, tp / pred, 0.)
+        recall = np.where(support > 0, tp / support, 0.)
+        f1 = np.where(pred + support > 0, 2 * tp / (pred + support), 0.)
+    return precision, recall, f1, support
+
+
+def classification_report(confusion, target_names, digits=4):
+    """与 sklearn.metrics.classification_report 相同格式的文本报告, 由混淆矩阵直接得出"""
+    precision, recall, f1, support = precision_recall_f1(confusion)
+    total = support.sum()
+    headers = ["precision", "recall", "f1-score", "support"]
+    width = max(max(len(cn) for cn in target_names), len("weighted avg"), digits)
+    head_fmt = "{:>{width}s} " + " {:>9}" * len(headers)
+    row_fmt = "{:>{width}s} " + " {:>9.{digits}f}" * 3 + " {:>9}\n"
+    report = head_fmt.format("", *headers, width=width) + "\n\n"
+    for row in zip(target_names, precision, recall, f1, support):
+        report += row_fmt.format(*row, width=width, digits=digits)
+    report += "\n"
+    acc = np.trace(confusion) / max(total, 1)
+    report += ("{:>{width}s} " + " {:>9.{digits}}" * 2 + " {:>9.{digits}f}" + " {:>9}\n").format(
+        "accuracy", "", "", acc, total, width=width, digits=digits)
+    weights = support / max(total, 1)
+    report += row_fmt.format("macro avg", precision.mean(), recall.mean(), f1.mean(), total, width=width, digits=digits)
+    report += row_fmt.format("weighted avg", precision @ weights, recall @ weights, f1 @ weights, total,
+                             width=width, digits=digits)
+    return report
+
+
+def evaluate(config, model, data_iter, test=False, profiler=None):
     model.eval()
-    loss_total = 0
-    predict_all = np.array([], dtype=int)
-    labels_all = np.array([], dtype=int)
+    meter = MetricsAccumulator(config.num_classes, config.device)
+    profiler = profiler or Profiler()
     with torch.no_grad():
-        for texts, labels in data_iter:
-            outputs = model(texts)
-            loss = F.cross_entropy(outputs, labels)
-            loss_total += loss.item()
-            labels = labels.data.cpu().numpy()
-            predic = torch.max(outputs.data, 1)[1].cpu().numpy()
-            labels_all = np.append(labels_all, labels)
-            predict_all = np.append(predict_all, predic)
-
-    acc = metrics.accuracy_score(labels_all, predict_all)
+        for texts, labels in profiler.iterate(data_iter, 'evaluate/data'):
+            with profiler.section('evaluate/forward'):
+                with autocast(config):
+                    outputs = model(texts)
+                meter.update(outputs, labels, F.cross_entropy(outputs.float(), labels))
+
+    acc, loss, confusion = meter.compute()
     if test:
-        report = metrics.classification_report(labels_all, predict_all, target_names=config.class_list, digits=4)
-        confusion = metrics.confusion_matrix(labels_all, predict_all)
-        return acc, loss_total / len(data_iter), report, confusion
-    return acc, loss_total / len(data_iter)
+        report = classification_report(confusion, config.class_list, digits=4)
+        return acc, loss, report, confusion
+    return acc, loss
+
+
+def print_profile(summary, log_dir):
+    print(f"Profile========{summary['steps']} steps, {summary['samples_per_sec']:.1f} samples/sec, "
+          f"step p50 {summary['step_ms'].get('p50', 0):.1f} ms, peak RSS {summary['peak_rss_mb']:.0f} MB")
+    for name, section in summary['sections'].items():
+        print(f"  {name:<18} {section['mean_ms']:>10.2f} ms x {section['count']:<7} {section['fraction']:>7.2%}")
+    print(f"  -> {log_dir}/profile.json")
 
 
 def plot_losses(train_losses, dev_losses, log_path):
@@ -1,190 +1,50 @@
 # coding: UTF-8
 import os
 import torch
+import torch.nn as nn
+import torch.nn.functional as F
 import numpy as np
-import pickle as pkl
-from tqdm import tqdm
 import time
+from typing import Optional
 from datetime import timedelta
 import pandas as pd
-from tool import clean_special_chars, clean_contractions
-
-# ## 进度条初始化
-tqdm.pandas()
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from preprocess import normalizer, load_or_encode_csv, ShardedDataset
+from vocabulary import count_words, make_vocab, load_vocab, save_vocab, table_path, OOVHasher
 
 MAX_VOCAB_SIZE = 10000  # 词表长度限制
 UNK, PAD = '<UNK>', '<PAD>'  # 未知字，padding符号
 
 
-def build_vocab(file_path, max_size, min_freq):
-    df = pd.read_csv(file_path, encoding='utf-8', sep=',')
-
-    df['Text'] = df['Text'].fillna('')
-
-    sentences = df['Text'].apply(lambda x: x.lower())
-    contraction_mapping = {"here's": "here is", "it's": "it is", "ain't": "is not", "aren't": "are not",
-                           "can't": "cannot", "'cause": "because", "could've": "could have", "couldn't": "could not",
-                           "didn't": "did not", "doesn't": "does not", "don't": "do not", "hadn't": "had not",
-                           "hasn't": "has not", "haven't": "have not", "he'd": "he would", "he'll": "he will",
-                           "he's": "he is", "how'd": "how did", "how'd'y": "how do you", "how'll": "how will",
-                           "how's": "how is", "I'd": "I would", "I'd've": "I would have", "I'll": "I will",
-                           "I'll've": "I will have", "I'm": "I am", "I've": "I have", "i'd": "i would",
-                           "i'd've": "i would have", "i'll": "i will", "i'll've": "i will have", "i'm": "i am",
-                           "i've": "i have", "isn't": "is not", "it'd": "it would", "it'd've": "it would have",
-                           "it'll": "it will", "it'll've": "it will have", "it's": "it is", "let's": "let us",
-                           "ma'am": "madam", "mayn't": "may not", "might've": "might have", "mightn't": "might not",
-                           "mightn't've": "might not have", "must've": "must have", "mustn't": "must not",
-                           "mustn't've": "must not have", "needn't": "need not", "needn't've": "need not have",
-                           "o'clock": "of the clock", "oughtn't": "ought not", "oughtn't've": "ought not have",
-                           "shan't": "shall not", "sha'n't": "shall not", "shan't've": "shall not have",
-                           "she'd": "she would", "she'd've": "she would have", "she'll": "she will",
-                           "she'll've": "she will have", "she's": "she is", "should've": "should have",
-                           "shouldn't": "should not", "shouldn't've": "should not have", "so've": "so have",
-                           "so's": "so as", "this's": "this is", "that'd": "that would", "that'd've": "that would have",
-                           "that's": "that is", "there'd": "there would", "there'd've": "there would have",
-                           "there's": "there is", "here's": "here is", "they'd": "they would",
-                           "they'd've": "they would have", "they'll": "they will", "they'll've": "they will have",
-                           "they're": "they are", "they've": "they have", "to've": "to have", "wasn't": "was not",
-                           "we'd": "we would", "we'd've": "we would have", "we'll": "we will",
-                           "we'll've": "we will have", "we're": "we are", "we've": "we have", "weren't": "were not",
-                           "what'll": "what will", "what'll've": "what will have", "what're": "what are",
-                           "what's": "what is", "what've": "what have", "when's": "when is", "when've": "when have",
-                           "where'd": "where did", "where's": "where is", "where've": "where have",
-                           "who'll": "who will", "who'll've": "who will have", "who's": "who is", "who've": "who have",
-                           "why's": "why is", "why've": "why have", "will've": "will have", "won't": "will not",
-                           "won't've": "will not have", "would've": "would have", "wouldn't": "would not",
-                           "wouldn't've": "would not have", "y'all": "you all", "y'all'd": "you all would",
-                           "y'all'd've": "you all would have", "y'all're": "you all are", "y'all've": "you all have",
-                           "you'd": "you would", "you'd've": "you would have", "you'll": "you will",
-                           "you'll've": "you will have", "you're": "you are", "you've": "you have"}
-    sentences = sentences.apply(
-        lambda x: clean_contractions(x, contraction_mapping))
-    # 去除特殊字符
-    punct = "/-'?!.,#$%\'()*+-/:;<=>@[\\]^_`{|}~" + \
-        '""“”’' + '∞θ÷α•à−β∅³π‘₹´°£€\×™√²—–&'
-    punct_mapping = {"‘": "'", "₹": "e", "´": "'", "°": "", "€": "e", "™": "tm", "√": " sqrt ", "×": "x", "²": "2",
-                     "—": "-", "–": "-", "’": "'", "_": "-", "`": "'", '“': '"', '”': '"', '“': '"', "£": "e",
-                     '∞': 'infinity', 'θ': 'theta', '÷': '/', 'α': 'alpha', '•': '.', 'à': 'a', '−': '-', 'β': 'beta',
-                     '∅': '', '³': '3', 'π': 'pi', }
-    sentences = sentences.apply(
-        lambda x: clean_special_chars(x, punct, punct_mapping))
-    # 提取数组
-    sentences = sentences.progress_apply(lambda x: x.split()).values
-    vocab_dic = {}
-    for sentence in tqdm(sentences, disable=False):
-        for word in sentence:
-            try:
-                vocab_dic[word] += 1
-            except KeyError:
-                vocab_dic[word] = 1
-    vocab_list = sorted([_ for _ in vocab_dic.items() if _[
-                        1] >= min_freq], key=lambda x: x[1], reverse=True)[:max_size]
-    vocab_dic = {word_count[0]: idx for idx,
-                 word_count in enumerate(vocab_list)}
-    vocab_dic.update({UNK: len(vocab_dic), PAD: len(vocab_dic) + 1})
-    return vocab_dic
+def build_vocab(file_path, max_size, min_freq, num_workers=1, capacity=0, chunk_size=10000):
+    """分块读取 csv, 规范化切词后统计词频, 取词频最高的 max_size 个词; capacity > 0 时近似统计(见 vocabulary.ApproxCounter)"""
+    texts = (text for df in pd.read_csv(file_path, encoding='utf-8', sep=',', usecols=['Text'], chunksize=chunk_size)
+             for text in df['Text'].fillna('').tolist())
+    counts = count_words(texts, normalizer.tokenize, num_workers, chunk_size, capacity)
+    return make_vocab(counts, max_size, min_freq, specials=(UNK, PAD))
 
 
 def build_dataset(config):
-    if os.path.exists(config.vocab_path):
-        vocab = pkl.load(open(config.vocab_path, 'rb'))
+    if os.path.exists(config.vocab_path) or os.path.exists(table_path(config.vocab_path)):
+        vocab = load_vocab(config.vocab_path)
     else:
-        vocab = build_vocab(config.train_path,
-                            max_size=MAX_VOCAB_SIZE, min_freq=1)
-        pkl.dump(vocab, open(config.vocab_path, 'wb'))
+        vocab = build_vocab(config.train_path, max_size=MAX_VOCAB_SIZE, min_freq=1,
+                            num_workers=config.num_workers, capacity=config.vocab_capacity)
+        vocab = save_vocab(vocab, config.vocab_path)
     print(f"词典大小======== {len(vocab)}")
+    oov = make_oov(config)
 
     def load_dataset(path, pad_size=32):
-        df = pd.read_csv(path, encoding='utf-8', sep=',')
-
-        # train_df = pd.read_csv("./datasets/train.csv", encoding='utf-8', sep=',')
-        # test_df = pd.read_csv("./datasets/val.csv", encoding='utf-8', sep=',')
-        # test = pd.read_csv("../input/test.csv")  # Test shape = (56370, 2)
-        # df = pd.concat([train_df, test_df])  # shape=(206916, 2)
-        df['Text'] = df['Text'].fillna('')
-        # TODO 这里读数据集写死了 title
-        # 转化为小写
-        sentences = df['Text'].apply(lambda x: x.lower())
-        # 去除缩写
-        contraction_mapping = {"here's": "here is", "it's": "it is", "ain't": "is not", "aren't": "are not",
-                               "can't": "cannot", "'cause": "because", "could've": "could have",
-                               "couldn't": "could not",
-                               "didn't": "did not", "doesn't": "does not", "don't": "do not", "hadn't": "had not",
-                               "hasn't": "has not", "haven't": "have not", "he'd": "he would", "he'll": "he will",
-                               "he's": "he is", "how'd": "how did", "how'd'y": "how do you", "how'll": "how will",
-                               "how's": "how is", "I'd": "I would", "I'd've": "I would have", "I'll": "I will",
-                               "I'll've": "I will have", "I'm": "I am", "I've": "I have", "i'd": "i would",
-                               "i'd've": "i would have", "i'll": "i will", "i'll've": "i will have", "i'm": "i am",
-                               "i've": "i have", "isn't": "is not", "it'd": "it would", "it'd've": "it would have",
-                               "it'll": "it will", "it'll've": "it will have", "it's": "it is", "let's": "let us",
-                               "ma'am": "madam", "mayn't": "may not", "might've": "might have", "mightn't": "might not",
-                               "mightn't've": "might not have", "must've": "must have", "mustn't": "must not",
-                               "mustn't've": "must not have", "needn't": "need not", "needn't've": "need not have",
-                               "o'clock": "of the clock", "oughtn't": "ought not", "oughtn't've": "ought not have",
-                               "shan't": "shall not", "sha'n't": "shall not", "shan't've": "shall not have",
-                               "she'd": "she would", "she'd've": "she would have", "she'll": "she will",
-                               "she'll've": "she will have", "she's": "she is", "should've": "should have",
-                               "shouldn't": "should not", "shouldn't've": "should not have", "so've": "so have",
-                               "so's": "so as", "this's": "this is", "that'd": "that would",
-                               "that'd've": "that would have",
-                               "that's": "that is", "there'd": "there would", "there'd've": "there would have",
-                               "there's": "there is", "here's": "here is", "they'd": "they would",
-                               "they'd've": "they would have", "they'll": "they will", "they'll've": "they will have",
-                               "they're": "they are", "they've": "they have", "to've": "to have", "wasn't": "was not",
-                               "we'd": "we would", "we'd've": "we would have", "we'll": "we will",
-                               "we'll've": "we will have", "we're": "we are", "we've": "we have", "weren't": "were not",
-                               "what'll": "what will", "what'll've": "what will have", "what're": "what are",
-                               "what's": "what is", "what've": "what have", "when's": "when is", "when've": "when have",
-                               "where'd": "where did", "where's": "where is", "where've": "where have",
-                               "who'll": "who will", "who'll've": "who will have", "who's": "who is",
-                               "who've": "who have",
-                               "why's": "why is", "why've": "why have", "will've": "will have", "won't": "will not",
-                               "won't've": "will not have", "would've": "would have", "wouldn't": "would not",
-                               "wouldn't've": "would not have", "y'all": "you all", "y'all'd": "you all would",
-                               "y'all'd've": "you all would have", "y'all're": "you all are",
-                               "y'all've": "you all have",
-                               "you'd": "you would", "you'd've": "you would have", "you'll": "you will",
-                               "you'll've": "you will have", "you're": "you are", "you've": "you have"}
-        sentences = sentences.apply(
-            lambda x: clean_contractions(x, contraction_mapping))
-        # 去除特殊字符
-        punct = "/-'?!.,#$%\'()*+-/:;<=>@[\\]^_`{|}~" + \
-            '""“”’' + '∞θ÷α•à−β∅³π‘₹´°£€\×™√²—–&'
-        punct_mapping = {"‘": "'", "₹": "e", "´": "'", "°": "", "€": "e", "™": "tm", "√": " sqrt ", "×": "x", "²": "2",
-                         "—": "-", "–": "-", "’": "'", "_": "-", "`": "'", '“': '"', '”': '"', '“': '"', "£": "e",
-                         '∞': 'infinity', 'θ': 'theta', '÷': '/', 'α': 'alpha', '•': '.', 'à': 'a', '−': '-',
-                         'β': 'beta',
-                         '∅': '', '³': '3', 'π': 'pi', }
-        sentences = sentences.apply(
-            lambda x: clean_special_chars(x, punct, punct_mapping))
-        # 提取数组
-        sentences = sentences.progress_apply(lambda x: x.split()).values
-        labels = df['Starts']
-        labels_id = list(set(df['Starts']))
-        labels_id.sort()
-        contents = []
-        count = 0
-        for i, token in tqdm(enumerate(sentences)):
-            label = labels[i]
-            words_line = []
-            seq_len = len(token)
-            count += seq_len
-            if pad_size:
-                if len(token) < pad_size:
-                    token.extend([PAD] * (pad_size - len(token)))
-                else:
-                    token = token[:pad_size]
-                    seq_len = pad_size
-            # word to id
-            for word in token:
-                words_line.append(vocab.get(word, vocab.get(UNK)))
-            contents.append((words_line, labels_id.index(label), seq_len))
+        contents, count, label_values = load_or_encode_csv(
+            path, vocab, pad_size, vocab.get(UNK), vocab.get(PAD), config.num_workers, config.cache_path,
+            stream=config.stream, shard_size=config.shard_size, oov=oov)
         print(f"数据集地址========{path}")
         print(f"数据集总词数========{count}")
-        print(f"数据集文本数========{len(sentences)}")
-        print(f"数据集文本平均词数========{count/len(sentences)}")
-        print(f"训练集标签========{set(df['Starts'])}")
-        return contents  # [([...], 0), ([...], 1), ...]
+        print(f"数据集文本数========{len(contents)}")
+        print(f"数据集文本平均词数========{count/len(contents)}")
+        print(f"训练集标签========{set(label_values.tolist())}")
+        return contents
     train = load_dataset(config.train_path, config.pad_size)
     dev = load_dataset(config.dev_path, config.pad_size)
     test = load_dataset(config.test_path, config.pad_size)
@@ -193,57 +53,249 @@ def build_dataset(config):
 
 
 class DatasetIterater(object):
-    def __init__(self, batches, batch_size, device):
+    def __init__(self, batches, batch_size, device, bucket=False, shuffle=False, seed=1, bucket_size=100,
+                 rank=0, world_size=1, even=False, min_len=1):
         self.batch_size = batch_size
         self.batches = batches
         self.n_batches = len(batches) // batch_size
         self.residue = False
-        if len(batches) % self.n_batches != 0:
+        if len(batches) % batch_size != 0:
             self.residue = True
         self.index = 0
         self.device = device
+        self.bucket = bucket  # 按长度分桶, 每个 batch 只 pad 到本 batch 最长的句子
+        self.shuffle = shuffle  # 每轮打乱, 各轮的顺序由 seed 和轮数决定
+        self.seed = seed
+        self.bucket_size = bucket_size  # 每个桶包含的 batch 数
+        self.min_len = min_len  # 分桶裁剪后 batch 的最小长度(模型能处理的最短输入)
+        self.epoch = 0
+        self.order = None  # 本轮每个 batch 的样本下标, None 表示按文件顺序切片
+        # 多进程训练时各 rank 按相同的 seed 得到相同的 batch 顺序, 只取其中第 rank, rank + world_size, ... 个
+        self.rank = rank
+        self.world_size = world_size
+        self.even = even  # 各 rank 的 batch 数相同, 多出的 batch 丢弃(DDP 训练每一步都要同步梯度)
+
+    def _sample(self):
+        """打乱样本, 每 bucket_size 个 batch 的样本按长度排序后切成 batch, 再打乱 batch 的顺序"""
+        n = len(self.batches)
+        rng = np.random.RandomState(self.seed + self.epoch)
+        indices = self.batches.permutation(rng) if self.shuffle else np.arange(n)
+        if self.bucket:
+            seq_len = np.asarray(self.batches.seq_len)
+            pool = self.batch_size * self.bucket_size if self.shuffle else n
+            for start in range(0, n, pool):
+                chunk = indices[start: start + pool]
+                indices[start: start + pool] = chunk[np.argsort(seq_len[chunk], kind='stable')]
+        order = [indices[i: i + self.batch_size] for i in range(0, n, self.batch_size)]
+        if self.shuffle:
+            # 分片数据集只在每个桶内打乱 batch 顺序, 以保持按分片顺序读盘
+            window = self.bucket_size if isinstance(self.batches, ShardedDataset) else max(len(order), 1)
+            for start in range(0, len(order), window):
+                part = order[start: start + window]
+                rng.shuffle(part)
+                order[start: start + window] = part
+        return order
+
+    def _batch(self, index):
+        index = index * self.world_size + self.rank
+        if self.order is None:
+            return self.batches[index * self.batch_size: (index + 1) * self.batch_size]
+        return self.batches[self.order[index]]
 
     def _to_tensor(self, datas):
-        x = torch.LongTensor([_[0] for _ in datas]).to(self.device)
-        y = torch.LongTensor([_[1] for _ in datas]).to(self.device)
+        tokens = datas.tokens
+        if self.bucket:
+            tokens = tokens[:, :max(int(datas.seq_len.max()), self.min_len, 1)]
+        # torch.from_numpy 直接共享切片的内存; 词 id 以 int32 存储, 拷到设备后再转成 Embedding 需要的 long
+        x = torch.from_numpy(tokens).to(self.device).long()
+        y = torch.from_numpy(datas.labels).to(self.device)
 
         # pad前的长度(超过pad_size的设为pad_size)
-        seq_len = torch.LongTensor([_[2] for _ in datas]).to(self.device)
+        seq_len = torch.from_numpy(datas.seq_len).to(self.device)
         return (x, seq_len), y
 
     def __next__(self):
-        if self.residue and self.index == self.n_batches:
-            batches = self.batches[self.index *
-                                   self.batch_size: len(self.batches)]
-            self.index += 1
-            batches = self._to_tensor(batches)
-            return batches
-
-        elif self.index >= self.n_batches:
+        if self.index >= len(self):
             self.index = 0
+            self.epoch += 1
             raise StopIteration
-        else:
-            batches = self.batches[self.index *
-                                   self.batch_size: (self.index + 1) * self.batch_size]
-            self.index += 1
-            batches = self._to_tensor(batches)
-            return batches
+        if self.index == 0 and (self.bucket or self.shuffle):
+            self.order = self._sample()
+        batches = self._to_tensor(self._batch(self.index))
+        self.index += 1
+        return batches
 
     def __iter__(self):
         return self
 
+    def seek(self, epoch, index):
+        """从第 epoch 轮(从0开始)的第 index 个 batch 继续, 用于恢复训练; 各轮的样本顺序只由 seed 和轮数决定"""
+        self.epoch, self.index = epoch, index
+        if self.index > 0 and (self.bucket or self.shuffle):
+            self.order = self._sample()
+
     def __len__(self):
         if self.residue:
-            return self.n_batches + 1
+            total = self.n_batches + 1
         else:
-            return self.n_batches
+            total = self.n_batches
+        if self.even:
+            return total // self.world_size
+        return (total - self.rank + self.world_size - 1) // self.world_size
+
+
+class PrefetchIterater(object):
+    """在后台线程中提前准备 DatasetIterater 的后 depth 个 batch
+
+    batch 在 cpu 上构建, 可选放入锁页内存, 再异步拷到 device; len() 与按轮迭代的用法和 DatasetIterater 一致.
+    stall_time 为训练线程等待 batch 的累计秒数, queue_depth 为取 batch 时已准备好的 batch 数的平均值.
+    """
+
+    def __init__(self, iterater, device, depth=2, num_workers=1, pin_memory=False):
+        self.iterater = iterater
+        self.device = torch.device(device)
+        self.depth = depth
+        self.num_workers = num_workers
+        self.pin_memory = pin_memory and torch.cuda.is_available()
+        self.reset_metrics()
+
+    def reset_metrics(self):
+        self.stall_time = 0.
+        self.n_fetched = 0
+        self.depth_total = 0
+
+    def metrics(self):
+        return {'stall_time': self.stall_time,
+                'queue_depth': self.depth_total / self.n_fetched if self.n_fetched else 0.}
+
+    def _load(self, index):
+        (x, seq_len), y = self.iterater._to_tensor(self.iterater._batch(index))
+        if self.pin_memory:
+            x, seq_len, y = x.pin_memory(), seq_len.pin_memory(), y.pin_memory()
+        non_blocking = self.pin_memory
+        return (x.to(self.device, non_blocking=non_blocking), seq_len.to(self.device, non_blocking=non_blocking)), \
+            y.to(self.device, non_blocking=non_blocking)
+
+    def _fetch(self, pending):
+        self.depth_total += sum(1 for f in pending if f.done())
+        self.n_fetched += 1
+        future = pending.popleft()
+        start = time.time()
+        batch = future.result()
+        self.stall_time += time.time() - start
+        return batch
+
+    def __iter__(self):
+        it = self.iterater
+        if it.bucket or it.shuffle:
+            it.order = it._sample()
+        try:
+            with ThreadPoolExecutor(self.num_workers) as pool:
+                pending = deque()
+                # 从 seek() 设置的位置开始
+                for index in range(it.index, len(it)):
+                    pending.append(pool.submit(self._load, index))
+                    if len(pending) > self.depth:
+                        yield self._fetch(pending)
+                while pending:
+                    yield self._fetch(pending)
+        finally:
+            it.index = 0
+            it.epoch += 1
+
+    def seek(self, epoch, index):
+        self.iterater.seek(epoch, index)
+
+    def __len__(self):
+        return len(self.iterater)
 
 
-def build_iterator(dataset, config):
-    iter = DatasetIterater(dataset, config.batch_size, config.device)
+def build_iterator(dataset, config, shuffle=False, even=False):
+    """多进程训练时按 config.rank / config.world_size 切分 batch; 训练集传 even=True 使各 rank 的 batch 数相同"""
+    shard = dict(rank=config.rank, world_size=config.world_size, even=even, min_len=config.min_len)
+    if config.prefetch > 0:
+        # 预取时在 cpu 上构建 batch, 由 PrefetchIterater 负责拷到 device
+        iter = DatasetIterater(dataset, config.batch_size, 'cpu',
+                               bucket=config.bucket_sampler, shuffle=shuffle, seed=config.seed, **shard)
+        return PrefetchIterater(iter, config.device, depth=config.prefetch,
+                                num_workers=config.prefetch_workers, pin_memory=config.pin_memory)
+    iter = DatasetIterater(dataset, config.batch_size, config.device,
+                           bucket=config.bucket_sampler, shuffle=shuffle, seed=config.seed, **shard)
     return iter
 
 
+def stratified_subsample(dataset, size, seed=1):
+    """按类别比例固定抽取约 size 条(每个类别至少1条), 同一 seed 每次抽到相同的样本, 用于高频的验证集评估"""
+    if size <= 0 or size >= len(dataset):
+        return dataset
+    labels = np.asarray(dataset.labels)
+    rng = np.random.RandomState(seed)
+    classes, counts = np.unique(labels, return_counts=True)
+    take = np.minimum(np.maximum(np.round(counts * size / len(labels)).astype(int), 1), counts)
+    index = np.concatenate([rng.choice(np.flatnonzero(labels == c), k, replace=False)
+                            for c, k in zip(classes, take)])
+    return dataset[np.sort(index)]
+
+
+def make_oov(config):
+    """词表外的词的编码器, oov_mode 为 unk 时为 None(映射为 <UNK>)"""
+    if config.oov_mode == 'unk':
+        return None
+    return OOVHasher(config.oov_mode, config.oov_buckets, config.max_ngrams, config.ngram_range)
+
+
+class OOVEmbedding(nn.Module):
+    """词表外的词的桶嵌入(见 vocabulary.OOVHasher)
+
+    与词表的 embedding 分开存放, 冻结预训练词向量时桶仍参与训练. id < n_vocab 的查词表的 embedding, 其余减去 n_vocab
+    后查桶; subword 模式的输入多一维 n-gram, 由 EmbeddingBag 对非空位取平均(hash 模式相当于只有一个 n-gram).
+    """
+
+    def __init__(self, n_vocab, buckets, embed, mode='hash', max_ngrams=8, ngram_range=(3, 5)):
+        super(OOVEmbedding, self).__init__()
+        self.n_vocab = n_vocab
+        self.bag = nn.EmbeddingBag(buckets + 1, embed, mode='mean', padding_idx=buckets)
+        # 编码方式随 state_dict 保存在 checkpoint 中, 预测和导出时据此构建 OOVHasher
+        self.encoding = {'mode': mode, 'max_ngrams': max_ngrams, 'ngram_range': tuple(ngram_range)}
+        self._register_load_state_dict_pre_hook(self._default_encoding)
+
+    def get_extra_state(self):
+        return dict(self.encoding)
+
+    def set_extra_state(self, state):
+        self.encoding = dict(state)
+
+    def _default_encoding(self, state_dict, prefix, *args):
+        """较早的 checkpoint 没有保存编码方式, 沿用构建时的设置"""
+        state_dict.setdefault(prefix + '_extra_state', self.get_extra_state())
+
+    def forward(self, x, weight, padding_idx: Optional[int] = None):
+        """weight, padding_idx 为词表 embedding 的参数(传参数而不是模块本身, 以便 torch.jit.script)"""
+        if x.dim() == 2:
+            x = x.unsqueeze(-1)
+        word = x[..., 0]
+        is_word = word < self.n_vocab
+        out = F.embedding(torch.where(is_word, word, torch.zeros_like(word)), weight, padding_idx)
+        buckets = torch.where(x >= self.n_vocab, x - self.n_vocab, torch.full_like(x, self.bag.padding_idx))
+        oov = self.bag(buckets.reshape(-1, x.size(-1))).view(out.shape)
+        return torch.where(is_word.unsqueeze(-1), out, oov)
+
+
+def load_embedding(path):
+    """读取预训练词向量
+
+    .npy 以写时复制的 mmap 方式打开并零拷贝转成 tensor, 同一台机器上的多个进程共享同一份页缓存,
+    也不随词表大小做解压和复制; .npz 为旧格式, 需要整体解压读入. .npy 不存在时读取同名的 .npz,
+    只有旧格式词向量的数据集目录仍可使用默认的 --embedding.
+    """
+    if path.endswith('.npy'):
+        if not os.path.exists(path) and os.path.exists(path[:-4] + '.npz'):
+            path = path[:-4] + '.npz'
+        else:
+            return torch.from_numpy(np.load(path, mmap_mode='c'))
+    return torch.from_numpy(np.load(path)["embeddings"].astype('float32'))
+
+
 def get_time_dif(start_time):
     """获取已使用时间"""
     end_time = time.time()
@@ -260,7 +312,21 @@ if __name__ == "__main__":
             self.test_path = './datasets/test.csv'
             self.pad_size = 160
             self.batch_size = 128
+            self.num_workers = 4
+            self.vocab_capacity = 0
+            self.oov_mode = 'unk'
+            self.cache_path = './datasets/cache'
+            self.stream = False
+            self.shard_size = 100000
+            self.bucket_sampler = False
+            self.min_len = 1
+            self.seed = 1
+            self.prefetch = 0
+            self.prefetch_workers = 2
+            self.pin_memory = False
             self.device = 'cpu'
+            self.rank = 0
+            self.world_size = 1
 
     vocab, train_data, dev_data, test_data = build_dataset(Config())
     train_iter = build_iterator(train_data, Config())
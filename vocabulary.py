@@ -0,0 +1,316 @@
+# coding: UTF-8
+import os
+import zlib
+import heapq
+import pickle as pkl
+from collections import Counter
+from itertools import chain, islice
+from multiprocessing import Pool
+import numpy as np
+
+_state = {}  # 子进程内的切词函数，由 _init_worker 设置
+
+
+def _init_worker(tokenize):
+    _state['tokenize'] = tokenize
+
+
+def _count_chunk(texts):
+    """统计一块文本的词频; 整块的词串成一个迭代器交给 Counter, 计数循环在 C 里完成"""
+    tokenize = _state['tokenize']
+    return Counter(chain.from_iterable(map(tokenize, texts) if tokenize is not None else texts))
+
+
+def iter_chunks(iterable, chunk_size):
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class ApproxCounter(object):
+    """内存有界的近似词频统计(Misra-Gries / space-saving 的可合并摘要)
+
+    最多保留约 2 * capacity 个词: 超过后只留下词频最高的 capacity 个, 并把所有词的计数减去第 capacity+1 高的计数.
+    估计值不大于真实词频, 且偏小不超过 error (<= 总词数 / (capacity + 1)), 因此真实词频高于 error 的词一定会保留.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        self.error = 0
+
+    def update(self, counts):
+        """合并一块的精确计数(Counter)"""
+        merged = self.counts
+        for word, count in counts.items():
+            merged[word] = merged.get(word, 0) + count
+        if len(merged) > 2 * self.capacity:
+            self._compact()
+
+    def _compact(self):
+        top = heapq.nlargest(self.capacity + 1, self.counts.items(), key=lambda x: x[1])
+        floor = top[-1][1]
+        self.error += floor
+        # 保持插入顺序, 使同频词的先后与精确模式一致
+        self.counts = {w: c - floor for w, c in self.counts.items() if c > floor}
+
+    def items(self):
+        return self.counts.items()
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __getitem__(self, word):
+        return self.counts[word]
+
+
+def count_words(texts, tokenize=None, num_workers=1, chunk_size=10000, capacity=0):
+    """流式统计词频
+
+    texts 可以是任意可迭代对象(如分块读取的 csv), 按 chunk_size 条切块, num_workers > 1 时各块在进程池中并行统计,
+    每次最多同时处理 num_workers 块, 按原顺序合并, 结果与进程数无关. tokenize 为 None 时 texts 的元素已是词列表;
+    并行时 tokenize 需要可以 pickle(如 str.split, TextNormalizer.tokenize).
+    capacity > 0 时用 ApproxCounter 近似统计, 内存与 capacity 和 chunk_size 成正比, 否则返回精确的 Counter.
+    """
+    total = ApproxCounter(capacity) if capacity else Counter()
+    chunks = iter_chunks(texts, chunk_size)
+    if num_workers > 1:
+        with Pool(num_workers, initializer=_init_worker, initargs=(tokenize,)) as pool:
+            while True:
+                wave = list(islice(chunks, num_workers))
+                if not wave:
+                    break
+                for counts in pool.map(_count_chunk, wave):
+                    total.update(counts)
+    else:
+        _init_worker(tokenize)
+        for chunk in chunks:
+            total.update(_count_chunk(chunk))
+    return total
+
+
+def top_k(counts, k, min_freq=1):
+    """按词频从高到低取前 k 个 (word, count), 同频的词按首次出现的顺序; 用堆选取, 不对整个词表排序"""
+    items = (item for item in counts.items() if item[1] >= min_freq)
+    if k is None:
+        return sorted(items, key=lambda x: x[1], reverse=True)
+    return heapq.nlargest(k, items, key=lambda x: x[1])
+
+
+def make_vocab(counts, max_size, min_freq=1, specials=()):
+    """词 -> id, 按词频从高到低编号, specials(如 UNK, PAD)依次排在最后"""
+    vocab = {word: idx for idx, (word, _) in enumerate(top_k(counts, max_size, min_freq))}
+    for word in specials:
+        vocab[word] = len(vocab)
+    return vocab
+
+
+def table_path(path):
+    """vocab.pkl 对应的紧凑词表路径 vocab.words.npy"""
+    return os.path.splitext(path)[0] + '.words.npy'
+
+
+def offsets_path(table):
+    """紧凑词表的偏移数组路径 vocab.words.offsets.npy"""
+    return os.path.splitext(table)[0] + '.offsets.npy'
+
+
+class Vocab(object):
+    """紧凑词表: 所有词按 id 顺序拼成一段 utf-8 字节(.words.npy, uint8), 另存每个词的起止偏移(.offsets.npy, int64),
+    两者以 mmap 方式打开, 不需要 unpickle; 文件大小只取决于词的总长度, 个别很长的词不会让每一行都变长.
+
+    接口与 词 -> id 的 dict 相同(get, [], in, items, len), 另有 encode 一次把一批词转成 id 数组, decode 反之.
+    查询并不是在 mmap 上直接探测: 每个进程第一次查询时读出所有词并建立一个 Python dict 索引(1万词约 2ms),
+    之后逐词查 dict(CPython 的 dict 查询比 numpy 在有序字符串表上 searchsorted 快约4倍). 只取大小时不建立索引.
+    pickle 时(如传给进程池)只传文件路径, 子进程重新 mmap 同一个文件.
+    """
+
+    def __init__(self, data, offsets, path=None):
+        self.data = data  # 所有词的 utf-8 编码首尾相接
+        self.offsets = offsets  # 第 i 个词为 data[offsets[i]: offsets[i + 1]]
+        self.path = path
+        self._words = None
+        self._index = None
+
+    @classmethod
+    def from_words(cls, words):
+        """由按 id 排列的词构建"""
+        encoded = [word.encode('utf-8') for word in words]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)))
+        return cls(np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets)
+
+    @classmethod
+    def from_dict(cls, mapping):
+        """由 词 -> id 的 dict 构建, id 须为 0..len-1"""
+        ids = np.fromiter(mapping.values(), dtype=np.int64, count=len(mapping))
+        if len(ids) and not np.array_equal(np.sort(ids), np.arange(len(ids))):
+            raise ValueError('vocabulary ids must be 0..len(vocab)-1')
+        words = [None] * len(mapping)
+        for word, idx in mapping.items():
+            words[idx] = word
+        return cls.from_words(words)
+
+    @classmethod
+    def load(cls, path):
+        table = np.load(path, mmap_mode='r')
+        if table.dtype.kind == 'U':
+            # 旧格式: 按 id 排列的定长 unicode 表
+            return cls.from_words(table.tolist())
+        return cls(table, np.load(offsets_path(path), mmap_mode='r'), path)
+
+    def save(self, path):
+        """先写临时文件再重命名, 其它进程不会读到写了一半的文件; 偏移先于字节就位"""
+        for target, array in ((offsets_path(path), self.offsets), (path, self.data)):
+            tmp = f'{target}.tmp{os.getpid()}.npy'
+            np.save(tmp, np.asarray(array))
+            os.replace(tmp, target)
+        self.path = path
+
+    @property
+    def words(self):
+        """id -> 词 的列表, 第一次使用时从字节表解码"""
+        if self._words is None:
+            data, offsets = self.data.tobytes(), self.offsets.tolist()
+            self._words = [data[start: end].decode('utf-8') for start, end in zip(offsets, offsets[1:])]
+        return self._words
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = dict(zip(self.words, range(len(self))))
+        return self._index
+
+    def encode(self, words, unk_id, oov=None):
+        """一批词 -> int32 id 数组, 不在词表中的为 unk_id; 传入 oov(OOVHasher) 时词表外的词按其模式编码"""
+        get = self.index.get
+        if oov is not None:
+            return oov.encode(words, get, len(self))
+        return np.asarray([get(word, unk_id) for word in words], dtype=np.int32)
+
+    def decode(self, ids):
+        words = self.words
+        return [words[i] for i in np.asarray(ids).tolist()]
+
+    def get(self, word, default=None):
+        return self.index.get(word, default)
+
+    def __getitem__(self, word):
+        return self.index[word]
+
+    def __contains__(self, word):
+        return word in self.index
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        return iter(self.words)
+
+    def keys(self):
+        return list(self.words)
+
+    def items(self):
+        return zip(self.words, range(len(self)))
+
+    def __reduce__(self):
+        if self.path is not None:
+            return Vocab.load, (self.path,)
+        return Vocab, (np.asarray(self.data), np.asarray(self.offsets))
+
+
+class OOVHasher(object):
+    """词表外的词不再映射为 <UNK>, 而是哈希到固定数量的桶, 嵌入表只增加 buckets 行
+
+    mode='hash': 每个词按 crc32 落到一个桶, 编码为 [n] 的 id;
+    mode='subword': fastText 式的字符 n-gram, 词加上边界符 '<' '>' 后取 ngram_range 内的所有子串, 长的优先,
+        最多 max_ngrams 个, 各自落到一个桶. 编码为 [n, max_ngrams] 的 id: 词表内的词只有第0列是词 id,
+        词表外的词为各 n-gram 的 id, 空位都填 PAD(词表的最后一个 id), 由 EmbeddingBag 对 n-gram 取平均.
+    桶的 id 为 len(vocab) + 桶号. 每个词的桶只计算一次并缓存.
+    """
+
+    def __init__(self, mode='hash', buckets=10000, max_ngrams=8, ngram_range=(3, 5)):
+        if mode not in ('hash', 'subword'):
+            raise ValueError(f'unknown oov mode {mode!r}')
+        self.mode = mode
+        self.buckets = buckets
+        self.max_ngrams = max_ngrams if mode == 'subword' else 1
+        self.ngram_range = tuple(ngram_range)
+        self.token_shape = (self.max_ngrams,) if mode == 'subword' else ()  # 每个词编码后的形状
+        self.cache = {}
+
+    def fingerprint(self):
+        """编码规则的指纹, 用于数据缓存的键"""
+        return f'{self.mode}|{self.buckets}|{self.max_ngrams}|{self.ngram_range}'
+
+    def bucket(self, text):
+        return zlib.crc32(text.encode('utf-8')) % self.buckets
+
+    def ngrams(self, word):
+        word = f'<{word}>'
+        minn, maxn = self.ngram_range
+        grams = [word[i: i + n] for n in range(min(maxn, len(word)), minn - 1, -1) for i in range(len(word) - n + 1)]
+        return grams[:self.max_ngrams]
+
+    def _oov_ids(self, word, offset):
+        ids = self.cache.get(word)
+        if ids is None:
+            if len(self.cache) > 1000000:
+                self.cache.clear()
+            if self.mode == 'hash':
+                ids = offset + self.bucket(word)
+            else:
+                ids = [offset + self.bucket(gram) for gram in self.ngrams(word)]
+            self.cache[word] = ids
+        return ids
+
+    def encode(self, words, get, offset):
+        """get 为词表的查询函数, offset 为词表大小"""
+        rows = []
+        for word in words:
+            i = get(word)
+            if i is None:
+                rows.append(self._oov_ids(word, offset))
+            else:
+                rows.append(i if self.mode == 'hash' else (i,))
+        if self.mode == 'hash':
+            return np.asarray(rows, dtype=np.int32)
+        out = np.full((len(rows), self.max_ngrams), offset - 1, dtype=np.int32)
+        lengths = np.fromiter(map(len, rows), dtype=np.int64, count=len(rows))
+        out[np.arange(self.max_ngrams) < lengths[:, None]] = np.fromiter(chain.from_iterable(rows), dtype=np.int32,
+                                                                         count=int(lengths.sum()))
+        return out
+
+
+def load_vocab(path):
+    """读取词表: path 旁的紧凑词表存在且不旧于 path 时直接 mmap 打开; 否则读取旧的 pickle dict,
+    并尽量转换保存成紧凑词表, 下次启动不再 unpickle"""
+    table = table_path(path)
+    if os.path.exists(table) and (not os.path.exists(path) or os.path.getmtime(table) >= os.path.getmtime(path)):
+        vocab = Vocab.load(table)
+        if vocab.path is None:
+            # 旧的定长 unicode 表, 转存成现在的格式
+            try:
+                vocab.save(table)
+            except OSError:
+                pass
+        return vocab
+    with open(path, 'rb') as f:
+        vocab = Vocab.from_dict(pkl.load(f))
+    try:
+        vocab.save(table)
+    except OSError:
+        pass
+    return vocab
+
+
+def save_vocab(vocab, path):
+    """同时写 pickle dict(兼容旧的读取方式) 和紧凑词表, 返回 Vocab"""
+    vocab = vocab if isinstance(vocab, Vocab) else Vocab.from_dict(vocab)
+    with open(path, 'wb') as f:
+        pkl.dump(dict(vocab.items()), f)
+    vocab.save(table_path(path))
+    return vocab